@@ -3,10 +3,13 @@ Created on 23 Jan 2014
 
 @author: MBradley
 '''
-from screenui.raceview import StartLineFrame,AddFleetDialog
-from model.race import RaceManager
-from screenui.audio import AudioManager
-from persistence.recovery import RaceRecoveryManager
+from screenui.raceview import StartLineFrame,AddFleetDialog,TREEVIEW_ROW_HEIGHT
+from model.race import RaceManager, MonotonicClock, GUN, WARNING, LIGHTS, STATUS, COUNTDOWN
+from screenui.audio import AudioManager, NullAudioSink, WavFileAudioSink, GUN_COUNTDOWN, WARNING_COUNTDOWN
+from persistence.recovery import RaceRecoveryManager, RecoveryException
+from screenui.scheduler import GunScheduler
+from screenui.rendercache import RenderCache
+from screenui.finishlist import VirtualFinishList
 
 import threading 
 import logging
@@ -18,23 +21,70 @@ import Tkinter
 import Queue
 import ConfigParser
 import os
-import pickle
+import math
 
 RACES_LIST = ['Large handicap','Small handicap','Toppers','Large and small handicap','Teras','Oppies']
 
 
 #
-# LightsController uses the EasyDaqUSBRelay to control the hardware lights. It refreshes the lights every
-# 500 milliseconds until all fleets have started. 
+# We wake up this long after a lights change is due, to be sure that we are past it
 #
-class LightsController():
+LIGHTS_TIMER_MARGIN_MILLIS = 1
+
+
+#
+# A lights board is an EasyDaqUSBRelay driving the lights of one start line. A board with
+# fleet names only counts down to the starts of those fleets; a board without shows the
+# lights for every fleet.
+#
+class LightsBoard():
     
-    def __init__(self, tkRoot,easyDaqRelay,raceManager):
-        self.tkRoot = tkRoot
+    def __init__(self, name, easyDaqRelay, fleetNames=None):
+        self.name = name
         self.easyDaqRelay = easyDaqRelay
-        self.raceManager = raceManager
+        self.fleetNames = fleetNames
         # we start assuming that our lights are off
         self.currentLights = [LIGHT_OFF, LIGHT_OFF, LIGHT_OFF, LIGHT_OFF, LIGHT_OFF]
+        self.timeline = None
+        # the last session state description from our relay
+        self.sessionStateDescription = "Connecting"
+        
+    def showsAllFleets(self):
+        return self.fleetNames is None
+    
+    def fleetsIn(self, raceManager):
+        return [fleet for fleet in raceManager.fleets if fleet.name in self.fleetNames]
+    
+    def sendLights(self, lights):
+        if lights != self.currentLights:
+            self.easyDaqRelay.sendRelayCommand(lights)
+            self.currentLights = lights
+    
+    #
+    # Describe our connection state and how long our last change of lights took to reach the board
+    #
+    def description(self):
+        description = "%s: %s" % (self.name, self.sessionStateDescription)
+        if self.easyDaqRelay.commandToWireCount:
+            description = description + " (%d ms)" % (self.easyDaqRelay.lastCommandToWire * 1000)
+        return description
+
+
+#
+# LightsController uses the lights boards to control the hardware lights. Rather than polling, it reads
+# the lights from the start sequence timeline and sets a single timer for the next lights
+# change on any board, until all fleets have started. The timer is replanned when the sequence starts,
+# is recalled or is abandoned.
+#
+# A board for every fleet reads the lights from the race manager's timeline. A board for some
+# of the fleets has a lights timeline of its own, compiled at the same time.
+#
+class LightsController():
+    
+    def __init__(self, tkRoot,lightsBoards,raceManager):
+        self.tkRoot = tkRoot
+        self.lightsBoards = lightsBoards
+        self.raceManager = raceManager
         self.wireController()
         
         self.updateTimer = None
@@ -51,81 +101,60 @@ class LightsController():
         
     
     def handleGeneralRecall(self,fleet):
-        self.cancelUpdateTimer()
-        self.updateLights()
+        self.replanLights()
     
     def handleSequenceStarted(self):
-        self.cancelUpdateTimer()
-        self.updateLights()
+        self.replanLights()
         
     def handleStartSequenceAbandoned(self):
+        self.replanLights()
+        
+    def replanLights(self):
         self.cancelUpdateTimer()
-        self.updateLights()
+        with self.raceManager.clock.tick():
+            self.compileBoardTimelines()
+            self._updateLights()
+            
+    def compileBoardTimelines(self):
+        for lightsBoard in self.lightsBoards:
+            if lightsBoard.showsAllFleets():
+                lightsBoard.timeline = self.raceManager.timeline
+            else:
+                lightsBoard.timeline = self.raceManager.compileLightsTimeline(lightsBoard.fleetsIn(self.raceManager))
         
     def cancelUpdateTimer(self):
         # if we have an update timer, cancel it. Note that if the update timer
         # has has already executed, the cancel has no effect and does not fail.
         if self.updateTimer:
             self.tkRoot.after_cancel(self.updateTimer)
+            self.updateTimer = None
         
     
-    def calculateLightsDisplay(self):
-        #
-        # out default is no lights
-        lights = [LIGHT_OFF, LIGHT_OFF, LIGHT_OFF, LIGHT_OFF, LIGHT_OFF]
-        
-        # ask for the next fleet to start
-        nextFleetToStart = self.raceManager.nextFleetToStart()
-        
-        # if we have a fleet to start
-        if nextFleetToStart:
-            secondsToStart = -1 * nextFleetToStart.adjustedDeltaSecondsToStartTime()
-            
-            if secondsToStart <=300 and secondsToStart > 240:
-                lights = [LIGHT_ON, LIGHT_ON, LIGHT_ON, LIGHT_ON, LIGHT_ON]
-            elif secondsToStart <= 240 and secondsToStart > 180:
-                lights = [LIGHT_ON, LIGHT_ON, LIGHT_ON, LIGHT_ON, LIGHT_OFF]
-            elif secondsToStart <= 180 and secondsToStart > 120: 
-                lights = [LIGHT_ON, LIGHT_ON, LIGHT_ON, LIGHT_OFF, LIGHT_OFF]
-            elif secondsToStart <= 120and secondsToStart > 60: 
-                lights = [LIGHT_ON, LIGHT_ON, LIGHT_OFF, LIGHT_OFF, LIGHT_OFF]
-            elif secondsToStart <= 60 and secondsToStart > 30: 
-                lights = [LIGHT_ON, LIGHT_OFF, LIGHT_OFF, LIGHT_OFF, LIGHT_OFF]
-            elif secondsToStart <= 30 and (int(secondsToStart) % 2 == 0):
-                lights = [LIGHT_ON, LIGHT_OFF, LIGHT_OFF, LIGHT_OFF, LIGHT_OFF]
-            else:
-                lights = [LIGHT_OFF, LIGHT_OFF, LIGHT_OFF, LIGHT_OFF, LIGHT_OFF]
-            
-        return lights
-    
-    
-                 
-    
     def updateLights(self):
+        # work out the lights and whether we need to update them again from one reading of the clock
+        with self.raceManager.clock.tick():
+            self._updateLights()
+            
+    def _updateLights(self):
+        now = self.raceManager.clock.now()
+        nextChanges = []
+        
+        for lightsBoard in self.lightsBoards:
+            lightsBoard.sendLights(lightsBoard.timeline.lightsAt(now))
+            
+            # if the board's lights change again, we wake up then. Otherwise it has no fleet
+            # left to start, so set its lights to 0
+            nextChange = lightsBoard.timeline.nextActionAfter(now, LIGHTS)
+            if nextChange:
+                nextChanges.append(nextChange.time)
+            else:
+                lightsBoard.sendLights([LIGHT_OFF, LIGHT_OFF, LIGHT_OFF, LIGHT_OFF, LIGHT_OFF])
         
-        newLights = self.calculateLightsDisplay()
-        
-        if newLights != self.currentLights:
-            self.easyDaqRelay.sendRelayCommand(newLights)
-            self.currentLights = newLights
-        
-        # check that we still have a fleet to start, if so,
-        # calculate the time until our next change
-        
-        if self.raceManager.nextFleetToStart():
-            # make sure we update idle tasks so that the screen updates. This is particularly important in speedy mode
-            self.tkRoot.update_idletasks()
-            
-            self.updateTimer = self.tkRoot.after(500, self.updateLights)
-            
-        # if we don't have a race to start any more, set our lights to 0 and don't update ourselves again
-        else:
-            self.easyDaqRelay.sendRelayCommand([LIGHT_OFF, LIGHT_OFF, LIGHT_OFF, LIGHT_OFF, LIGHT_OFF])
-        
-           
-        
-    def start(self):
-        self.easyDaqRelay.start()     
+        # one timer for the next change on any board. Once no board has a change to come,
+        # we don't update ourselves again
+        if nextChanges:
+            millisToNextChange = int(math.ceil((min(nextChanges) - now).total_seconds() * 1000)) + LIGHTS_TIMER_MARGIN_MILLIS
+            self.updateTimer = self.tkRoot.after(millisToNextChange, self.updateLights)
                 
     
     
@@ -136,13 +165,14 @@ class LightsController():
 #
 # GunController uses the AudioManager to play a Wav file as the race "gun".
 # It does this in response to events from the race manager when races change
-# during the start sequence or when boats finish. It uses the Tk root
-# to provide an event scheduler. 
+# during the start sequence or when boats finish. It uses the GunScheduler,
+# rather than the Tk root, to time the guns, so that a busy Tk event loop
+# doesn't make them late.
 #
 class GunController():
     
-    def __init__(self, tkRoot, audioManager, raceManager):
-        self.tkRoot = tkRoot
+    def __init__(self, gunScheduler, audioManager, raceManager):
+        self.gunScheduler = gunScheduler
         self.audioManager = audioManager
         self.raceManager = raceManager
         self.scheduledGuns = []
@@ -167,90 +197,52 @@ class GunController():
     def soundWarning(self):
         self.audioManager.queueClip("warning")
     
-    #
-    # millis is the time of the gun. The warning beeps are for the ten secoonds prior to the gun
-    #
-    def scheduleWarningBeeps(self,gunMillis,finalWarning=False):
-        for warningMillis in range(gunMillis-10000, gunMillis, 1000):
-            self.addSchedule(self.tkRoot.after(warningMillis, self.soundWarning))
-        # if we give a final warning instead of a gun, schedule this
-        if finalWarning:
-            self.addSchedule(self.tkRoot.after(gunMillis, self.soundWarning))
-    
- 
-    def scheduleGun(self,millis):
-        logging.log(logging.DEBUG,"Scheduling gun for %d " % millis)
-        scheduleId = self.tkRoot.after(millis, self.fireGun)
-        
-        self.addSchedule(scheduleId)
-        
     def addSchedule(self,scheduleId):
         self.scheduledGuns.append(scheduleId)
         
     def cancelSchedules(self):
         for aSchedule in self.scheduledGuns:
-            self.tkRoot.after_cancel(aSchedule)
+            self.gunScheduler.cancel(aSchedule)
         self.scheduledGuns = []
     
-    
-        
-    def scheduleGunForFleetStart(self,aFleet, secondsBefore):
-        # calculate seconds to start of fleet
-        # convert negative seconds to start to positive 
-        secondsToStart = aFleet.deltaSecondsToStartTime()  * -1
-        
-        
-        # check that the fleet is still in the future (for example if we are debugging)
-        if secondsToStart > 0:
-            
-            #
-            # to calculate the seconds to gun, we take the seconds to start 
-            # and subtract the requested seconds before divided by the test speed ratio.
-            #
-            # For example, with a test speed ratio of 5, the seconds to start for the
-            # first race with an F flag start will be 600  / 5 = 120 seconds.
-            #
-            # For the five minute (300 seconds) gun, the calculation is:
-            # 120 - (300/5) = 60 seconds.
-            #
-            # For the four minute gun (240 seconds) gun, the calculation is:
-            # 120 - (240/5) = 72 seconds
-            #
-            secondsToGun = secondsToStart - secondsBefore / RaceManager.testSpeedRatio
-            logging.info("Seconds to start: %d, scheduling gun for %d seconds" % (secondsToStart,secondsToGun))
-            gunMillis = int(1000*secondsToGun )
-            self.scheduleWarningBeeps(gunMillis)
-            
-            self.scheduleGun(gunMillis)
+    #
+    # Schedule the guns and warning beeps in the race manager's start sequence timeline,
+    # replacing any that we have already scheduled. The race manager has already
+    # worked out the whole sequence (including the F flag guns and beeps for a sequence
+    # started with a warning), so all we do is set a timer for each one.
+    #
+    # Where we have a whole countdown still to come, we play it as one pre-rendered track,
+    # rather than as its beeps and gun. A countdown that has already begun (for example,
+    # after a recovery) is played as the beeps and gun that are left.
+    #
+    def scheduleTimeline(self):
+        self.cancelSchedules()
+        now = self.raceManager.clock.now()
+        scheduledCountdowns = []
+        for action in self.raceManager.timeline.actionsFrom(now, kinds=[COUNTDOWN, GUN, WARNING]):
+            millis = int((action.time - now).total_seconds() * 1000)
+            if action.kind == COUNTDOWN:
+                trackName = {GUN: GUN_COUNTDOWN, WARNING: WARNING_COUNTDOWN}[action.value]
+                if self.audioManager.hasClip(trackName):
+                    logging.log(logging.DEBUG,"Scheduling %s for %d " % (trackName, millis))
+                    self.addSchedule(self.gunScheduler.scheduleClip(millis, trackName))
+                    scheduledCountdowns.append(action)
+            elif action.countdown in scheduledCountdowns:
+                # this gun or beep is part of a track we have already scheduled
+                pass
+            elif action.kind == GUN:
+                logging.log(logging.DEBUG,"Scheduling gun for %d " % millis)
+                self.addSchedule(self.gunScheduler.scheduleClip(millis, "gun"))
+            else:
+                self.addSchedule(self.gunScheduler.scheduleClip(millis, "warning"))
             
-         
-        
-    
                             
     #
-    # For a sequence start, we fire the gun then schedule our other guns. We ask the race manager to
-    # adjust our start seconds to reflect if we have speedup the start for testing purposes.
+    # For a sequence start, the race manager has compiled the guns for the whole sequence, 
+    # adjusted for any test speed ratio. We just schedule them.
     #
     def handleSequenceStartedWithWarning(self):
-        # schedule ten second countdown
-        self.scheduleWarningBeeps(10000)
-        # schedule gun for ten seconds
-        self.scheduleGun(10000)
-        
-        #
-        # schedule beeps for F flag down in 4 minutes time
-        #
-        fFlagDownMillis = 10000 + (4 * 60000) / RaceManager.testSpeedRatio
-        self.scheduleWarningBeeps(fFlagDownMillis, finalWarning=True)
-        
-        
-        # schedule guns for the first fleet
-        
-        self.scheduleGunForFleetStart(self.raceManager.fleets[0],300)
-        
-        # schedule guns for future fleets
-        
-        self.scheduleGunsForFutureFleetStarts()
+        self.scheduleTimeline()
         
     def handleFinishAdded(self,aFinish):
         self.fireGun()
@@ -259,28 +251,17 @@ class GunController():
         # fire a gun straight away
         self.fireGun()
         
-        self.scheduleGunsForFutureFleetStarts()
+        self.scheduleTimeline()
     
     def handleGeneralRecall(self,aFleet):
         self.fireGun()
         self.fireGun()
-        self.cancelSchedules()
-        self.scheduleGunsForFutureFleetStarts()
+        self.scheduleTimeline()
         
     def handleStartSequenceAbandoned(self):
         self.cancelSchedules()
     
-    
-    def scheduleGunsForFutureFleetStarts(self):
-        #
-        # iterate over all of the fleet. If the fleet is not started, schedule the guns
-        #
-        for aFleet in self.raceManager.fleets:
-            if not aFleet.isStarted() :
-                self.scheduleGunForFleetStart(aFleet,240)
-                self.scheduleGunForFleetStart(aFleet,60)
-                self.scheduleGunForFleetStart(aFleet,0)
-                
+        
        
     
             
@@ -288,16 +269,29 @@ class GunController():
 class ScreenController():
     pass
 
-    def __init__(self,startLineFrame,raceManager,audioManager,easyDaqRelay,recoveryManager):
+    def __init__(self,startLineFrame,raceManager,audioManager,lightsBoards,recoveryManager,gunScheduler=None):
         self.startLineFrame = startLineFrame
         self.raceManager = raceManager
         self.audioManager = audioManager
-        self.easyDaqRelay = easyDaqRelay
+        self.gunScheduler = gunScheduler
+        self.lightsBoards = lightsBoards
         self.recoveryManager = recoveryManager
         
         self.selectedFleet = None    
         self.selectedFinish = None
         
+        # when we last refreshed the fleets view, and the timeline we refreshed it from
+        self.lastRefreshTime = None
+        self.lastRefreshTimeline = None
+        
+        # we only call Tk for the cells and labels that have changed since we last rendered them
+        self.renderCache = RenderCache()
+        self.fleetColumns = self.startLineFrame.fleetsTreeView["columns"]
+        
+        # the finish treeview only holds the finishes that can be seen
+        self.finishList = VirtualFinishList(self.startLineFrame.finishTreeView, self.startLineFrame.finishScrollbar,
+                                            self.renderFinishRow, TREEVIEW_ROW_HEIGHT)
+        
         self.fleetButtons=[]
         self.buildFleetManagerView()
         
@@ -322,8 +316,8 @@ class ScreenController():
         #
         # Need to change this from event based to refreshing as part of the update loop
         #
-        if self.easyDaqRelay:
-            self.easyDaqRelay.changed.connect("connectionStateChanged",self.handleConnectionStateChanged)
+        for lightsBoard in self.lightsBoards:
+            lightsBoard.easyDaqRelay.changed.connect("connectionStateChanged",self.handleConnectionStateChanged)
         
         self.startLineFrame.addFleetButton.config(command=self.addFleetClicked)
         self.startLineFrame.removeFleetButton.config(command=self.removeFleetClicked)
@@ -353,6 +347,7 @@ class ScreenController():
              iid = aFleet.fleetId,
              text = aFleet.name,
              values=(self.renderDeltaToStartTime(aFleet),aFleet.status()))  
+        self.renderCache.forgetRow(self.startLineFrame.fleetsTreeView, aFleet.fleetId)
             
     def showAddFleetDialog(self):
         dlg = AddFleetDialog(self.startLineFrame,RACES_LIST)
@@ -420,8 +415,13 @@ class ScreenController():
         self.updateButtonStates()
         
     def finishSelectionChanged(self,event):
+        # the selection is empty when the selected finish scrolls out of the finish list.
+        # It is still our selected finish.
+        if not self.startLineFrame.finishTreeView.selection():
+            return
         item = self.startLineFrame.finishTreeView.selection()[0]
         self.selectedFinish = self.raceManager.finishWithId(item)
+        self.finishList.selectedFinish = self.selectedFinish
         self.updateButtonStates()
         
     def gunAndFinishClicked(self):
@@ -435,6 +435,7 @@ class ScreenController():
     
     def handleFleetRemoved(self,aFleet):
         self.startLineFrame.fleetsTreeView.delete(aFleet.fleetId)
+        self.renderCache.forgetRow(self.startLineFrame.fleetsTreeView, aFleet.fleetId)
         self.selectedFleet=None
         self.updateButtonStates()
     
@@ -448,14 +449,17 @@ class ScreenController():
     
     def handleFinishChanged(self,aFinish):
         # update the GUI for a finish
-        self.startLineFrame.finishTreeView.item(aFinish.finishId,
-            values=(self.renderFinishFleet(aFinish),self.renderFinishElapsedTime(aFinish)))
+        self.finishList.refreshFinish(aFinish)
     
     def buildFinishView(self):
-        # we build our tree
-           
-        for finish in self.raceManager.finishes:
-            self.appendFinishToFinishTreeView(finish)
+        # we build our finish list in one go, and select the first finish without a fleet
+        # (or the last finish, if they all have fleets) 
+        self.finishList.setFinishes(self.raceManager.finishes)
+        firstFinishWithoutFleet = self.raceManager.firstFinishWithoutFleet()
+        if firstFinishWithoutFleet:
+            self.selectFinishInTreeView(firstFinishWithoutFleet)
+        elif self.raceManager.finishes:
+            self.selectFinishInTreeView(self.raceManager.finishes[-1])
             
     #
     # When the sequence starts, we create our fleet buttons
@@ -490,29 +494,12 @@ class ScreenController():
         if self.selectedFinish:
             self.selectedFinish.fleet = fleet
             self.raceManager.updateFinish(self.selectedFinish)
-            self.selectFinishInTreeView(self.nextFinishWithoutFleetAfter(self.selectedFinish))
+            self.selectFinishInTreeView(self.raceManager.nextFinishWithoutFleetAfter(self.selectedFinish))
     
-    def nextFinishWithoutFleetAfter(self,finish):
-        indexOfFinish = self.raceManager.finishes.index(finish)
-        for i in range(indexOfFinish+1,len(self.raceManager.finishes)):
-            if not self.raceManager.finishes[i].hasFleet():
-                return self.raceManager.finishes[i]
-            
-        return None
     #
     def appendFinishToFinishTreeView(self,aFinish):
-        finishItem = self.startLineFrame.finishTreeView.insert(
-             parent="",
-             index="end",
-             iid = aFinish.finishId,
-             text = self.renderFinishTime(aFinish),
-             values=(self.renderFinishFleet(aFinish),self.renderFinishElapsedTime(aFinish)))
-        
-        # the call up update_idletasks is needed to make sure that the
-        # treeview is fully populated. Without this line, on Active Python 2.7.2.5
-        # the scroll to the bottom only works every other item. 
-        self.startLineFrame.update_idletasks()
-        self.startLineFrame.finishTreeView.see(finishItem)
+        # the finish list moves on to show the new finish if it was showing the latest finishes
+        self.finishList.finishAppended(aFinish)
         
         #
         # if we don't already have a selected finish, 
@@ -529,7 +516,7 @@ class ScreenController():
     def selectFinishInTreeView(self,aFinish):
         # if we do have a finish
         if aFinish:
-            self.startLineFrame.finishTreeView.selection_set(aFinish.finishId)
+            self.finishList.selectFinish(aFinish)
             self.selectedFinish = aFinish
             self.enableFleetButtons()
         else:
@@ -538,6 +525,12 @@ class ScreenController():
             self.startLineFrame.finishTreeView.selection_set(selectedItems)
         self.updateButtonStates()
     
+    #
+    # Render a finish as the text and values of its item in the finish treeview
+    #
+    def renderFinishRow(self,aFinish):
+        return (self.renderFinishTime(aFinish), (self.renderFinishFleet(aFinish),self.renderFinishElapsedTime(aFinish)))
+    
     #
     # Render the fleet of a finish
     #
@@ -579,13 +572,15 @@ class ScreenController():
         self.startLineFrame.after(0, self.updateSessionStateDescription)
         
     def updateSessionStateDescription(self):
-        while self.easyDaqRelay.sessionStateDescriptionQueue.qsize():
-            try:
-                message = self.easyDaqRelay.sessionStateDescriptionQueue.get_nowait()
-                self.startLineFrame.connectionStatus.set(message)
-            except Queue.Empty:
-                # this should never happen. 
-                message = "Lights: No message available"
+        for lightsBoard in self.lightsBoards:
+            while lightsBoard.easyDaqRelay.sessionStateDescriptionQueue.qsize():
+                try:
+                    lightsBoard.sessionStateDescription = lightsBoard.easyDaqRelay.sessionStateDescriptionQueue.get_nowait()
+                except Queue.Empty:
+                    # this should never happen. 
+                    lightsBoard.sessionStateDescription = "No message available"
+        if self.lightsBoards:
+            self.renderCache.setVariable(self.startLineFrame.connectionStatus, " / ".join([lightsBoard.description() for lightsBoard in self.lightsBoards]))
                 
     
     #
@@ -626,33 +621,52 @@ class ScreenController():
         
     
     def refreshFleetsView(self):
+        # render everything against one reading of the clock, so that the fleets
+        # can't disagree with each other or with the clock label
+        with self.raceManager.clock.tick():
+            self._refreshFleetsView()
+        
+        #
+        # Schedule to update this view again in 250 milliseonds
+        #
+        self.startLineFrame.after(250, self.refreshFleetsView)
+        
+    def _refreshFleetsView(self):
         #
         # iterate over all of our fleets. Read the start time delta and
-        # and status, and update the fleetsTreeView with their values
+        # and status, and update the cells of the fleetsTreeView that have changed
         #
         
         for aFleet in self.raceManager.fleets:
             
-            self.startLineFrame.fleetsTreeView.item(
+            self.renderCache.setCells(self.startLineFrame.fleetsTreeView,
                         aFleet.fleetId,
-                        
-                        values=[self.renderDeltaToStartTime(aFleet), self.renderDeltaSecondsToStartTime(aFleet),aFleet.status()])
+                        self.fleetColumns,
+                        [self.renderDeltaToStartTime(aFleet), self.renderDeltaSecondsToStartTime(aFleet),aFleet.status()])
         
        
         
         #
-        # Ask our race manager if we have a started fleet
+        # Ask our race manager if we have a started fleet. A fleet can only start
+        # at a status change in the timeline, so we only ask if there has been one
+        # since we last refreshed (or the timeline has been recompiled).
         #
-        if self.raceManager.hasStartedFleet():
-            self.startLineFrame.enableGeneralRecallButton()
-        else:
-            self.startLineFrame.disableGeneralRecallButton()
+        now = self.raceManager.clock.now()
+        timeline = self.raceManager.timeline
+        if (timeline is not self.lastRefreshTimeline
+                or timeline.hasActionsBetween(self.lastRefreshTime, now, STATUS)):
+            if self.raceManager.hasStartedFleet():
+                self.startLineFrame.enableGeneralRecallButton()
+            else:
+                self.startLineFrame.disableGeneralRecallButton()
+        self.lastRefreshTime = now
+        self.lastRefreshTimeline = timeline
             
                   
         #
         # Update our clock
         #
-        self.startLineFrame.clockStringVar.set(datetime.datetime.now().strftime("%H:%M:%S"))
+        self.renderCache.setVariable(self.startLineFrame.clockStringVar, self.raceManager.clock.now().strftime("%H:%M:%S"))
         
         #
         # Update the connection status
@@ -664,11 +678,6 @@ class ScreenController():
         #
         self.updateGunQueueLength()
     
-        #
-        # Schedule to update this view again in 250 milliseonds
-        #
-        self.startLineFrame.after(250, self.refreshFleetsView)
-    
     
     #
     # This method enables and disables buttons. Call it after handling a button event
@@ -725,7 +734,18 @@ class ScreenController():
     #
     def updateGunQueueLength(self):
         
-        self.startLineFrame.gunQueueCount.set("Gun Q : %d " % self.audioManager.queueLength())
+        gunQueueDescription = "Gun Q : %d " % self.audioManager.queueLength()
+        # how long it takes from a gun being due to it being heard, and how many
+        # clips were on time, late or dropped
+        if self.audioManager.playCount:
+            gunQueueDescription = gunQueueDescription + "Audio : %d ms " % (self.audioManager.lastLatency * 1000)
+        gunQueueDescription = gunQueueDescription + "On time/late/dropped : %d/%d/%d " % (
+            self.audioManager.onTimeClipCount, self.audioManager.lateClipCount, self.audioManager.droppedClipCount)
+        # and how late the last scheduled gun or beep was
+        if self.gunScheduler and self.gunScheduler.dispatchCount:
+            gunQueueDescription = gunQueueDescription + "Late : %d ms (worst %d ms)" % (
+                self.gunScheduler.lastLateness * 1000, self.gunScheduler.worstLateness * 1000)
+        self.renderCache.setVariable(self.startLineFrame.gunQueueCount, gunQueueDescription)
 
 
     def exitClicked(self):
@@ -736,8 +756,12 @@ class ScreenController():
     def shutdown(self):
         
         logging.info("Shutting down")
-        self.easyDaqRelay.sendRelayCommand([LIGHT_OFF, LIGHT_OFF, LIGHT_OFF, LIGHT_OFF, LIGHT_OFF])
-        self.easyDaqRelay.stop()
+        for lightsBoard in self.lightsBoards:
+            lightsBoard.easyDaqRelay.sendRelayCommand([LIGHT_OFF, LIGHT_OFF, LIGHT_OFF, LIGHT_OFF, LIGHT_OFF])
+            lightsBoard.easyDaqRelay.stop()
+        
+        if self.gunScheduler:
+            self.gunScheduler.stop()
         
         # delete our recovery file if we have one
         if self.recoveryManager:
@@ -770,9 +794,23 @@ if __name__ == '__main__':
         filename = logfilename)
             
     
+    #
+    # The lights are either one board on the Lights comPort, for every fleet, or a board
+    # for each start line. For start lines, Lights boards is a comma separated list of board
+    # names, and each board has a section, such as [Lights line1], with its comPort and the
+    # comma separated names of the fleets it starts.
+    #
+    lightsBoardConfigs = []
     if config.get("Lights","enabled") == 'Y':
-        comPort = config.get("Lights","comPort")
-        logging.info("Lights enabled on COM port %s" % comPort)
+        if config.has_option("Lights","boards"):
+            for boardName in config.get("Lights","boards").split(","):
+                boardSection = "Lights " + boardName.strip()
+                fleetNames = [fleetName.strip() for fleetName in config.get(boardSection,"fleets").split(",")]
+                lightsBoardConfigs.append((boardName.strip(), config.get(boardSection,"comPort"), fleetNames))
+        else:
+            lightsBoardConfigs.append(("Lights", config.get("Lights","comPort"), None))
+        for (boardName, comPort, fleetNames) in lightsBoardConfigs:
+            logging.info("Lights %s enabled on COM port %s" % (boardName, comPort))
     else:
         logging.info("Lights not enabled")
         
@@ -792,6 +830,18 @@ if __name__ == '__main__':
     
     audioClips = config.items("Audio")
     
+    #
+    # By default we play the clips through the sound card. For testing without one,
+    # the AudioOutput sink can be null, to throw them away, or file, to write them to
+    # WAV files starting with filenamePrefix.
+    #
+    audioSink = None
+    if config.has_option("AudioOutput","sink"):
+        if config.get("AudioOutput","sink") == "null":
+            audioSink = NullAudioSink()
+        elif config.get("AudioOutput","sink") == "file":
+            audioSink = WavFileAudioSink(config.get("AudioOutput","filenamePrefix"))
+    
     
     
     backgroundColour = config.get("UserInterface","backgroundColour")        
@@ -800,58 +850,86 @@ if __name__ == '__main__':
     # Check for a recovery file. If we have one, ask if we want to recover our race manager
     #
     recoveryFilename = config.get("Persistence","recoveryFilename") 
+    recoveryManager = None
+    raceManager = None
     if recoveryFilename:
-        if os.path.exists(config.get("Persistence","recoveryFilename")):
+        recoveryManager = RaceRecoveryManager(recoveryFilename)
+        if recoveryManager.hasRecoveryFile():
             if tkMessageBox.askyesno("Crash detected","Do you want to recover?", icon="warning"):
-                raceManager = pickle.load(open(recoveryFilename))
-            else:
-                raceManager = RaceManager()
-        else:
-            raceManager = RaceManager()
-    else:
+                # replay the journal on top of the last snapshot
+                try:
+                    raceManager = recoveryManager.recoverRaceManager()
+                except RecoveryException as e:
+                    logging.error("Recovery failed: %s" % e)
+                    tkMessageBox.showerror("Recovery failed","The race could not be recovered. Starting a new race.")
+    if not raceManager:
         raceManager = RaceManager()
     
     if testSpeedRatio:
         RaceManager.testSpeedRatio = testSpeedRatio
-    logging.info("Setting test speed ratio to %d" % testSpeedRatio)
-    easyDaqRelay = None
     
-    if comPort:     
-        from lightsui.hardware import LIGHT_OFF, LIGHT_ON, EasyDaqUSBRelay
-        
-        easyDaqRelay = EasyDaqUSBRelay(comPort)
-        relayThread = threading.Thread(target = easyDaqRelay.run)
+    #
+    # A monotonic clock keeps the start sequence steady if the laptop's clock is
+    # corrected while we are running.
+    #
+    if config.has_option("Clock","monotonic") and config.get("Clock","monotonic") == 'Y':
+        RaceManager.clock = MonotonicClock()
+        logging.info("Using monotonic clock")
+    logging.info("Setting test speed ratio to %d" % testSpeedRatio)
+    lightsBoards = []
+    
+    if lightsBoardConfigs:     
+        from lightsui.hardware import LIGHT_OFF, LIGHT_ON, EasyDaqUSBRelay, EasyDaqRelayLoop
+        
+        # all of the boards share one relay loop, on one thread
+        relayLoop = EasyDaqRelayLoop()
+        for (boardName, comPort, fleetNames) in lightsBoardConfigs:
+            # a comPort of simulator runs the lights against a simulated board
+            if comPort == "simulator":
+                from lightsui.transport import SimulatedEasyDaqTransport
+                easyDaqRelay = EasyDaqUSBRelay(comPort, SimulatedEasyDaqTransport())
+            else:
+                easyDaqRelay = EasyDaqUSBRelay(comPort)
+            relayLoop.addRelay(easyDaqRelay)
+            lightsBoards.append(LightsBoard(boardName, easyDaqRelay, fleetNames))
+        relayThread = threading.Thread(target = relayLoop.run)
         # run as a background thread. Allow application to end even if this thread is still running.
         relayThread.daemon = True
         
     # the audio manager runs in its own thread    
-    audioManager = AudioManager(audioClips)  
+    audioManager = AudioManager(audioClips, audioSink)  
     audioThread = threading.Thread(target = audioManager.run)
     audioThread.daemon = True
     
+    # and the gun scheduler times the guns in its own thread, away from the Tk event loop
+    gunScheduler = GunScheduler(audioManager)
+    gunSchedulerThread = threading.Thread(target = gunScheduler.run)
+    gunSchedulerThread.daemon = True
     
-    recoveryManager = None
-    if config.get("Persistence","recoveryFilename"):
-        recoveryManager = RaceRecoveryManager(config.get("Persistence","recoveryFilename"),raceManager)
-        raceManager.changed.connect(None,recoveryManager.handleRaceManagerChanged)
+    
+    if recoveryManager:
+        recoveryManager.journalRaceManager(raceManager)
         recoveryThread = threading.Thread(target = recoveryManager.run)
         recoveryThread.daemon = True
         recoveryThread.start()
-    screenController = ScreenController(app,raceManager,audioManager,easyDaqRelay, recoveryManager)
-    gunController = GunController(app, audioManager, raceManager)
-    # check if a recovered raceManager has a started sequence. If so, schedule guns.
+    screenController = ScreenController(app,raceManager,audioManager,lightsBoards, recoveryManager, gunScheduler)
+    gunController = GunController(gunScheduler, audioManager, raceManager)
+    # check if a recovered raceManager has a started sequence. If so, compile its
+    # timeline and schedule guns.
     # note, this does not recover the F flag up beeps and gun nor F flag down beeps
     if raceManager.hasSequenceStarted():
-        gunController.scheduleGunsForFutureFleetStarts()
+        raceManager.compileTimeline()
+        gunController.scheduleTimeline()
     
     
     logging.info("Starting screen controller")             
     screenController.start()
     
-    if comPort:
-        lightsController = LightsController(app, easyDaqRelay, raceManager)
+    if lightsBoards:
+        lightsController = LightsController(app, lightsBoards, raceManager)
         logging.info("Starting lights controller") 
         relayThread.start()
     audioThread.start()
+    gunSchedulerThread.start()
     app.master.title('Startline')    
     app.mainloop()  
\ No newline at end of file
@@ -0,0 +1,126 @@
+'''
+Created on 17 Oct 2026
+
+Benchmark of the relay driver against a simulated EasyDaq board. Measures the command to wire
+latency (from asking for a change of lights to the packet arriving at the board), for single
+changes and for bursts, and the time to recover the lights after the cable is pulled and plugged
+back in. Then measures the command to wire latency of each board when several boards, one for
+each start line, share one relay loop.
+
+Run from the src directory:
+
+PYTHONPATH=. python lightsui/benchmarkrelay.py
+'''
+import threading
+import time
+import random
+
+from lightsui.hardware import EasyDaqUSBRelay, EasyDaqRelayLoop
+from lightsui.transport import SimulatedEasyDaqTransport
+from model.utils import monotonicSeconds
+
+NUMBER_CHANGES = 50
+BURST_SIZE = 10
+NUMBER_BOARDS = 3
+
+
+def startRelay():
+    transport = SimulatedEasyDaqTransport()
+    relay = EasyDaqUSBRelay("simulator", transport)
+    relayThread = threading.Thread(target=relay.run)
+    relayThread.daemon = True
+    relayThread.start()
+    waitFor(relay.isConnected)
+    return (relay, transport)
+
+def startRelayLoop(numberBoards):
+    transports = [SimulatedEasyDaqTransport() for i in range(numberBoards)]
+    relays = [EasyDaqUSBRelay("simulator", transport) for transport in transports]
+    relayLoop = EasyDaqRelayLoop(relays)
+    relayThread = threading.Thread(target=relayLoop.run)
+    relayThread.daemon = True
+    relayThread.start()
+    waitFor(lambda: all([relay.isConnected() for relay in relays]))
+    return (relayLoop, relayThread, relays, transports)
+
+def waitFor(condition):
+    while not condition():
+        time.sleep(0.001)
+
+def randomLights():
+    return [random.randint(0, 1) for i in range(5)]
+
+def lightsValue(lights):
+    return sum([light << i for (i, light) in enumerate(lights)])
+
+#
+# Send a change of lights, in a burst of burstSize changes, and return the milliseconds from
+# sending the last change until the board has it
+#
+def commandToWireMillis(relay, transport, burstSize):
+    for i in range(burstSize - 1):
+        relay.sendRelayCommand(randomLights())
+    lights = randomLights()
+    while lightsValue(lights) == transport.relayValue:
+        lights = randomLights()
+    sentSeconds = monotonicSeconds()
+    relay.sendRelayCommand(lights)
+    waitFor(lambda: transport.relayValue == lightsValue(lights))
+    millis = 1000 * (monotonicSeconds() - sentSeconds)
+    # let the board confirm the state before the next change
+    waitFor(lambda: relay.verifiedRelayValue == lightsValue(lights))
+    return millis
+
+def summarise(name, millis):
+    millis = sorted(millis)
+    print "%-28s %8.1f %8.1f %8.1f" % (name, millis[len(millis) / 2], millis[int(len(millis) * 0.95)], millis[-1])
+
+def benchmark():
+    (relay, transport) = startRelay()
+
+    print "%-28s %8s %8s %8s" % ("command to wire", "p50 ms", "p95 ms", "max ms")
+    summarise("single change", [commandToWireMillis(relay, transport, 1) for i in range(NUMBER_CHANGES)])
+    summarise("burst of %d changes" % BURST_SIZE, [commandToWireMillis(relay, transport, BURST_SIZE) for i in range(NUMBER_CHANGES)])
+    print "commands received %d, collapsed %d, packets written %d, packets ignored by board %d" % (
+        relay.relayCommandsReceived, relay.relayCommandsCollapsed, relay.packetsWritten, transport.packetsIgnored)
+
+    # pull the cable, change the lights, and plug the cable back in to a board that has lost its state
+    transport.pullCable()
+    lights = [1, 0, 1, 0, 1]
+    relay.sendRelayCommand(lights)
+    waitFor(relay.isReconnecting)
+    transport.relayValue = 0
+    pluggedInSeconds = monotonicSeconds()
+    transport.plugInCable()
+    waitFor(lambda: relay.verifiedRelayValue == lightsValue(lights))
+    print "recovery after cable pull: %.2f seconds" % (monotonicSeconds() - pluggedInSeconds)
+
+    relay.stop()
+
+    # change the lights on every board at once, as when fleets on different start lines start together
+    (relayLoop, relayThread, relays, transports) = startRelayLoop(NUMBER_BOARDS)
+    boardMillis = [[] for relay in relays]
+    for i in range(NUMBER_CHANGES):
+        lights = randomLights()
+        while lightsValue(lights) == transports[0].relayValue:
+            lights = randomLights()
+        sentSeconds = monotonicSeconds()
+        for relay in relays:
+            relay.sendRelayCommand(lights)
+        for (transport, millis) in zip(transports, boardMillis):
+            waitFor(lambda: transport.relayValue == lightsValue(lights))
+            millis.append(1000 * (monotonicSeconds() - sentSeconds))
+        waitFor(lambda: all([relay.verifiedRelayValue == lightsValue(lights) for relay in relays]))
+    print "%d boards on one relay loop" % NUMBER_BOARDS
+    for (boardNumber, millis) in enumerate(boardMillis):
+        summarise("board %d" % (boardNumber + 1), millis)
+    for (boardNumber, relay) in enumerate(relays):
+        print "board %d command to wire as measured by the relay: average %.1f ms, worst %.1f ms" % (
+            boardNumber + 1, relay.averageCommandToWire() * 1000, relay.worstCommandToWire * 1000)
+
+    relayLoop.stop()
+    relayThread.join()
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -8,8 +8,8 @@ import Queue
 import datetime
 import time
 
-import serial
-from model.utils import Signal
+from model.utils import Signal, monotonicSeconds
+from lightsui.transport import SerialTransport, TransportException
 
 # constants for lights state
 LIGHT_OFF = 0
@@ -20,19 +20,58 @@ DISCONNECTED = 0
 RECONNECTING = 1
 CONNECTED = 2
 
+#
+# timings for the serial session, in seconds
+#
+# the board needs at least this long between packets
+PACKET_SPACING_SECONDS = 0.1
+# if we haven't written anything for this long, we ask the board for its status
+KEEPALIVE_SECONDS = 5
+# after asking for the status, we look for the reply this often, for up to STATUS_REPLY_SECONDS
+STATUS_POLL_SECONDS = 0.02
+STATUS_REPLY_SECONDS = 0.5
+# after a failure, we try to connect again after this long
+RECONNECT_SECONDS = 5
+# after opening the serial port, we wait this long for the board before establishing the session
+SETTLE_SECONDS = 2
+
+#
+# After each relay command, we ask the board for its status to check that the relays
+# match. If they don't, we send the command again, up to MAX_VERIFICATION_RETRIES times.
+#
+MAX_VERIFICATION_RETRIES = 3
+#
+# We keep a histogram of how long it takes from writing a relay command to the board
+# confirming it. These are the upper bounds of the buckets, in milliseconds; the last
+# bucket is for anything slower.
+#
+VERIFICATION_LATENCY_BUCKETS_MILLIS = [150, 250, 500, 1000, 2000]
+
 
 '''
-EasyDayUSBRelay wraps an EasyDaq USB relay board. It has its own python thread for
-managing itself.
+EasyDayUSBRelay wraps an EasyDaq USB relay board. It is run by an EasyDaqRelayLoop, on
+the loop's python thread.
 
 17/04/2014 - issue 2 - changed EasyDaqUSBRelay to run in its own thread to isolate the IO
 from the rest of the application. This means that the relay changes from an asynchronous model running on the Tk event loop to 
 a synchronous model. The performance overhead is not an issue for this application. The interface to the relay becomes
 a queue of command objects to change the state of the relay.  
+
+The relay thread never sleeps. Packet spacing, keepalives, status reads and reconnects are
+timers, and while waiting for the next timer we wait on the command queue, so that a change
+of lights is never stuck behind a keepalive or a reconnect.
+
+17/10/2026 - several relay boards, one for each start line, can share one EasyDaqRelayLoop,
+and so one thread. Each board keeps its own command queue, timers and session; the loop
+waits for the earliest timer of any board, or for any board to be sent a command.
 '''
 class EasyDaqUSBRelay:
 
-    def __init__(self, serialPortName):
+    #
+    # By default we talk to the board over the serial port. Pass another RelayTransport, such as
+    # a SimulatedEasyDaqTransport, to talk to something else.
+    #
+    def __init__(self, serialPortName, transport=None):
         # capture the name of the serial port. On windows, this will be COM3, COM4 etc. The COM port is set
         # when the relay card is first plugged into the PC. You can change it subsequently through the control panel.
         self.serialPortName = serialPortName
@@ -42,6 +81,13 @@ class EasyDaqUSBRelay:
         #
         self.commandQueue = Queue.Queue()
         
+        #
+        # whenever we queue a command, we put ourselves on the wake queue of the loop that runs us,
+        # so that the loop knows which board has work to do. The loop replaces this queue with its own.
+        #
+        self.wakeQueue = Queue.Queue()
+        self.isRunning = False
+        
         #
         # we use a python queue as our session state description output mechanism. This insulates the GUI from the threading
         # of the relay
@@ -56,14 +102,9 @@ class EasyDaqUSBRelay:
         #
         # we create our serial port connection now. We don't open the connection until we are asked to connect
         #
-        # timeout is set to 0.5 second for reads. 
-        self.serialConnection = serial.Serial(timeout=0.5)
-        
-        # and tell the serial connection which serial port to connect
-        self.serialConnection.port = self.serialPortName      
-        
-        # the baud rate is always 9600
-        self.serialConnection.baudrate = 9600
+        if transport is None:
+            transport = SerialTransport(self.serialPortName)
+        self.transport = transport
         
         #
         # track whether or not we are enabled. If we are enabled, then we continue to check that have an active connection
@@ -77,6 +118,18 @@ class EasyDaqUSBRelay:
         # track the time of the last command. We default to now as the startup time
         #
         self.lastPacketTime = datetime.datetime.now()
+        self.lastPacketSeconds = monotonicSeconds()
+        
+        #
+        # the packets waiting for their turn to be written
+        #
+        self.outgoingPackets = []
+        
+        #
+        # our timers, as a dictionary of timer name to the monotonic seconds when it is due. Each
+        # timer name is also the name of the method that handles it.
+        #
+        self.timers = {}
         
         #
         # trace the previous relay command. This enables us to resend in the event of a disconnect
@@ -88,6 +141,35 @@ class EasyDaqUSBRelay:
         # We track our session status through constants DISCONNECTED,RECONNECTING,CONNECTED
         #
         self.sessionState = DISCONNECTED
+        
+        #
+        # count the relay commands we receive, how many of them we collapse into a later
+        # command, and the packets we write to the board
+        #
+        self.relayCommandsReceived = 0
+        self.relayCommandsCollapsed = 0
+        self.packetsWritten = 0
+        
+        #
+        # the relay state we last wrote to the board, as the byte we sent, and when we first wrote it
+        #
+        self.commandedRelayValue = None
+        self.commandedSeconds = None
+        # when we last asked for the board's status
+        self.statusRequestedSeconds = None
+        # the relay state that the board has confirmed, or None if it hasn't confirmed the commanded state
+        self.verifiedRelayValue = None
+        self.verificationRetries = 0
+        self.verificationLatencyHistogram = [0] * (len(VERIFICATION_LATENCY_BUCKETS_MILLIS) + 1)
+        
+        #
+        # how long it takes, in seconds, from being sent a relay command to writing it to the board
+        #
+        self.currentRelayCommandSentSeconds = None
+        self.commandToWireCount = 0
+        self.totalCommandToWire = 0.0
+        self.lastCommandToWire = 0.0
+        self.worstCommandToWire = 0.0
             
     def setSessionState(self,state):
         self.sessionState = state
@@ -106,7 +188,9 @@ class EasyDaqUSBRelay:
         
         
     def sessionStateDescription(self):
-        if self.sessionState == CONNECTED:
+        if self.sessionState == CONNECTED and self.isRelayStateUnconfirmed():
+            return "Warning: CONNECTED BUT LIGHTS NOT CONFIRMED"
+        elif self.sessionState == CONNECTED:
             return "CONNECTED"
         elif self.sessionState == DISCONNECTED:
             return "Warning: DISCONNECTED"
@@ -121,6 +205,12 @@ class EasyDaqUSBRelay:
         
     def isReconnecting(self):
         return self.sessionState == RECONNECTING
+    
+    #
+    # Have we given up trying to get the board to match the commanded relay state?
+    #
+    def isRelayStateUnconfirmed(self):
+        return self.verificationRetries > MAX_VERIFICATION_RETRIES
             
     def processedCommand(self):
         '''
@@ -128,63 +218,117 @@ class EasyDaqUSBRelay:
         '''
         self.lastCommandProcessedTime = datetime.datetime.now()
         
+    #
+    # Timers. Setting a timer that is already set moves it.
+    #
+    def setTimer(self,timerName,seconds):
+        self.timers[timerName] = monotonicSeconds() + seconds
+        
+    def cancelTimer(self,timerName):
+        if timerName in self.timers:
+            del self.timers[timerName]
+            
+    def secondsToNextTimer(self):
+        if self.timers:
+            return max(0, min(self.timers.values()) - monotonicSeconds())
+        else:
+            return KEEPALIVE_SECONDS
+        
+    def runDueTimers(self):
+        now = monotonicSeconds()
+        for (timerName, dueSeconds) in sorted(self.timers.items(), key=lambda timer: timer[1]):
+            # an earlier timer may have cancelled this one
+            if dueSeconds <= now and self.timers.get(timerName) == dueSeconds:
+                del self.timers[timerName]
+                getattr(self, timerName)()
+        
     def maintainSession(self):
      
         if self.isConnected():
             logging.debug("Maintaining session")
             
+            # queue a packet that requests the EasyDaq to output its status. We
+            # read the status once the request is written.
+            self.queuePacketToEasyDaq('A' + chr(0))
             
-            try:
-                
-                # create a relay packet that requests the EasyDaq to output its status
-                self.currentRelayPacket = 'A' + chr(0)
-                # and queue a request
-                self.queuePacketToEasyDaq()
-                
-                # sleep for half a second
-                time.sleep(0.5)
-                # and read
-                self.readSession()
-                
-            except (serial.SerialException):
-                logging.exception("Exception writing read request to session")
-                self.beNotConnected()
-                self.reconnect()
-        
     
     def readSession(self):
         logging.debug("Reading from session")
         try:
-            # read a single byte. This should be our current status but at the moment we don't check for that
-            x = self.serialConnection.read()
-            logging.debug("Read from session")
+            # read a single byte, if there is one. This is the state of the relays
+            status = self.transport.read()
             
-        except (serial.SerialException, ValueError) as e:
-            logging.error("I/O error: {0}".format(e))
-            self.serialConnection.close()
-            self.beReconnecting()
-            self.reconnect()
+        except TransportException as e:
+            logging.error(str(e))
+            self.connectionFailed()
+            return
+        
+        if status:
+            logging.debug("Read status %d from session" % ord(status))
+            self.verifyRelayState(ord(status))
+        elif monotonicSeconds() - self.statusRequestedSeconds < STATUS_REPLY_SECONDS:
+            self.setTimer("readSession", STATUS_POLL_SECONDS)
+        else:
+            logging.warn("No status from relay board")
+    
+    #
+    # Compare the state the board reports with the state we last commanded. If they don't
+    # match, send the command again, until we run out of retries.
+    #
+    def verifyRelayState(self,relayValue):
+        if self.commandedRelayValue is None:
+            return
+        
+        if relayValue == self.commandedRelayValue:
+            if self.verifiedRelayValue != relayValue:
+                self.recordVerificationLatency(monotonicSeconds() - self.commandedSeconds)
+            wasUnconfirmed = self.isRelayStateUnconfirmed()
+            self.verifiedRelayValue = relayValue
+            self.verificationRetries = 0
+            if wasUnconfirmed:
+                self.setSessionState(self.sessionState)
+        else:
+            self.verifiedRelayValue = None
+            self.verificationRetries = self.verificationRetries + 1
+            if self.verificationRetries <= MAX_VERIFICATION_RETRIES:
+                logging.warn("Relay board reports %d, expected %d. Resending" % (relayValue, self.commandedRelayValue))
+                self.queuePacketToEasyDaq('C' + chr(self.commandedRelayValue))
+            elif self.verificationRetries == MAX_VERIFICATION_RETRIES + 1:
+                logging.error("Relay board still reports %d, expected %d" % (relayValue, self.commandedRelayValue))
+                self.setSessionState(self.sessionState)
+    
+    def recordVerificationLatency(self,seconds):
+        bucket = len([bound for bound in VERIFICATION_LATENCY_BUCKETS_MILLIS if bound < seconds * 1000])
+        self.verificationLatencyHistogram[bucket] = self.verificationLatencyHistogram[bucket] + 1
+        
+    def recordCommandToWire(self,seconds):
+        self.commandToWireCount = self.commandToWireCount + 1
+        self.totalCommandToWire = self.totalCommandToWire + seconds
+        self.lastCommandToWire = seconds
+        self.worstCommandToWire = max(self.worstCommandToWire, seconds)
+        
+    def averageCommandToWire(self):
+        if self.commandToWireCount:
+            return self.totalCommandToWire / self.commandToWireCount
+        else:
+            return 0.0
     
     
     def establishSession(self):
         logging.debug("Establishing session in state: %s" % self.sessionStateDescription() )
-        self.sendRelayConfiguration([0,0,0,0,0])
-        
-        previousState = self.sessionState
+        self._sendRelayConfiguration([0,0,0,0,0])
         
         # and be connected
         self.beConnected()
         
-        if previousState == RECONNECTING:
-                
-            if self.currentRelayCommand:
-                logging.info("Recovering ... sending current relay command: %s" % self.printableCommand(self.currentRelayCommand))
-                self.currentRelayPacket = self.currentRelayCommand
-                self.queuePacketToEasyDaq()
-            elif self.previousRelayCommand:
-                logging.info("Recovering ... sending previous relay command: %s" % self.printableCommand(self.previousRelayCommand))
-                self.currentRelayPacket = self.previousRelayCommand
-                self.queuePacketToEasyDaq()
+        # a relay command sent while we were settling or reconnecting hasn't been written yet.
+        # After a reconnect, the board may have lost the last command we did write.
+        if self.currentRelayCommand:
+            logging.info("Establishing session ... sending current relay command: %s" % self.printableCommand(self.currentRelayCommand))
+            self.queuePacketToEasyDaq(self.currentRelayCommand)
+        elif self.previousRelayCommand:
+            logging.info("Recovering ... sending previous relay command: %s" % self.printableCommand(self.previousRelayCommand))
+            self.queuePacketToEasyDaq(self.previousRelayCommand)
         
     
     def _connect(self):
@@ -195,41 +339,47 @@ class EasyDaqUSBRelay:
             self.enabled = True
             try:
                 # try to open the serial port
-                if self.serialConnection.isOpen():
+                if self.transport.isOpen():
                     logging.debug("Request to open serial port when already open")
                 else:
-                    self.serialConnection.open()
+                    self.transport.open()
                     logging.debug("Connected to serial port")
-                # wait for a second and establish the session
-                time.sleep(2)
-                self.establishSession()
+                # give the board time to settle, then establish the session
+                self.setTimer("establishSession", SETTLE_SECONDS)
             
-            except (serial.SerialException,ValueError) as e:           
-                logging.error("I/O error: {0}".format(e))
-                self.serialConnection.close()
-                self.beReconnecting()
-                self.reconnect()
+            except TransportException as e:           
+                logging.error(str(e))
+                self.connectionFailed()
         else:
             logging.debug("Request for connect when already connected")
             
+    #
+    # We have lost the serial port. Close it, forget any packets we were waiting to
+    # write (the session will replay the relay state when it is re-established) and
+    # try to connect again later.
+    #
+    def connectionFailed(self):
+        self.transport.close()
+        self.outgoingPackets = []
+        for timerName in ["writeNextPacket", "readSession", "maintainSession", "establishSession"]:
+            self.cancelTimer(timerName)
+        self.beReconnecting()
+        self.reconnect()
     
     def reconnect(self):
-        logging.info("Reconnecting to serial port")
-        # sleep for 5 seconds
-        time.sleep(5)
-        # connect
-        self._connect()
+        logging.info("Reconnecting to serial port in %d seconds" % RECONNECT_SECONDS)
+        self.setTimer("_connect", RECONNECT_SECONDS)
         
         
     def connect(self):
-        self.commandQueue.put(EasyDaqUSBConnect())
+        self.queueCommand(EasyDaqUSBConnect())
         
 
     
     def disconnect(self):
         self.enabled = False
         if self.isConnected:
-            self.serialConnection.close()
+            self.transport.close()
             self.beNotConnected()
         
     def timeSinceLastPacket(self):
@@ -241,53 +391,103 @@ class EasyDaqUSBRelay:
         return int((deltaSinceLastPacket.microseconds/1000) + deltaSinceLastPacket.seconds*1000)
     
     
-    def writePacketToEasyDaq(self):
+    def writePacketToEasyDaq(self,packet):
         # if we are connected, we write our packet
         try:
-            logging.debug("Writing to serial port: %s" % self.printableCommand(self.currentRelayPacket))
-            self.serialConnection.write(self.currentRelayPacket)
+            logging.debug("Writing to serial port: %s" % self.printableCommand(packet))
+            self.transport.write(packet)
             
             #
             # Not the most elegant, but we check to see if this packet is a command by looking for a C as the first byte of the packet
             #
-            if self.currentRelayPacket[0] =='C':
+            if packet[0] =='C':
                 
+                if packet == self.currentRelayCommand and self.currentRelayCommandSentSeconds is not None:
+                    self.recordCommandToWire(monotonicSeconds() - self.currentRelayCommandSentSeconds)
+                    self.currentRelayCommandSentSeconds = None
                 self.previousRelayCommand = self.currentRelayCommand
                 self.currentRelayCommand = None
+                
+                # ask the board to confirm the new state
+                if ord(packet[1]) != self.commandedRelayValue:
+                    self.commandedRelayValue = ord(packet[1])
+                    self.commandedSeconds = monotonicSeconds()
+                    self.verificationRetries = 0
+                self.verifiedRelayValue = None
+                self.queuePacketToEasyDaq('A' + chr(0))
+            
+            # and read the status once it has had time to arrive
+            elif packet[0] == 'A':
+                self.statusRequestedSeconds = monotonicSeconds()
+                self.setTimer("readSession", STATUS_POLL_SECONDS)
 
             
             self.lastPacketTime = datetime.datetime.now()
-        except (serial.SerialException,ValueError) as e:
-            logging.error("I/O error: {0}".format(e))
-            self.serialConnection.close()
-            self.beReconnecting()
-            
-            self.reconnect()
+            self.lastPacketSeconds = monotonicSeconds()
+            self.packetsWritten = self.packetsWritten + 1
+            # if we don't write anything else for a while, check the session
+            self.setTimer("maintainSession", KEEPALIVE_SECONDS)
+        except TransportException as e:
+            logging.error(str(e))
+            self.connectionFailed()
     
     def printableCommand(self,relayCommand):
         return relayCommand[0] + "," + str(ord(relayCommand[1]))
     
-    def queuePacketToEasyDaq(self):
+    def queuePacketToEasyDaq(self,packet):
         '''
-        Write a command to EasyDaq. If we have written a command within the last 100 milliseconds,
-        then delay by 100 milliseconds, otherwise write the command now.
+        Queue a packet to write to EasyDaq. We write a packet at most every 100 milliseconds.
+        A relay command replaces a relay command that is still waiting to be written, so
+        the board goes straight to the latest state, and goes ahead of a waiting status
+        request, so a change of lights never waits behind the check of the last change.
         '''
-        # easy scenario is that we can write the command immediately
-        
-        
-        # if time delta is at least 100 milliseconds
-        
-        if (self.timeSinceLastPacket() > 100):
-            # we can write the command now.
-            self.writePacketToEasyDaq()
-                
-        else:
-            # and queue to be written in 100 milliseconds
-            logging.debug("Queuing writing packet to easyDaq")
-            time.sleep((100-self.timeSinceLastPacket())/1000)
-            self.writePacketToEasyDaq()
-
-
+        if packet[0] == 'C':
+            waitingCommands = [waitingPacket for waitingPacket in self.outgoingPackets if waitingPacket[0] == 'C']
+            if waitingCommands:
+                self.outgoingPackets[self.outgoingPackets.index(waitingCommands[0])] = packet
+                return
+            waitingStatusRequests = [waitingPacket for waitingPacket in self.outgoingPackets if waitingPacket[0] == 'A']
+            if waitingStatusRequests:
+                # writing the command queues another status request, so this one can go
+                self.outgoingPackets[self.outgoingPackets.index(waitingStatusRequests[0])] = packet
+                return
+        # one status request waiting is enough
+        if packet[0] == 'A' and packet in self.outgoingPackets:
+            return
+        self.outgoingPackets.append(packet)
+        
+        if "writeNextPacket" not in self.timers:
+            secondsToNextPacket = self.lastPacketSeconds + PACKET_SPACING_SECONDS - monotonicSeconds()
+            self.setTimer("writeNextPacket", max(0, secondsToNextPacket))
+    
+    def writeNextPacket(self):
+        if self.outgoingPackets:
+            self.writePacketToEasyDaq(self.outgoingPackets.pop(0))
+        if self.outgoingPackets:
+            self.setTimer("writeNextPacket", PACKET_SPACING_SECONDS)
+            
+    #
+    # Write the packets still waiting, typically the lights off command sent just before we
+    # were stopped, keeping to the packet spacing. We are on our way out, so we don't ask the
+    # board for its status.
+    #
+    def drainOutgoingPackets(self):
+        self.cancelTimer("writeNextPacket")
+        while self.outgoingPackets and self.isConnected():
+            packet = self.outgoingPackets.pop(0)
+            if packet[0] == 'A':
+                continue
+            secondsToNextPacket = self.lastPacketSeconds + PACKET_SPACING_SECONDS - monotonicSeconds()
+            if secondsToNextPacket > 0:
+                time.sleep(secondsToNextPacket)
+            self.writePacketToEasyDaq(packet)
+    #
+    # Put a command on our command queue, and wake up the loop that runs us
+    #
+    def queueCommand(self,command):
+        self.commandQueue.put(command)
+        self.wakeQueue.put(self)
+    
     #
     # This forms part of the external interface that will be invoked in a different thread.
     # Encapsulate in an object and put on a queue for execution.
@@ -295,7 +495,7 @@ class EasyDaqUSBRelay:
     def sendRelayConfiguration(self,relayArray):
         
         
-        self.commandQueue.put(EasyDaqUSBSendRelayConfiguration(relayArray))
+        self.queueCommand(EasyDaqUSBSendRelayConfiguration(relayArray))
      
 
     #
@@ -305,9 +505,9 @@ class EasyDaqUSBRelay:
     def sendRelayCommand(self,relayArray):
      
         
-        self.commandQueue.put(EasyDaqUSBSendRelayCommand(relayArray))
+        self.queueCommand(EasyDaqUSBSendRelayCommand(relayArray))
     
-    def _sendRelayCommand(self,relayArray):
+    def _sendRelayCommand(self,relayArray,sentSeconds=None):
         # turn the values in the list into a byte where the bit in the byte reflects the position in the list.
         
         commandValue = 0
@@ -319,12 +519,12 @@ class EasyDaqUSBRelay:
         logging.debug("Sending C + %i" % commandValue)
         relayCommand = 'C' + chr(commandValue)
         self.currentRelayCommand = relayCommand
+        self.currentRelayCommandSentSeconds = sentSeconds
         
-        self.currentRelayPacket = relayCommand
         # if we are connected, we queue the packet. If we are not connected,
         # the session recovery will play in the relay packet
         if self.isConnected():
-            self.queuePacketToEasyDaq()
+            self.queuePacketToEasyDaq(relayCommand)
 
        
     def _sendRelayConfiguration(self,relayArray):
@@ -337,33 +537,125 @@ class EasyDaqUSBRelay:
                 commandValue = commandValue + bitValue
         
         logging.debug("Sending B + %i" % commandValue)        
-        self.currentRelayPacket = 'B' + chr(commandValue)
+        self.queuePacketToEasyDaq('B' + chr(commandValue))
         
-        self.queuePacketToEasyDaq()
+    
+    #
+    # Take any commands that are waiting on the command queue, without blocking
+    #
+    def pendingCommands(self):
+        commands = []
+        try:
+            while True:
+                commands.append(self.commandQueue.get(block=False))
+        except Queue.Empty:
+            pass
+        return commands
+    
+    #
+    # A relay command sets all of the relays, so only the latest of a batch of relay
+    # commands matters. We drop the earlier ones, and keep the other commands in order.
+    #
+    def coalesceCommands(self,commands):
+        relayCommands = [command for command in commands if command.isRelayCommand]
+        self.relayCommandsReceived = self.relayCommandsReceived + len(relayCommands)
+        if len(relayCommands) > 1:
+            logging.debug("Collapsing %d relay commands" % len(relayCommands))
+            self.relayCommandsCollapsed = self.relayCommandsCollapsed + len(relayCommands) - 1
+        return [command for command in commands if not command.isRelayCommand or command is relayCommands[-1]]
+    
+    #
+    # Any commands that queued up while we were busy are executed together, so that the
+    # lights go straight to the latest state.
+    #
+    def executePendingCommands(self):
+        commands = self.pendingCommands()
+        if commands:
+            logging.debug("Executing %d commands" % len(commands))
+            for command in self.coalesceCommands(commands):
+                command.executeOn(self)
+    
+    #
+    # run is effectively the main method for a single EasyDaqRelay. It runs us on a loop of our own
+    #
+    def run(self):
+        EasyDaqRelayLoop([self]).run()
+    
+    def stop(self):
+        self.queueCommand(EasyDaqUSBStop())
+     
+     
+#
+# The relay loop runs any number of EasyDaqUSBRelay boards on one thread. It runs each
+# board's due timers, then waits on the shared wake queue until the earliest timer of any
+# board is due. When a board is sent a command, the board puts itself on the wake queue,
+# and the loop executes that board's commands. The loop ends when every board has been
+# stopped.
+#
+class EasyDaqRelayLoop:
+    
+    def __init__(self, relays=None):
+        self.wakeQueue = Queue.Queue()
+        self.relays = []
+        for relay in relays or []:
+            self.addRelay(relay)
+    
+    #
+    # Add a relay before the loop is run
+    #
+    def addRelay(self, relay):
+        relay.wakeQueue = self.wakeQueue
+        self.relays.append(relay)
         
+    def runningRelays(self):
+        return [relay for relay in self.relays if relay.isRunning]
+    
+    def secondsToNextTimer(self):
+        return min([relay.secondsToNextTimer() for relay in self.runningRelays()])
     
     #
-    # run is effectively the main method for the EasyDaqRelay
+    # Take the relays waiting on the wake queue, without blocking
     #
+    def pendingWakeUps(self):
+        relays = []
+        try:
+            while True:
+                relays.append(self.wakeQueue.get(block=False))
+        except Queue.Empty:
+            pass
+        return relays
+    
+    def executeCommandsOf(self, relays):
+        for relay in self.runningRelays():
+            if relay in relays:
+                relay.executePendingCommands()
+                # a board that has just been stopped writes what it has queued and is disconnected
+                # now, while the others carry on
+                if not relay.isRunning:
+                    relay.drainOutgoingPackets()
+                    relay.disconnect()
+        
     def run(self):
-        self.isRunning = True
-        self._connect()
-        while self.isRunning:
+        for relay in self.relays:
+            relay.isRunning = True
+            relay._connect()
+        # commands may have been sent before we started
+        self.executeCommandsOf(self.relays)
+        
+        while self.runningRelays():
+            for relay in self.runningRelays():
+                relay.runDueTimers()
             
-            # get the next command from the command queue. If we don't get a command after five seconds
-            # maintain our session
             try:
-                logging.debug("Waiting for next command on command queue.")
-                nextCommand = self.commandQueue.get(timeout=5)
-                logging.debug("Return from command queue")
-                nextCommand.executeOn(self)
+                wokenRelay = self.wakeQueue.get(timeout=self.secondsToNextTimer())
+                logging.debug("Return from wake queue")
+                self.executeCommandsOf([wokenRelay] + self.pendingWakeUps())
             except Queue.Empty:
-                logging.debug("Timeout on command queue. Maintaining session.")
-                self.maintainSession()
-        self.disconnect()
-    
+                pass
+        
     def stop(self):
-        self.commandQueue.put(EasyDaqUSBStop())
+        for relay in self.relays:
+            relay.stop()
      
                 
 #
@@ -372,6 +664,9 @@ class EasyDaqUSBRelay:
 #            
 class EasyDaqUSBCommand:
     
+    # does this command set the relays? If so, a later one replaces it
+    isRelayCommand = False
+    
     #
     # command has one abstract method - execute method taking an
     # EasyDaqUSBRelay as a parameter
@@ -388,11 +683,16 @@ class EasyDaqUSBStop(EasyDaqUSBCommand):
         aRelay.isRunning = False        
 
 class EasyDaqUSBSendRelayCommand(EasyDaqUSBCommand):
+    
+    isRelayCommand = True
+    
     def __init__(self,relayArray):
         self.relayArray = relayArray
+        # when we were sent, to measure how long we take to reach the board
+        self.sentSeconds = monotonicSeconds()
     
     def executeOn(self,aRelay):
-        aRelay._sendRelayCommand(self.relayArray)
+        aRelay._sendRelayCommand(self.relayArray, self.sentSeconds)
         
         
 class EasyDaqUSBSendRelayConfiguration(EasyDaqUSBCommand):
@@ -0,0 +1,171 @@
+'''
+Created on 17 Oct 2026
+'''
+import unittest
+import threading
+import time
+
+import lightsui.hardware
+from lightsui.hardware import EasyDaqUSBRelay, EasyDaqRelayLoop
+from lightsui.transport import SimulatedEasyDaqTransport
+
+
+class EasyDaqUSBRelayTest(unittest.TestCase):
+
+    def setUp(self):
+        # we don't need to wait for a simulated board to settle
+        self.settleSeconds = lightsui.hardware.SETTLE_SECONDS
+        self.reconnectSeconds = lightsui.hardware.RECONNECT_SECONDS
+        lightsui.hardware.SETTLE_SECONDS = 0.05
+        lightsui.hardware.RECONNECT_SECONDS = 0.2
+
+        self.transport = SimulatedEasyDaqTransport()
+        self.relay = EasyDaqUSBRelay("simulator", self.transport)
+        self.relayThread = threading.Thread(target=self.relay.run)
+        self.relayThread.daemon = True
+        self.relayThread.start()
+        self.waitFor(self.relay.isConnected)
+
+    def tearDown(self):
+        self.relay.stop()
+        self.relayThread.join(1)
+        lightsui.hardware.SETTLE_SECONDS = self.settleSeconds
+        lightsui.hardware.RECONNECT_SECONDS = self.reconnectSeconds
+
+    def waitFor(self, condition, seconds=2):
+        endTime = time.time() + seconds
+        while not condition() and time.time() < endTime:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def testRelayCommandIsVerified(self):
+        self.relay.sendRelayCommand([1, 1, 0, 0, 0])
+
+        self.waitFor(lambda: self.relay.verifiedRelayValue == 3)
+        self.assertEqual(self.transport.relayValue, 3)
+        self.assertEqual(sum(self.relay.verificationLatencyHistogram), 1)
+        self.assertEqual(self.transport.packetsIgnored, 0)
+
+    def testBacklogCollapsesToLatestState(self):
+        for i in range(20):
+            self.relay.sendRelayCommand([i % 2, 0, 0, 0, 1])
+
+        self.waitFor(lambda: self.relay.verifiedRelayValue == 17)
+        relayPackets = [packet for (packet, arrivedSeconds) in self.transport.packetsReceived if packet[0] == 'C']
+        self.assertTrue(len(relayPackets) <= 2)
+        self.assertEqual(self.relay.relayCommandsReceived, 20)
+
+    def testChangeDoesNotWaitBehindStatusRequest(self):
+        self.relay.sendRelayCommand([1, 1, 1, 1, 1])
+        self.waitFor(lambda: self.transport.relayValue == 31)
+        # a second change within one packet spacing of the first
+        time.sleep(lightsui.hardware.PACKET_SPACING_SECONDS / 2)
+        self.relay.sendRelayCommand([1, 1, 1, 1, 0])
+
+        self.waitFor(lambda: self.relay.verifiedRelayValue == 15)
+        packets = [packet for (packet, arrivedSeconds) in self.transport.packetsReceived]
+        firstChange = packets.index('C' + chr(31))
+        self.assertEqual(packets[firstChange + 1], 'C' + chr(15))
+
+    def testLightsOffIsWrittenBeforeStopping(self):
+        self.relay.sendRelayCommand([1, 1, 1, 1, 1])
+        self.waitFor(lambda: self.transport.relayValue == 31)
+
+        # as the screen controller does when it shuts down
+        self.relay.sendRelayCommand([0, 0, 0, 0, 0])
+        self.relay.stop()
+        self.relayThread.join(1)
+
+        self.assertFalse(self.relayThread.isAlive())
+        self.assertEqual(self.transport.relayValue, 0)
+        self.assertEqual(self.relay.outgoingPackets, [])
+
+    def testReconnectRestoresLights(self):
+        self.relay.sendRelayCommand([1, 1, 1, 1, 1])
+        self.waitFor(lambda: self.relay.verifiedRelayValue == 31)
+
+        self.transport.pullCable()
+        self.relay.sendRelayCommand([1, 1, 1, 1, 0])
+        self.waitFor(self.relay.isReconnecting)
+        self.transport.relayValue = 0
+        self.transport.plugInCable()
+
+        self.waitFor(lambda: self.relay.verifiedRelayValue == 15)
+        self.assertTrue(self.relay.isConnected())
+        self.assertEqual(self.transport.relayValue, 15)
+
+    def testCommandSentWhileSettlingReachesBoard(self):
+        transport = SimulatedEasyDaqTransport()
+        relay = EasyDaqUSBRelay("simulator", transport)
+        relayThread = threading.Thread(target=relay.run)
+        relayThread.daemon = True
+        relayThread.start()
+        try:
+            relay.sendRelayCommand([1, 0, 1, 0, 0])
+            self.assertFalse(relay.isConnected())
+
+            self.waitFor(lambda: relay.verifiedRelayValue == 5)
+            self.assertEqual(transport.relayValue, 5)
+        finally:
+            relay.stop()
+            relayThread.join(1)
+
+
+class EasyDaqRelayLoopTest(unittest.TestCase):
+
+    def setUp(self):
+        self.settleSeconds = lightsui.hardware.SETTLE_SECONDS
+        lightsui.hardware.SETTLE_SECONDS = 0.05
+
+        self.transports = [SimulatedEasyDaqTransport(), SimulatedEasyDaqTransport()]
+        self.relays = [EasyDaqUSBRelay("simulator", transport) for transport in self.transports]
+        self.relayLoop = EasyDaqRelayLoop(self.relays)
+        self.relayThread = threading.Thread(target=self.relayLoop.run)
+        self.relayThread.daemon = True
+        self.relayThread.start()
+        self.waitFor(lambda: all([relay.isConnected() for relay in self.relays]))
+
+    def tearDown(self):
+        self.relayLoop.stop()
+        self.relayThread.join(1)
+        lightsui.hardware.SETTLE_SECONDS = self.settleSeconds
+
+    def waitFor(self, condition, seconds=2):
+        endTime = time.time() + seconds
+        while not condition() and time.time() < endTime:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def testBoardsShareOneThread(self):
+        self.relays[0].sendRelayCommand([1, 0, 0, 0, 0])
+        self.relays[1].sendRelayCommand([0, 1, 0, 0, 0])
+
+        self.waitFor(lambda: [relay.verifiedRelayValue for relay in self.relays] == [1, 2])
+        self.assertEqual([transport.relayValue for transport in self.transports], [1, 2])
+        self.assertEqual([relay.commandToWireCount for relay in self.relays], [1, 1])
+
+    def testShutdownTurnsEveryBoardOff(self):
+        for relay in self.relays:
+            relay.sendRelayCommand([1, 1, 1, 1, 1])
+        self.waitFor(lambda: [transport.relayValue for transport in self.transports] == [31, 31])
+
+        # as the screen controller does for each lights board when it shuts down
+        for relay in self.relays:
+            relay.sendRelayCommand([0, 0, 0, 0, 0])
+            relay.stop()
+        self.relayThread.join(2)
+
+        self.assertFalse(self.relayThread.isAlive())
+        self.assertEqual([transport.relayValue for transport in self.transports], [0, 0])
+
+    def testStoppingOneBoardLeavesTheOtherRunning(self):
+        self.relays[0].stop()
+        self.waitFor(lambda: not self.relays[0].isRunning)
+
+        self.relays[1].sendRelayCommand([0, 0, 1, 0, 0])
+        self.waitFor(lambda: self.relays[1].verifiedRelayValue == 4)
+        self.assertTrue(self.relayThread.isAlive())
+
+
+if __name__ == "__main__":
+    unittest.main()
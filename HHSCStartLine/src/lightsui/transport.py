@@ -0,0 +1,153 @@
+'''
+Created on 17 Oct 2026
+
+A relay transport carries packets between the EasyDaqUSBRelay and the relay board. The
+serial transport talks to a real board through pyserial. The simulated transport is an
+EasyDaq board in memory, so that the relay can be tested and benchmarked without one.
+'''
+import logging
+
+from model.utils import monotonicSeconds
+
+
+class TransportException(Exception):
+    def __init__(self, message):
+        self.message = message
+    def __str__(self):
+        return self.message
+
+
+#
+# The interface that the EasyDaqUSBRelay uses. Reads never wait: they return the
+# byte that has arrived, or an empty string if nothing has. Any failure raises
+# a TransportException.
+#
+class RelayTransport:
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def isOpen(self):
+        return False
+
+    def write(self, packet):
+        pass
+
+    def read(self):
+        return ''
+
+
+#
+# A transport over a serial port. On windows, the port name will be COM3, COM4 etc.
+#
+class SerialTransport(RelayTransport):
+
+    def __init__(self, serialPortName):
+        # we only need pyserial if we are talking to a real board
+        import serial
+        self.serial = serial
+
+        # timeout is set to 0 for reads, so that a read returns whatever has arrived without waiting.
+        self.serialConnection = serial.Serial(timeout=0)
+
+        # and tell the serial connection which serial port to connect
+        self.serialConnection.port = serialPortName
+
+        # the baud rate is always 9600
+        self.serialConnection.baudrate = 9600
+
+    def open(self):
+        try:
+            self.serialConnection.open()
+        except (self.serial.SerialException, ValueError) as e:
+            raise TransportException("I/O error: {0}".format(e))
+
+    def close(self):
+        self.serialConnection.close()
+
+    def isOpen(self):
+        return self.serialConnection.isOpen()
+
+    def write(self, packet):
+        try:
+            self.serialConnection.write(packet)
+        except (self.serial.SerialException, ValueError) as e:
+            raise TransportException("I/O error: {0}".format(e))
+
+    def read(self):
+        try:
+            return self.serialConnection.read()
+        except (self.serial.SerialException, ValueError) as e:
+            raise TransportException("I/O error: {0}".format(e))
+
+
+#
+# An EasyDaq relay board in memory. It keeps the state of its relays, replies to
+# status requests, and ignores packets that arrive less than packetSpacingSeconds
+# after the previous packet, as the real board can. Pull the cable to make it fail
+# until the cable is plugged back in.
+#
+class SimulatedEasyDaqTransport(RelayTransport):
+
+    def __init__(self, packetSpacingSeconds=0.1):
+        self.packetSpacingSeconds = packetSpacingSeconds
+        self.isPortOpen = False
+        self.isCablePulled = False
+        self.relayValue = 0
+        self.configurationValue = None
+        self.replies = ''
+        self.lastPacketSeconds = None
+
+        # each packet the board has accepted, with the monotonic seconds it arrived
+        self.packetsReceived = []
+        self.packetsIgnored = 0
+
+    def pullCable(self):
+        self.isCablePulled = True
+
+    def plugInCable(self):
+        self.isCablePulled = False
+
+    def checkCable(self):
+        if self.isCablePulled:
+            self.isPortOpen = False
+            raise TransportException("I/O error: relay board disconnected")
+
+    def open(self):
+        self.checkCable()
+        self.isPortOpen = True
+
+    def close(self):
+        self.isPortOpen = False
+
+    def isOpen(self):
+        return self.isPortOpen
+
+    def write(self, packet):
+        self.checkCable()
+        if not self.isPortOpen:
+            raise TransportException("I/O error: port not open")
+
+        now = monotonicSeconds()
+        if self.lastPacketSeconds is not None and now - self.lastPacketSeconds < self.packetSpacingSeconds:
+            logging.debug("Simulated relay ignoring packet sent too soon")
+            self.packetsIgnored = self.packetsIgnored + 1
+            return
+        self.lastPacketSeconds = now
+        self.packetsReceived.append((packet, now))
+
+        if packet[0] == 'C':
+            self.relayValue = ord(packet[1])
+        elif packet[0] == 'B':
+            self.configurationValue = ord(packet[1])
+        elif packet[0] == 'A':
+            self.replies = self.replies + chr(self.relayValue)
+
+    def read(self):
+        self.checkCable()
+        reply = self.replies[:1]
+        self.replies = self.replies[1:]
+        return reply
@@ -0,0 +1,115 @@
+'''
+Created on 17 Oct 2026
+
+Benchmark of the finish store. Creates 100,000 finishes, two thirds of them with a fleet, and
+compares the memory they take and the time to pickle and unpickle them with the same finishes
+kept as we used to keep them: a list of Finish objects, each with its own __dict__, datetime and
+finish id string, and a dict of them by finish id.
+
+The memory is what sys.getsizeof says about the objects that hold the finishes (not the fleets,
+which both share), so it is an estimate, but the same estimate for both.
+
+Run from the src directory:
+
+PYTHONPATH=. python model/benchmarkfinishstore.py
+'''
+import datetime
+import pickle
+import random
+import sys
+import time
+
+from model.race import RaceManager, Fleet
+
+NUMBER_FINISHES = 100000
+NUMBER_FLEETS = 6
+
+
+#
+# A finish as it was before we had finish stores
+#
+class DictFinish:
+
+    def __init__(self, finishTime=None, fleet=None, finishId=None):
+        self.fleet = fleet
+        self.finishTime = finishTime
+        self.finishId = str(finishId)
+
+
+def createFinishes():
+    random.seed(1)
+    fleets = [Fleet(name="Fleet %d" % (i + 1), fleetId=i + 1) for i in range(NUMBER_FLEETS)]
+    finishTime = datetime.datetime(2014, 7, 29, 11, 15)
+    finishes = []
+    for i in range(NUMBER_FINISHES):
+        finishTime = finishTime + datetime.timedelta(microseconds=random.randint(0, 2000000))
+        finishes.append((finishTime, random.choice(fleets + [None, None, None])))
+    return (fleets, finishes)
+
+def createRaceManager(fleets, finishes):
+    raceManager = RaceManager()
+    for fleet in fleets:
+        raceManager.addFleet(fleet)
+    for (finishTime, fleet) in finishes:
+        raceManager.createFinish(fleet=fleet, finishTime=finishTime)
+    return raceManager
+
+def createDictFinishes(finishes):
+    dictFinishes = [DictFinish(finishTime=finishTime, fleet=fleet, finishId=i + 1)
+                    for (i, (finishTime, fleet)) in enumerate(finishes)]
+    return (dictFinishes, dict([(finish.finishId, finish) for finish in dictFinishes]))
+
+def dictFinishesBytes(dictFinishes, finishesById):
+    return (sys.getsizeof(dictFinishes) + sys.getsizeof(finishesById) +
+            sum([sys.getsizeof(finish) + sys.getsizeof(finish.__dict__) +
+                 sys.getsizeof(finish.finishTime) + sys.getsizeof(finish.finishId)
+                 for finish in dictFinishes]))
+
+def finishStoreBytes(store):
+    columnsBytes = sum([sys.getsizeof(column) for column in [store.finishMicroseconds, store.fleetIndexes, store.finishIds]])
+    viewsBytes = sum([sys.getsizeof(finish) for finish in store.finishViews if finish is not None])
+    return columnsBytes + sys.getsizeof(store.finishViews) + viewsBytes
+
+#
+# The seconds to pickle and unpickle something, and the size of its pickle
+#
+def timePickle(anObject, protocol):
+    startSeconds = time.time()
+    pickled = pickle.dumps(anObject, protocol)
+    pickleSeconds = time.time() - startSeconds
+    startSeconds = time.time()
+    pickle.loads(pickled)
+    unpickleSeconds = time.time() - startSeconds
+    return (pickleSeconds, unpickleSeconds, len(pickled))
+
+def benchmark():
+    (fleets, finishes) = createFinishes()
+    (dictFinishes, finishesById) = createDictFinishes(finishes)
+    raceManager = createRaceManager(fleets, finishes)
+    store = raceManager.finishes
+    # createFinish makes a Finish for each finish, which the user interface would hold on to
+    # for a few of them at most
+    store.finishViews = [None] * len(store)
+
+    print "%d finishes" % NUMBER_FINISHES
+    print "%-44s %10s %14s" % ("memory", "bytes", "bytes/finish")
+    for (name, numberBytes) in [("list and dict of Finish objects", dictFinishesBytes(dictFinishes, finishesById)),
+                                ("finish store", finishStoreBytes(store))]:
+        print "%-44s %10d %14.1f" % (name, numberBytes, float(numberBytes) / NUMBER_FINISHES)
+    list(store)
+    numberBytes = finishStoreBytes(store)
+    print "%-44s %10d %14.1f" % ("finish store, every Finish made", numberBytes, float(numberBytes) / NUMBER_FINISHES)
+    store.finishViews = [None] * len(store)
+
+    print
+    print "%-44s %10s %14s %12s" % ("pickle", "pickle ms", "unpickle ms", "bytes")
+    for protocol in [0, pickle.HIGHEST_PROTOCOL]:
+        for (name, anObject) in [("list and dict of Finish objects", (fleets, dictFinishes, finishesById)),
+                                 ("race manager", raceManager)]:
+            (pickleSeconds, unpickleSeconds, numberBytes) = timePickle(anObject, protocol)
+            print "%-44s %10.1f %14.1f %12d" % ("%s, protocol %d" % (name, protocol),
+                pickleSeconds * 1000, unpickleSeconds * 1000, numberBytes)
+
+
+if __name__ == '__main__':
+    benchmark()
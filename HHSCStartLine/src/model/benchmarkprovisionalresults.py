@@ -0,0 +1,61 @@
+'''
+Created on 17 Oct 2026
+
+Benchmark of the provisional results. Creates 10,000 finishes one after another, as the
+race officer presses "Gun and finish", assigns each to a random fleet, as the race officer
+presses a fleet button, and reads the finish's provisional position. Compares the race
+manager's incremental results with sorting the fleet's finishes after every finish.
+
+Run from the src directory:
+
+PYTHONPATH=. python model/benchmarkprovisionalresults.py
+'''
+import datetime
+import random
+import time
+
+from model.race import RaceManager, FixedClock
+
+NUMBER_FINISHES = 10000
+NUMBER_FLEETS = 6
+
+
+def createRaceManager():
+    RaceManager.clock = FixedClock(datetime.datetime(2014, 7, 29, 11, 15))
+    raceManager = RaceManager()
+    for i in range(NUMBER_FLEETS):
+        raceManager.createFleet()
+    raceManager.startRaceSequenceWithoutWarning()
+    return raceManager
+
+#
+# Finish and assign every boat, calling positionOf for the position of each finish. Returns
+# the seconds taken.
+#
+def finishBoats(raceManager, positionOf):
+    random.seed(1)
+    startSeconds = time.time()
+    for i in range(NUMBER_FINISHES):
+        RaceManager.clock.advance(random.uniform(0, 1))
+        finish = raceManager.createFinish()
+        finish.fleet = random.choice(raceManager.fleets)
+        raceManager.updateFinish(finish)
+        positionOf(raceManager, finish)
+    return time.time() - startSeconds
+
+def sortedPosition(raceManager, finish):
+    store = raceManager.finishes
+    fleetIndex = store.fleetIndexes[finish.index]
+    fleetRows = sorted([row for row in xrange(len(store)) if store.fleetIndexes[row] == fleetIndex],
+                       key=lambda row: (store.finishMicroseconds[row], store.finishIds[row]))
+    return fleetRows.index(finish.index) + 1
+
+def benchmark():
+    for (name, positionOf) in [("incremental", RaceManager.provisionalPosition), ("sort every finish", sortedPosition)]:
+        seconds = finishBoats(createRaceManager(), positionOf)
+        print "%-18s %d finishes: %7.2f seconds, %7.1f us per finish" % (
+            name, NUMBER_FINISHES, seconds, seconds * 1000000 / NUMBER_FINISHES)
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,59 @@
+'''
+Created on 17 Oct 2026
+
+Benchmark of the Portsmouth Yardstick results. Ranks 2,000 finished boats, as one
+fleet and split across six fleets, with plain lists and (if it is installed) numpy.
+
+Run from the src directory:
+
+PYTHONPATH=. python model/benchmarkresults.py
+'''
+import datetime
+import random
+import timeit
+
+import model.results
+from model.race import RaceManager, Boat
+from model.results import rankPyResults
+
+NUMBER_BOATS = 2000
+NUMBER_FLEETS = 6
+REPEATS = 5
+
+
+def createBoats(raceManager, fleets):
+    boats = []
+    for i in range(NUMBER_BOATS):
+        fleet = fleets[i % len(fleets)]
+        boat = Boat(str(i), "dinghy", random.randint(850, 1450))
+        boat.finish = raceManager.createFinish(fleet=fleet,
+                                               finishTime=fleet.startTime + datetime.timedelta(seconds=random.uniform(2400, 5400)))
+        fleet.boats.append(boat)
+        boats.append(boat)
+    return boats
+
+def millisToRank(fleets, useNumpy):
+    seconds = min(timeit.repeat(lambda: [rankPyResults(fleet.boats, useNumpy) for fleet in fleets], number=1, repeat=REPEATS))
+    return seconds * 1000
+
+def benchmark():
+    start = datetime.datetime(2014, 7, 29, 11, 15)
+    raceManager = RaceManager()
+    oneFleet = [raceManager.createFleet("Large handicap")]
+    oneFleet[0].startTime = start
+    sixFleets = [raceManager.createFleet("Fleet %d" % i) for i in range(NUMBER_FLEETS)]
+    for fleet in sixFleets:
+        fleet.startTime = start
+    createBoats(raceManager, oneFleet)
+    createBoats(raceManager, sixFleets)
+
+    engines = [("lists", False)]
+    if model.results.numpy is not None:
+        engines.append(("numpy", True))
+    for (name, useNumpy) in engines:
+        print "%-6s %d boats in one fleet: %6.1f ms, in %d fleets: %6.1f ms" % (
+            name, NUMBER_BOATS, millisToRank(oneFleet, useNumpy), NUMBER_FLEETS, millisToRank(sixFleets, useNumpy))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,67 @@
+'''
+Created on 17 Oct 2026
+
+Benchmark of series scoring. Scores a 30 race series of 300 boats, then corrects one
+finish and rescores, with each race keeping its points and with every race rescored.
+
+Run from the src directory:
+
+PYTHONPATH=. python model/benchmarkseries.py
+'''
+import datetime
+import random
+import timeit
+
+from model.race import RaceManager, Boat
+from model.series import Series, SeriesRace
+
+NUMBER_RACES = 30
+NUMBER_BOATS = 300
+REPEATS = 5
+
+
+def createSeries():
+    random.seed(1)
+    start = datetime.datetime(2014, 7, 29, 11, 15)
+    raceManager = RaceManager()
+    fleet = raceManager.createFleet("Large handicap")
+    fleet.startTime = start
+    pys = [random.randint(850, 1450) for i in range(NUMBER_BOATS)]
+
+    series = Series("Winter series")
+    for raceNumber in range(NUMBER_RACES):
+        boats = []
+        # most boats sail most races
+        for boatNumber in random.sample(range(NUMBER_BOATS), NUMBER_BOATS * 9 / 10):
+            boat = Boat(str(boatNumber), "dinghy", pys[boatNumber])
+            boat.finish = raceManager.createFinish(fleet=fleet,
+                finishTime=start + datetime.timedelta(seconds=random.uniform(2400, 5400)))
+            boats.append(boat)
+        series.addRace(SeriesRace("Race %d" % (raceNumber + 1), boats))
+    return series
+
+#
+# Correct the finish time of a boat in a race and rescore the series
+#
+def correctFinish(series, rescoreEveryRace):
+    race = random.choice(series.races)
+    boat = random.choice(race.boats)
+    boat.finish.finishTime = boat.finish.finishTime + datetime.timedelta(seconds=random.uniform(-30, 30))
+    if rescoreEveryRace:
+        for aRace in series.races:
+            series.raceChanged(aRace)
+    else:
+        series.raceChanged(race)
+    series.standings()
+
+def benchmark():
+    series = createSeries()
+    print "first scoring of %d races, %d boats: %.1f ms" % (
+        NUMBER_RACES, NUMBER_BOATS, 1000 * timeit.timeit(series.standings, number=1))
+    for (name, rescoreEveryRace) in [("rescore the corrected race", False), ("rescore every race", True)]:
+        seconds = min(timeit.repeat(lambda: correctFinish(series, rescoreEveryRace), number=1, repeat=REPEATS))
+        print "%-28s %.1f ms" % (name, seconds * 1000)
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,67 @@
+'''
+Created on 17 Oct 2026
+
+Benchmark of finding the next finish without a fleet, which we do every time the race officer
+clicks a fleet button. Creates 20,000 finishes with all but every 100th already given a fleet,
+and times clicking through the rest, comparing the race manager's index of unassigned finishes
+with finding the finish in a list of finishes and scanning forward from it, as we used to.
+
+Run from the src directory:
+
+PYTHONPATH=. python model/benchmarkunassignedfinishes.py
+'''
+import datetime
+import time
+
+from model.race import RaceManager, FixedClock
+
+NUMBER_FINISHES = 20000
+UNASSIGNED_EVERY = 100
+
+
+def createRaceManager():
+    RaceManager.clock = FixedClock(datetime.datetime(2014, 7, 29, 11, 15))
+    raceManager = RaceManager()
+    fleet = raceManager.createFleet()
+    for i in range(NUMBER_FINISHES):
+        finish = raceManager.createFinish()
+        if i % UNASSIGNED_EVERY != 0:
+            finish.fleet = fleet
+            raceManager.updateFinish(finish)
+    return raceManager
+
+def scannedNextFinishWithoutFleetAfter(finishes, finish):
+    for i in range(finishes.index(finish) + 1, len(finishes)):
+        if not finishes[i].hasFleet():
+            return finishes[i]
+    return None
+
+#
+# Click a fleet button for every finish without a fleet, finding the next one with
+# nextFinishWithoutFleetAfter. Returns the seconds taken and the number of clicks.
+#
+def clickThrough(raceManager, nextFinishWithoutFleetAfter):
+    fleet = raceManager.fleets[0]
+    finish = raceManager.firstFinishWithoutFleet()
+    clicks = 0
+    startSeconds = time.time()
+    while finish:
+        finish.fleet = fleet
+        raceManager.updateFinish(finish)
+        finish = nextFinishWithoutFleetAfter(finish)
+        clicks += 1
+    return (time.time() - startSeconds, clicks)
+
+def benchmark():
+    raceManager = createRaceManager()
+    (seconds, clicks) = clickThrough(raceManager, raceManager.nextFinishWithoutFleetAfter)
+    print "%-22s %d clicks: %7.1f us per click" % ("unassigned index", clicks, seconds * 1000000 / clicks)
+
+    raceManager = createRaceManager()
+    finishes = list(raceManager.finishes)
+    (seconds, clicks) = clickThrough(raceManager, lambda finish: scannedNextFinishWithoutFleetAfter(finishes, finish))
+    print "%-22s %d clicks: %7.1f us per click" % ("list index and scan", clicks, seconds * 1000000 / clicks)
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -25,8 +25,13 @@
 #
 
 from datetime import datetime,timedelta
-from utils import Signal
+from utils import Signal, monotonicSeconds
+from results import ProvisionalResults
+from contextlib import contextmanager
+from array import array
 import logging
+import bisect
+import math
 
 
 # As per ISAF rules, start minutes is 5
@@ -36,6 +41,23 @@ import logging
 START_SECONDS=300
 WARNING_SECONDS=300
 
+# the number of warning beeps, one a second, before each gun
+WARNING_BEEPS=10
+
+#
+# The lights display for the next fleet to start. Each pattern is shown while the
+# seconds to start are at most the first threshold and more than the next one. In the
+# last FLASHING_SECONDS, the first light flashes once a second.
+#
+NO_LIGHTS = [0, 0, 0, 0, 0]
+LIGHTS_PATTERNS = [
+    (300, [1, 1, 1, 1, 1]),
+    (240, [1, 1, 1, 1, 0]),
+    (180, [1, 1, 1, 0, 0]),
+    (120, [1, 1, 0, 0, 0]),
+    (60, [1, 0, 0, 0, 0])]
+FLASHING_SECONDS = 30
+
 class RaceException(Exception):
     def __init__(self, fleet, message):
         self.fleet = fleet
@@ -44,6 +66,91 @@ class RaceException(Exception):
         return repr(self.fleet)+ self.message
 
 
+#
+# The clock that the model reads the time from. Everything in the model that
+# depends on the time of day asks RaceManager.clock for it, rather than calling
+# datetime.now() itself.
+#
+# A controller that looks at several fleets in one go (refreshing the fleets
+# view, working out the lights, scheduling guns) should do it inside a tick:
+#
+#    with RaceManager.clock.tick():
+#        ...
+#
+# Within a tick, the clock reads the same time however often it is asked, so all
+# the fleets are judged against one timestamp and we only read the system clock
+# once. Ticks can be nested; the outermost tick decides the time.
+#
+class Clock:
+    
+    def __init__(self):
+        self.tickTime = None
+        self.tickDepth = 0
+        
+    #
+    # The current time, ignoring any tick. Subclasses override this.
+    #
+    def currentTime(self):
+        return datetime.now()
+        
+    def now(self):
+        if self.tickTime is None:
+            return self.currentTime()
+        else:
+            return self.tickTime
+        
+    def beginTick(self):
+        if self.tickDepth == 0:
+            self.tickTime = self.currentTime()
+        self.tickDepth = self.tickDepth + 1
+        return self.tickTime
+    
+    def endTick(self):
+        self.tickDepth = self.tickDepth - 1
+        if self.tickDepth == 0:
+            self.tickTime = None
+            
+    @contextmanager
+    def tick(self):
+        now = self.beginTick()
+        try:
+            yield now
+        finally:
+            self.endTick()
+
+#
+# A clock that never goes backwards, even if the laptop's clock is changed. It
+# reads the time of day once, when it is created, and then adds the time elapsed
+# since on a monotonic clock.
+#
+class MonotonicClock(Clock):
+    
+    def __init__(self):
+        Clock.__init__(self)
+        self.startTime = datetime.now()
+        self.startSeconds = monotonicSeconds()
+        
+    def currentTime(self):
+        return self.startTime + timedelta(seconds=monotonicSeconds() - self.startSeconds)
+
+#
+# A clock that only moves when it is told to. Use it to make the model
+# deterministic when replaying or benchmarking.
+#
+class FixedClock(Clock):
+    
+    def __init__(self, time=None):
+        Clock.__init__(self)
+        if time is None:
+            time = datetime.now()
+        self.time = time
+        
+    def currentTime(self):
+        return self.time
+    
+    def advance(self, seconds):
+        self.time = self.time + timedelta(seconds=seconds)
+
 
 class Boat:
     
@@ -93,7 +200,7 @@ class Fleet:
     #
     def isStarted(self):
         if self.hasStartTime():
-            return datetime.now() > self.startTime
+            return RaceManager.clock.now() > self.startTime
             
         else:
             return False
@@ -115,7 +222,7 @@ class Fleet:
     #
     def _deltaToStartTime(self):
         if self.hasStartTime():
-            return datetime.now() - self.startTime
+            return RaceManager.clock.now() - self.startTime
         else:
             raise RaceException(self, "Fleet has no start time")
 
@@ -152,6 +259,177 @@ class Fleet:
         return self.name + " status: " + self.status()
 
 
+#
+# Finish times are stored as microseconds since EPOCH
+#
+EPOCH = datetime(1970, 1, 1)
+
+def datetimeToMicroseconds(aDatetime):
+    delta = aDatetime - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+def microsecondsToDatetime(microseconds):
+    return EPOCH + timedelta(microseconds=microseconds)
+
+# the fleet index of a finish with no fleet
+NO_FLEET = -1
+
+#
+# FinishStore holds finishes in columns: the finish time in microseconds, the index of the fleet in
+# our fleets list and the finish id of each finish, in arrays of machine numbers. An open meeting
+# or a long pursuit race can have tens of thousands of finishes, and a Finish object with its own
+# __dict__, datetime and id string costs several hundred bytes, where a row of the store costs 16.
+#
+# The store behaves as a list of finishes. The Finish for a row is only made when it is asked for,
+# and then kept, so the same row always gives the same Finish.
+#
+class FinishStore:
+
+    def __init__(self):
+        self.finishMicroseconds = array("d")
+        self.fleetIndexes = array("i")
+        self.finishIds = array("i")
+        self.fleets = []
+        self.finishViews = []
+        # finish ids are usually added in ascending order, so we can find a finish by its id with a binary search
+        self.isIdOrdered = True
+
+    #
+    # The finish views are made again when they are needed, so we don't pickle them. Arrays are
+    # pickled as strings, which is much quicker than pickling a list of numbers.
+    #
+    def __getstate__(self):
+        attributes = self.__dict__.copy()
+        del attributes["finishViews"]
+        for column in ["finishMicroseconds", "fleetIndexes", "finishIds"]:
+            attributes[column] = attributes[column].tostring()
+        return attributes
+
+    def __setstate__(self, d):
+        self.__dict__ = d
+        for (column, typecode) in [("finishMicroseconds", "d"), ("fleetIndexes", "i"), ("finishIds", "i")]:
+            values = array(typecode)
+            values.fromstring(d[column])
+            setattr(self, column, values)
+        self.finishViews = [None] * len(self.finishIds)
+
+    def __len__(self):
+        return len(self.finishIds)
+
+    def __iter__(self):
+        for index in xrange(len(self.finishIds)):
+            yield self.finishAt(index)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.finishAt(i) for i in xrange(*index.indices(len(self.finishIds)))]
+        if index < 0:
+            index = index + len(self.finishIds)
+        if not 0 <= index < len(self.finishIds):
+            raise IndexError("finish index out of range")
+        return self.finishAt(index)
+
+    def finishAt(self, index):
+        finish = self.finishViews[index]
+        if finish is None:
+            finish = Finish.__new__(Finish)
+            finish.store = self
+            finish.index = index
+            self.finishViews[index] = finish
+        return finish
+
+    #
+    # The position of a finish in the store
+    #
+    def index(self, finish):
+        if finish.store is self:
+            return finish.index
+        raise ValueError("finish is not in the store")
+
+    def appendRow(self, finishMicroseconds, fleet, finishId):
+        if self.finishIds and finishId <= self.finishIds[-1]:
+            self.isIdOrdered = False
+        self.finishMicroseconds.append(finishMicroseconds)
+        self.fleetIndexes.append(self.fleetIndexOf(fleet))
+        self.finishIds.append(finishId)
+        self.finishViews.append(None)
+        return len(self.finishIds) - 1
+
+    #
+    # Add a finish from another store, typically the store of a finish that has just been made. The
+    # finish becomes the view of its new row.
+    #
+    def adopt(self, finish):
+        index = self.appendRow(finish.store.finishMicroseconds[finish.index], finish.fleet,
+                               finish.store.finishIds[finish.index])
+        finish.store = self
+        finish.index = index
+        self.finishViews[index] = finish
+
+    def fleetIndexOf(self, fleet):
+        if fleet is None:
+            return NO_FLEET
+        for (fleetIndex, aFleet) in enumerate(self.fleets):
+            if aFleet is fleet:
+                return fleetIndex
+        self.fleets.append(fleet)
+        return len(self.fleets) - 1
+
+    def fleetAt(self, index):
+        fleetIndex = self.fleetIndexes[index]
+        if fleetIndex == NO_FLEET:
+            return None
+        return self.fleets[fleetIndex]
+
+    def setFleetAt(self, index, fleet):
+        self.fleetIndexes[index] = self.fleetIndexOf(fleet)
+
+    #
+    # The row of the finish with an id, or None
+    #
+    def rowWithId(self, finishId):
+        finishId = int(finishId)
+        if self.isIdOrdered:
+            index = bisect.bisect_left(self.finishIds, finishId)
+            if index < len(self.finishIds) and self.finishIds[index] == finishId:
+                return index
+            return None
+        try:
+            return self.finishIds.index(finishId)
+        except ValueError:
+            return None
+
+    def finishWithId(self, finishId):
+        index = self.rowWithId(finishId)
+        if index is None:
+            return None
+        return self.finishAt(index)
+
+    #
+    # Add finishes in bulk, typically on recovery: columns of finish ids, finish times in
+    # microseconds and indexes into fleets (NO_FLEET for none)
+    #
+    def extendRows(self, finishIds, finishMicroseconds, fleetIndexes, fleets):
+        fleetMapping = [self.fleetIndexOf(fleet) for fleet in fleets]
+        if fleetMapping != range(len(fleets)):
+            fleetIndexes = [fleetMapping[fleetIndex] if fleetIndex != NO_FLEET else NO_FLEET for fleetIndex in fleetIndexes]
+        firstNewRow = max(0, len(self.finishIds) - 1)
+        self.finishIds.extend(finishIds)
+        self.finishMicroseconds.extend(finishMicroseconds)
+        self.fleetIndexes.extend(fleetIndexes)
+        self.finishViews.extend([None] * len(finishIds))
+        if self.isIdOrdered:
+            newIds = self.finishIds[firstNewRow:].tolist()
+            self.isIdOrdered = newIds == sorted(newIds)
+
+    #
+    # The (finish id, finish time in microseconds, fleet) of each finish, without making their views
+    #
+    def rows(self):
+        for index in xrange(len(self.finishIds)):
+            yield (self.finishIds[index], self.finishMicroseconds[index], self.fleetAt(index))
+
+
 #
 # Finish represents a finish of a competitor in a race. The finish is decoupled from the
 # competitor/boat, to enable the race officer to create many finishes and associate them
@@ -159,23 +437,60 @@ class Fleet:
 # are never associated with a competitor, typically because the race officer creates
 # a finish in error. 
 #
-class Finish:
-    
+# A finish is a view of a row of a FinishStore. A new finish is the only row of a store of
+# its own until it is added to a race manager, which moves it into the race manager's store.
+#
+class Finish(object):
     
+    __slots__ = ("store", "index")
     
     def __init__(self,finishTime=None,fleet=None,finishId=None):
-        self.fleet = fleet
-        self.finishTime = finishTime
-        # we store the finishid as a string because this is the way Tk references it
-        self.finishId = str(finishId)
+        self.store = FinishStore()
+        if finishTime is None:
+            finishMicroseconds = float("nan")
+        else:
+            finishMicroseconds = datetimeToMicroseconds(finishTime)
+        if finishId is None:
+            finishId = 0
+        self.index = self.store.appendRow(finishMicroseconds, fleet, int(finishId))
+        self.store.finishViews[self.index] = self
+        
+    #
+    # A finish pickled on its own is pickled as the attributes that Finish used to have, so
+    # that finishes pickled before we had finish stores can still be unpickled
+    #
+    def __getstate__(self):
+        return {"finishTime": self.finishTime, "fleet": self.fleet, "finishId": self.finishId}
+    
+    def __setstate__(self, d):
+        self.__init__(finishTime=d["finishTime"], fleet=d["fleet"], finishId=d["finishId"])
+        
+    def getFinishTime(self):
+        finishMicroseconds = self.store.finishMicroseconds[self.index]
+        if math.isnan(finishMicroseconds):
+            return None
+        return microsecondsToDatetime(finishMicroseconds)
+    
+    def setFinishTime(self, finishTime):
+        self.store.finishMicroseconds[self.index] = datetimeToMicroseconds(finishTime)
         
+    finishTime = property(getFinishTime, setFinishTime)
+    
+    def getFleet(self):
+        return self.store.fleetAt(self.index)
+    
+    def setFleet(self, fleet):
+        self.store.setFleetAt(self.index, fleet)
         
+    fleet = property(getFleet, setFleet)
+    
+    # we give the finishid as a string because this is the way Tk references it
+    @property
+    def finishId(self):
+        return str(self.store.finishIds[self.index])
         
     def hasFleet(self):
-        if self.fleet:
-            return True
-        else:
-            return False
+        return self.store.fleetIndexes[self.index] != NO_FLEET
     
     def elapsedFinishTime(self):
         if self.hasFleet():
@@ -190,6 +505,106 @@ class Finish:
             raise RaceException("Cannot calculate elapsed time if no fleet")
     
         
+#
+# The lights to show when the next fleet starts in secondsToStart (adjusted for
+# training speed)
+#
+def lightsForSecondsToStart(secondsToStart):
+    if secondsToStart <= FLASHING_SECONDS:
+        if int(secondsToStart) % 2 == 0:
+            return [1, 0, 0, 0, 0]
+        else:
+            return NO_LIGHTS
+    lowerThresholds = [threshold for (threshold, lights) in LIGHTS_PATTERNS[1:]] + [FLASHING_SECONDS]
+    for ((threshold, lights), lowerThreshold) in zip(LIGHTS_PATTERNS, lowerThresholds):
+        if lowerThreshold < secondsToStart <= threshold:
+            return lights
+    return NO_LIGHTS
+
+
+# kinds of timeline action
+GUN = "gun"
+WARNING = "warning"
+LIGHTS = "lights"
+STATUS = "status"
+COUNTDOWN = "countdown"
+
+#
+# Something that happens at a point in the start sequence: a gun, a warning beep, a
+# change of lights (the value is the new lights) or a change of a fleet's status (the
+# value is the new status).
+#
+# A countdown action marks the start of the WARNING_BEEPS beeps before a gun (or before
+# a final warning beep; the value is the kind of action at the end of the countdown).
+# The beeps and the gun that make up a countdown refer to it, so that a countdown can be
+# played as one track.
+#
+class TimelineAction:
+    
+    def __init__(self, time, kind, value=None, fleet=None, countdown=None):
+        self.time = time
+        self.kind = kind
+        self.value = value
+        self.fleet = fleet
+        self.countdown = countdown
+
+#
+# The start sequence timeline is every action of the start sequence, in time order.
+# The race manager compiles it when the sequence starts, is recalled or is abandoned,
+# and the gun, lights and screen controllers all work from it, rather than each
+# working out the sequence for themselves from the fleet start times.
+#
+class StartSequenceTimeline:
+    
+    def __init__(self, actions=None):
+        if actions is None:
+            actions = []
+        self.actions = sorted(actions, key=lambda action: action.time)
+        self.times = [action.time for action in self.actions]
+        
+    def isEmpty(self):
+        return len(self.actions) == 0
+        
+    #
+    # The actions at or after a time, optionally only those of the given kinds
+    #
+    def actionsFrom(self, time, kinds=None):
+        position = bisect.bisect_left(self.times, time)
+        return [action for action in self.actions[position:] if kinds is None or action.kind in kinds]
+    
+    #
+    # The first action of a kind strictly after a time, or None
+    #
+    def nextActionAfter(self, time, kind):
+        for action in self.actions[bisect.bisect_right(self.times, time):]:
+            if action.kind == kind:
+                return action
+        return None
+    
+    #
+    # The last action of a kind at or before a time, or None
+    #
+    def lastActionAtOrBefore(self, time, kind):
+        for action in reversed(self.actions[:bisect.bisect_right(self.times, time)]):
+            if action.kind == kind:
+                return action
+        return None
+    
+    #
+    # Are there any actions of a kind after startTime and at or before endTime?
+    #
+    def hasActionsBetween(self, startTime, endTime, kind):
+        nextAction = self.nextActionAfter(startTime, kind)
+        return nextAction is not None and nextAction.time <= endTime
+    
+    def lightsAt(self, time):
+        lightsAction = self.lastActionAtOrBefore(time, LIGHTS)
+        if lightsAction:
+            return lightsAction.value
+        else:
+            return NO_LIGHTS
+    
+
 #
 # The race manager manages fleets and competitors, including creating new fleets,
 # setting the start time for a fleet, running a race and performing
@@ -198,19 +613,37 @@ class Finish:
 # The race manager has a list of fleets. These are always sorted in
 # the order that they will start.
 #
+# The race manager also keeps an index of the fleets that have a start time,
+# sorted by start time, so that finding the next fleet to start and the last
+# fleet started is a binary search against a single reading of the clock. The
+# controllers ask these questions several times a second. Change a fleet's start
+# time through the race manager so that the index is kept up to date.
+#
 class RaceManager:
     
     testSpeedRatio = 1
+    clock = Clock()
     
     def __init__(self):
         self.fleets = []
         self.fleetsById = {}
         self.changed = Signal()
-        self.finishes = []
-        self.finishesById = {}
+        self.finishes = FinishStore()
         # we store these on the race manager so that they get pickled
         self.nextFleetId = 1
         self.nextFinishId = 1
+        # the start time index: fleets with a start time, and their start times, in start time order
+        self.fleetsByStartTime = []
+        self.fleetStartTimes = []
+        # the timeline is compiled from the fleet start times, so we don't pickle it
+        self.timeline = StartSequenceTimeline()
+        # the provisional results of each fleet, by fleet id. We rebuild them from the finishes
+        # rather than pickling them
+        self.provisionalResultsByFleetId = {}
+        # for each row of the finish store, the fleet index of the provisional results it is in
+        self.provisionalFleetIndexes = array("i")
+        # the rows of the finish store of the finishes without a fleet, in order
+        self.unassignedRows = array("i")
         
     #
     # this method controls how the RaceManager is pickled. We want to avoid pickling the Signal object
@@ -219,6 +652,10 @@ class RaceManager:
     def __getstate__(self):
         attributes = self.__dict__.copy()
         del attributes["changed"]
+        attributes.pop("timeline", None)
+        attributes.pop("provisionalResultsByFleetId", None)
+        attributes.pop("provisionalFleetIndexes", None)
+        attributes.pop("unassignedRows", None)
         
         return attributes
     
@@ -229,6 +666,19 @@ class RaceManager:
     def __setstate__(self,d):
         self.__dict__ = d
         self.changed = Signal()
+        self.timeline = StartSequenceTimeline()
+        # race managers pickled before we had a start time index need one
+        if "fleetsByStartTime" not in d:
+            self.reindexFleetStartTimes()
+        # race managers pickled before we had a finish store have a list of finishes
+        if isinstance(self.finishes, list):
+            finishes = self.finishes
+            self.finishes = FinishStore()
+            for finish in finishes:
+                self.finishes.adopt(finish)
+        self.__dict__.pop("finishesById", None)
+        self.reindexProvisionalResults()
+        self.reindexUnassignedFinishes()
          
 
     def incrementNextFleetId(self):
@@ -264,6 +714,7 @@ class RaceManager:
     def addFleet(self, aFleet):
         self.fleets.append(aFleet)
         self.fleetsById[aFleet.fleetId] = aFleet
+        self.indexFleetStartTime(aFleet)
         self.changed.fire("fleetAdded",aFleet)
         
 
@@ -272,6 +723,7 @@ class RaceManager:
             positionInList = self.fleets.index(aFleet)
             self.fleets.remove(aFleet)
             del self.fleetsById[aFleet.fleetId]
+            self.unindexFleetStartTime(aFleet)
             self.changed.fire("fleetRemoved",aFleet)
             
         else:
@@ -292,7 +744,7 @@ class RaceManager:
         logging.info("Start sequence with warning (F flag start)")
         fleetNumber = 0
         
-        now = datetime.now()
+        now = self.clock.now()
         sequenceStart = now + timedelta(seconds=10)
         for fleet in self.fleets:
             fleetNumber = fleetNumber + 1
@@ -302,6 +754,7 @@ class RaceManager:
                         (START_SECONDS * fleetNumber)/RaceManager.testSpeedRatio))
 
             self.updateFleetStartTime(fleet,startTime)
+        self.compileTimeline(now, sequenceStart)
         self.changed.fire("sequenceStartedWithWarning")
 
 
@@ -311,7 +764,7 @@ class RaceManager:
     def startRaceSequenceWithoutWarning(self):
         logging.info("Start sequence without warning (class flag start)")
         fleetNumber = 0
-        now = datetime.now()
+        now = self.clock.now()
         for fleet in self.fleets:
             fleetNumber = fleetNumber + 1
             
@@ -319,40 +772,160 @@ class RaceManager:
                 seconds = (START_SECONDS * fleetNumber)/RaceManager.testSpeedRatio)
 
             self.updateFleetStartTime(fleet,startTime)
+        self.compileTimeline(now)
         self.changed.fire("sequenceStartedWithoutWarning")
     #
     # Update the startTime for a fleet. Do this through the race manager
     # so that the race manager can signal the event change
     #
     def updateFleetStartTime(self, aFleet, startTime):
+        self.unindexFleetStartTime(aFleet)
         aFleet.startTime = startTime
+        self.indexFleetStartTime(aFleet)
         # signal that the fleet start time has changed
         self.changed.fire("fleetChanged",aFleet)
         
             
 
     #
-    # Find the last fleet started. This is a reverse search
-    # of the fleets list for a started fleet.
-    # Returns None if not found
+    # Add a fleet to the start time index, if it is one of our fleets and
+    # has a start time. Fleets with the same start time stay in the order
+    # they were indexed.
+    #
+    def indexFleetStartTime(self, aFleet):
+        if aFleet.hasStartTime() and aFleet.fleetId in self.fleetsById:
+            position = bisect.bisect_right(self.fleetStartTimes, aFleet.startTime)
+            self.fleetStartTimes.insert(position, aFleet.startTime)
+            self.fleetsByStartTime.insert(position, aFleet)
+            
+    def unindexFleetStartTime(self, aFleet):
+        if aFleet in self.fleetsByStartTime:
+            position = self.fleetsByStartTime.index(aFleet)
+            del self.fleetStartTimes[position]
+            del self.fleetsByStartTime[position]
+            
+    #
+    # Rebuild the start time index from scratch
+    #
+    def reindexFleetStartTimes(self):
+        self.fleetsByStartTime = []
+        self.fleetStartTimes = []
+        for fleet in self.fleets:
+            self.indexFleetStartTime(fleet)
+
+    #
+    # Find the last fleet started, i.e. the fleet with the latest start
+    # time in the past. Returns None if not found
     #
     def lastFleetStarted(self):
-        for fleet in reversed(self.fleets):
-            if fleet.isStarted():
-                return fleet
+        position = bisect.bisect_left(self.fleetStartTimes, self.clock.now())
+        if position > 0:
+            return self.fleetsByStartTime[position - 1]
         return None
     
     #
-    # Fine the next fleet to start. If we don't have a fleet starting,
-    # return None.
+    # Find the next fleet to start, i.e. the fleet with the earliest
+    # start time that is not in the past. If we don't have a fleet
+    # starting, return None.
     #
     def nextFleetToStart(self):
-        for fleet in self.fleets:
-            if fleet.isStarting() or fleet.isWaitingToStart():
-                return fleet
+        position = bisect.bisect_left(self.fleetStartTimes, self.clock.now())
+        if position < len(self.fleetsByStartTime):
+            return self.fleetsByStartTime[position]
         return None
 
 
+    #
+    # The lights to show at a time, for the next fleet to start at that time. For a
+    # start line that only starts some of the fleets, pass those fleets.
+    #
+    def lightsAt(self, time, fleets=None):
+        if fleets is None:
+            fleetStartTimes = self.fleetStartTimes
+        else:
+            fleetStartTimes = [fleet.startTime for fleet in self.fleetsByStartTime if fleet in fleets]
+        position = bisect.bisect_left(fleetStartTimes, time)
+        if position < len(fleetStartTimes):
+            secondsToStart = (fleetStartTimes[position] - time).total_seconds() * RaceManager.testSpeedRatio
+            return lightsForSecondsToStart(secondsToStart)
+        return NO_LIGHTS
+    
+    #
+    # Compile the start sequence timeline from now on (by default, the clock's now). For an F flag start, sequenceStart
+    # is the time of the warning gun, and the timeline includes the warning gun, the F flag
+    # down beeps and the first fleet's five minute gun. Every fleet that hasn't started yet
+    # gets its four minute, one minute and start guns. Each gun has a countdown of WARNING_BEEPS
+    # beeps, a second apart, before it.
+    #
+    # With a test speed ratio of 5, the first fleet of an F flag start starts 600 / 5 = 120
+    # seconds after the warning gun, and its four minute gun is 240 / 5 = 48 seconds before that.
+    #
+    def compileTimeline(self, now=None, sequenceStart=None):
+        if now is None:
+            now = self.clock.now()
+        ratio = RaceManager.testSpeedRatio
+        actions = []
+        
+        def addCountdown(gunTime, kind=GUN):
+            countdown = TimelineAction(gunTime - timedelta(seconds=WARNING_BEEPS), COUNTDOWN, kind)
+            actions.append(countdown)
+            for beep in range(WARNING_BEEPS, 0, -1):
+                actions.append(TimelineAction(gunTime - timedelta(seconds=beep), WARNING, countdown=countdown))
+            actions.append(TimelineAction(gunTime, kind, countdown=countdown))
+        
+        if sequenceStart and self.fleetsByStartTime:
+            addCountdown(sequenceStart)
+            # F flag down is a final warning beep rather than a gun
+            addCountdown(sequenceStart + timedelta(milliseconds=(4 * 60000) / ratio), kind=WARNING)
+            addCountdown(self.fleetsByStartTime[0].startTime - timedelta(seconds=START_SECONDS / ratio))
+        
+        for fleet in self.fleetsByStartTime:
+            if fleet.startTime > now:
+                for secondsBefore in [240, 60, 0]:
+                    addCountdown(fleet.startTime - timedelta(seconds=secondsBefore / ratio))
+                actions.append(TimelineAction(fleet.startTime - timedelta(seconds=START_SECONDS / float(ratio)),
+                                              STATUS, "Starting", fleet))
+                actions.append(TimelineAction(fleet.startTime, STATUS, "Started", fleet))
+        
+        actions.extend(self.compileLightsActions(now))
+        
+        self.timeline = StartSequenceTimeline([action for action in actions if action.time >= now])
+        
+    #
+    # The lights actions from now on: the lights at now, then each time the lights
+    # change. For a start line that only starts some of the fleets, pass those fleets.
+    #
+    def compileLightsActions(self, now, fleets=None):
+        ratio = RaceManager.testSpeedRatio
+        lightsChangeTimes = []
+        for fleet in self.fleetsByStartTime:
+            if fleet.startTime > now and (fleets is None or fleet in fleets):
+                # the lights can only change at a threshold, or on a whole second while flashing
+                for secondsBefore in [threshold for (threshold, lights) in LIGHTS_PATTERNS] + range(FLASHING_SECONDS, -1, -1):
+                    lightsChangeTimes.append(fleet.startTime - timedelta(seconds=secondsBefore / float(ratio)))
+        
+        # we only keep the times the lights actually change. The lights change just after
+        # the time, as the seconds to start drop below it.
+        justAfter = timedelta(milliseconds=1)
+        currentLights = self.lightsAt(now, fleets)
+        actions = [TimelineAction(now, LIGHTS, currentLights)]
+        for changeTime in sorted(lightsChangeTimes):
+            if changeTime > now:
+                lights = self.lightsAt(changeTime + justAfter, fleets)
+                if lights != currentLights:
+                    actions.append(TimelineAction(changeTime, LIGHTS, lights))
+                    currentLights = lights
+        return actions
+    
+    #
+    # A timeline of just the lights, for a start line that only starts some of the fleets
+    #
+    def compileLightsTimeline(self, fleets, now=None):
+        if now is None:
+            now = self.clock.now()
+        return StartSequenceTimeline(self.compileLightsActions(now, fleets))
+            
+
     def hasStartedFleet(self):
         return self.lastFleetStarted()
     
@@ -370,6 +943,8 @@ class RaceManager:
     def abandonStartSequence(self):
         for fleet in self.fleets:
             fleet.startTime = None
+        self.reindexFleetStartTimes()
+        self.compileTimeline()
         self.changed.fire("startSequenceAbandoned")
 
 
@@ -379,6 +954,10 @@ class RaceManager:
     #
     def generalRecall(self):
         logging.info("General recall")
+        with self.clock.tick():
+            self._generalRecall()
+
+    def _generalRecall(self):
         fleetToRecall = self.lastFleetStarted()
 
         # if this is not the last fleet, kick the fleet to the back
@@ -389,7 +968,7 @@ class RaceManager:
         # minutes from now
         if fleetToRecall == self.fleets[-1]:
             logging.info("General recall last fleet")
-            self.updateFleetStartTime(fleetToRecall,datetime.now()
+            self.updateFleetStartTime(fleetToRecall,self.clock.now()
                                  + timedelta(seconds=START_SECONDS/RaceManager.testSpeedRatio))
 
         # otherwise kick the fleet to be the back of the queue,
@@ -404,6 +983,7 @@ class RaceManager:
             logging.log(logging.INFO, "General recall not last fleet. Moving to back of queue. Delta to start time now %d seconds",
                         fleetToRecall.adjustedDeltaSecondsToStartTime())
             
+        self.compileTimeline()
         self.changed.fire("generalRecall", fleetToRecall)
 
         
@@ -416,10 +996,12 @@ class RaceManager:
         
         # if no finish time is supplied, set the finish time to be now
         if not finishTime:
-            finishTime = datetime.now()
+            finishTime = self.clock.now()
         # create the finish object
         
-        aFinish = Finish(fleet=fleet,finishTime=finishTime,finishId=self.nextFinishId)
+        # the finish is a new row of our finish store
+        index = self.finishes.appendRow(datetimeToMicroseconds(finishTime), fleet, self.nextFinishId)
+        aFinish = self.finishes.finishAt(index)
         self.incrementNextFinishId()
         
         self.addFinish(aFinish)
@@ -429,16 +1011,132 @@ class RaceManager:
     
     def addFinish(self,finish):
         # add it to our list of finish objects
-        self.finishes.append(finish)
-        self.finishesById[finish.finishId] = finish
+        if finish.store is not self.finishes:
+            self.finishes.adopt(finish)
+        self.indexProvisionalResult(finish.index)
+        self.indexUnassignedFinish(finish.index)
         # fire a change signal
         self.changed.fire("finishAdded",finish)
         
+    #
+    # Add finishes in bulk, without making Finish objects for them or firing signals, typically
+    # on recovery. See FinishStore.extendRows.
+    #
+    def loadFinishes(self, finishIds, finishMicroseconds, fleetIndexes, fleets):
+        self.finishes.extendRows(finishIds, finishMicroseconds, fleetIndexes, fleets)
+        self.reindexProvisionalResults()
+        self.reindexUnassignedFinishes()
+        
+    #
+    # A finish has changed, typically by being given a fleet. Change the finish
+    # before calling this method.
+    #
     def updateFinish(self,finish):
+        self.unindexProvisionalResult(finish.index)
+        self.indexProvisionalResult(finish.index)
+        self.unindexUnassignedFinish(finish.index)
+        self.indexUnassignedFinish(finish.index)
         self.changed.fire("finishChanged",finish)
         
+    #
+    # Add the finish in a row of our finish store, if it has a fleet, to its fleet's provisional results
+    #
+    def indexProvisionalResult(self, index):
+        while len(self.provisionalFleetIndexes) <= index:
+            self.provisionalFleetIndexes.append(NO_FLEET)
+        fleetIndex = self.finishes.fleetIndexes[index]
+        self.provisionalFleetIndexes[index] = fleetIndex
+        if fleetIndex != NO_FLEET:
+            fleetId = self.finishes.fleets[fleetIndex].fleetId
+            if fleetId not in self.provisionalResultsByFleetId:
+                self.provisionalResultsByFleetId[fleetId] = ProvisionalResults(self.finishes)
+            self.provisionalResultsByFleetId[fleetId].add(index)
+            
+    #
+    # Remove the finish in a row of our finish store from the provisional results it is in, which
+    # are those of the fleet it had when it was last indexed
+    #
+    def unindexProvisionalResult(self, index):
+        if index < len(self.provisionalFleetIndexes) and self.provisionalFleetIndexes[index] != NO_FLEET:
+            fleetId = self.finishes.fleets[self.provisionalFleetIndexes[index]].fleetId
+            self.provisionalResultsByFleetId[fleetId].remove(index)
+            self.provisionalFleetIndexes[index] = NO_FLEET
+            
+    #
+    # Rebuild the provisional results from scratch, sorting each fleet's finishes once
+    #
+    def reindexProvisionalResults(self):
+        self.provisionalFleetIndexes = array("i", self.finishes.fleetIndexes)
+        rowsByFleetIndex = {}
+        for (index, fleetIndex) in enumerate(self.finishes.fleetIndexes):
+            if fleetIndex != NO_FLEET:
+                rowsByFleetIndex.setdefault(fleetIndex, []).append(index)
+        rowsByFleetId = {}
+        for (fleetIndex, rows) in rowsByFleetIndex.items():
+            rowsByFleetId.setdefault(self.finishes.fleets[fleetIndex].fleetId, []).extend(rows)
+        self.provisionalResultsByFleetId = {}
+        for (fleetId, rows) in rowsByFleetId.items():
+            results = ProvisionalResults(self.finishes)
+            results.setRows(rows)
+            self.provisionalResultsByFleetId[fleetId] = results
+    
+    #
+    # The finishes of a fleet, in order of finish time
+    #
+    def provisionalResults(self, fleet):
+        if fleet.fleetId in self.provisionalResultsByFleetId:
+            return self.provisionalResultsByFleetId[fleet.fleetId].finishes()
+        return []
+    
+    #
+    # The provisional position of a finish in its fleet, or None if it has no fleet
+    #
+    def provisionalPosition(self, finish):
+        if (finish.store is self.finishes and finish.hasFleet()
+                and finish.fleet.fleetId in self.provisionalResultsByFleetId):
+            return self.provisionalResultsByFleetId[finish.fleet.fleetId].positionOf(finish.index)
+        return None
+        
+    #
+    # Add the finish in a row of our finish store to the unassigned finishes, if it has no fleet.
+    # New finishes are always the last row, so adding one is an append.
+    #
+    def indexUnassignedFinish(self, index):
+        if self.finishes.fleetIndexes[index] == NO_FLEET:
+            position = bisect.bisect_left(self.unassignedRows, index)
+            if position == len(self.unassignedRows) or self.unassignedRows[position] != index:
+                self.unassignedRows.insert(position, index)
+                
+    def unindexUnassignedFinish(self, index):
+        position = bisect.bisect_left(self.unassignedRows, index)
+        if position < len(self.unassignedRows) and self.unassignedRows[position] == index:
+            del self.unassignedRows[position]
+            
+    def reindexUnassignedFinishes(self):
+        self.unassignedRows = array("i", [index for (index, fleetIndex) in enumerate(self.finishes.fleetIndexes)
+                                          if fleetIndex == NO_FLEET])
+        
+    def numberFinishesWithoutFleet(self):
+        return len(self.unassignedRows)
+    
+    #
+    # The first finish without a fleet, or None if every finish has a fleet
+    #
+    def firstFinishWithoutFleet(self):
+        if self.unassignedRows:
+            return self.finishes.finishAt(self.unassignedRows[0])
+        return None
+    
+    #
+    # The next finish without a fleet after a finish, or None if there isn't one
+    #
+    def nextFinishWithoutFleetAfter(self, finish):
+        position = bisect.bisect_right(self.unassignedRows, self.finishes.index(finish))
+        if position < len(self.unassignedRows):
+            return self.finishes.finishAt(self.unassignedRows[position])
+        return None
+        
     def finishWithId(self,finishId):
-        if finishId in self.finishesById:
-            return self.finishesById[finishId]
+        return self.finishes.finishWithId(finishId)
 
     
\ No newline at end of file
@@ -0,0 +1,184 @@
+'''
+Created on 17 Oct 2026
+
+Portsmouth Yardstick results. The results of a fleet are worked out in one pass over
+all of its boats: the start and finish times and PY numbers go into arrays, and the
+elapsed and corrected times are calculated for the whole fleet at once. We use numpy
+for the arrays if it is installed, and plain lists if it isn't.
+'''
+from datetime import datetime
+from array import array
+import math
+import bisect
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+EPOCH = datetime(1970, 1, 1)
+
+
+#
+# Seconds from the epoch to a (naive) clock time
+#
+def epochSeconds(time):
+    return (time - EPOCH).total_seconds()
+
+
+#
+# The result of a boat in a fleet. Boats that have not finished, or have no PY
+# number, have no position or times and come after the boats that have.
+#
+class BoatResult:
+
+    def __init__(self, boat, position=None, elapsedSeconds=None, correctedSeconds=None):
+        self.boat = boat
+        self.position = position
+        self.elapsedSeconds = elapsedSeconds
+        self.correctedSeconds = correctedSeconds
+
+    def hasFinished(self):
+        return self.position is not None
+
+    def __repr__(self):
+        return "BoatResult(%s, %s, %s)" % (self.boat.sailNumber, self.position, self.correctedSeconds)
+
+
+def hasResult(boat):
+    return boat.finish is not None and boat.finish.hasFleet() and boat.py
+
+
+#
+# Rank boats by PY corrected time. Returns a BoatResult for each boat, in order of
+# position. Corrected times are rounded to the nearest second (halves round up), and
+# boats whose corrected times round to the same second tie. Boats that tie share the
+# position, and the next boat's position skips past them (1, 2, 2, 4). Boats that tie
+# stay in the order they were given.
+#
+# Pass useNumpy=False to use plain lists even if numpy is installed.
+#
+def rankPyResults(boats, useNumpy=True):
+    finishedBoats = [boat for boat in boats if hasResult(boat)]
+    startSeconds = [epochSeconds(boat.finish.fleet.startTime) for boat in finishedBoats]
+    finishSeconds = [epochSeconds(boat.finish.finishTime) for boat in finishedBoats]
+    pys = [boat.py for boat in finishedBoats]
+
+    if numpy is not None and useNumpy:
+        (order, elapsedSeconds, correctedSeconds, positions) = _rankArrays(startSeconds, finishSeconds, pys)
+    else:
+        (order, elapsedSeconds, correctedSeconds, positions) = _rankLists(startSeconds, finishSeconds, pys)
+
+    results = [BoatResult(finishedBoats[index], position, elapsedSeconds[index], correctedSeconds[index])
+               for (index, position) in zip(order, positions)]
+    return results + [BoatResult(boat) for boat in boats if not hasResult(boat)]
+
+
+#
+# Rank fleet results with numpy. Returns the order of the boats by corrected time, the
+# elapsed and corrected times of the boats in their original order, and the position of
+# each boat in ranked order.
+#
+def _rankArrays(startSeconds, finishSeconds, pys):
+    elapsedSeconds = numpy.array(finishSeconds, dtype=float) - numpy.array(startSeconds, dtype=float)
+    correctedSeconds = numpy.floor(elapsedSeconds * 1000 / numpy.array(pys, dtype=float) + 0.5)
+    # a stable sort keeps boats that tie in the order they were given
+    order = numpy.argsort(correctedSeconds, kind="mergesort")
+    rankedSeconds = correctedSeconds[order]
+    # each boat's position is one more than the number of boats with a better corrected time
+    positions = numpy.searchsorted(rankedSeconds, rankedSeconds, side="left") + 1
+    return (order.tolist(), elapsedSeconds.tolist(), correctedSeconds.tolist(), positions.tolist())
+
+
+def _rankLists(startSeconds, finishSeconds, pys):
+    elapsedSeconds = [finish - start for (start, finish) in zip(startSeconds, finishSeconds)]
+    correctedSeconds = [math.floor(elapsed * 1000 / float(py) + 0.5) for (elapsed, py) in zip(elapsedSeconds, pys)]
+    order = sorted(range(len(correctedSeconds)), key=correctedSeconds.__getitem__)
+    positions = []
+    for (rank, index) in enumerate(order):
+        if rank > 0 and correctedSeconds[index] == correctedSeconds[order[rank - 1]]:
+            positions.append(positions[-1])
+        else:
+            positions.append(rank + 1)
+    return (order, elapsedSeconds, correctedSeconds, positions)
+
+
+#
+# The results of a fleet's boats
+#
+def rankFleetResults(fleet, useNumpy=True):
+    return rankPyResults(fleet.boats, useNumpy)
+
+
+#
+# The provisional results of a fleet while it is racing: its finishes in order of finish
+# time, before we know which boat each finish is. Every boat in a fleet has the same
+# start time, so this is also the order of elapsed time. Finishes are added and removed
+# one at a time, as they are created and assigned to fleets, by a binary search on
+# (finish time, finish number), so a finish's provisional position is always up to date.
+#
+# The results hold the rows of the finishes in the race manager's finish store, with their
+# finish times and ids alongside in arrays to search.
+#
+class ProvisionalResults:
+
+    def __init__(self, finishStore):
+        self.finishStore = finishStore
+        self.finishMicroseconds = array("d")
+        self.finishIds = array("i")
+        self.rows = array("i")
+
+    #
+    # Where the finish in a row is, or would go
+    #
+    def bisect(self, row):
+        finishMicroseconds = self.finishStore.finishMicroseconds[row]
+        finishId = self.finishStore.finishIds[row]
+        low = bisect.bisect_left(self.finishMicroseconds, finishMicroseconds)
+        high = bisect.bisect_right(self.finishMicroseconds, finishMicroseconds, low)
+        # finishes at the same time are in order of finish id
+        return bisect.bisect_left(self.finishIds, finishId, low, high)
+
+    #
+    # Replace our finishes with the finishes in rows, in any order
+    #
+    def setRows(self, rows):
+        finishMicroseconds = self.finishStore.finishMicroseconds
+        finishIds = self.finishStore.finishIds
+        rowMicroseconds = [finishMicroseconds[row] for row in rows]
+        rowIds = [finishIds[row] for row in rows]
+        # finishes are usually recorded in order of finish time, so the rows are often in order already
+        if not (rowIds == sorted(rowIds) and rowMicroseconds == sorted(rowMicroseconds)):
+            # sorting (finish time, finish id, row) tuples keeps the comparisons in C
+            (rowMicroseconds, rowIds, rows) = zip(*sorted(zip(rowMicroseconds, rowIds, rows)))
+        self.finishMicroseconds = array("d", rowMicroseconds)
+        self.finishIds = array("i", rowIds)
+        self.rows = array("i", rows)
+
+    def add(self, row):
+        position = self.bisect(row)
+        self.finishMicroseconds.insert(position, self.finishStore.finishMicroseconds[row])
+        self.finishIds.insert(position, self.finishStore.finishIds[row])
+        self.rows.insert(position, row)
+
+    def remove(self, row):
+        position = self.bisect(row)
+        if position < len(self.rows) and self.rows[position] == row:
+            del self.finishMicroseconds[position]
+            del self.finishIds[position]
+            del self.rows[position]
+
+    #
+    # The one-based position of the finish in a row, or None if it isn't one of our finishes
+    #
+    def positionOf(self, row):
+        position = self.bisect(row)
+        if position < len(self.rows) and self.rows[position] == row:
+            return position + 1
+        return None
+
+    def finishes(self):
+        return [self.finishStore.finishAt(row) for row in self.rows]
+
+    def __len__(self):
+        return len(self.rows)
@@ -0,0 +1,137 @@
+'''
+Created on 17 Oct 2026
+
+Series scoring. A series is a number of races, each scored on PY corrected time, with
+series points worked out under the low point system (RRS appendix A): a boat scores its
+position in each race, boats that tie share the average of their positions, and a boat
+that didn't finish a race, or didn't sail it, scores one more than the number of boats in
+the series. A boat's worst race scores are discarded, depending on how many races have
+been sailed.
+
+Working out the points of a race means ranking its boats, so each race keeps its points
+until one of its finishes changes. A correction to one finish rescores one race and the
+series totals.
+'''
+from results import rankPyResults
+
+#
+# The number of discards for the number of races sailed: (races sailed, discards),
+# in order of races sailed.
+#
+DISCARD_RULE = [(4, 1), (8, 2), (12, 3), (16, 4)]
+
+
+def discardsFor(racesSailed, discardRule=DISCARD_RULE):
+    discards = 0
+    for (races, racesDiscards) in discardRule:
+        if racesSailed >= races:
+            discards = racesDiscards
+    return discards
+
+
+#
+# A race of a series: the boats that sailed it, each with its finish. The race's points,
+# by sail number, are worked out when they are first asked for, and kept until the race
+# is told that it has changed.
+#
+class SeriesRace:
+
+    def __init__(self, name, boats):
+        self.name = name
+        self.boats = boats
+        self.pointsCache = None
+
+    def changed(self):
+        self.pointsCache = None
+
+    def sailNumbers(self):
+        return [boat.sailNumber for boat in self.boats]
+
+    #
+    # The points of each boat that finished, by sail number. Boats that didn't finish
+    # are left out; the series gives them their points.
+    #
+    def points(self):
+        if self.pointsCache is None:
+            results = [result for result in rankPyResults(self.boats) if result.hasFinished()]
+            boatsAtPosition = {}
+            for result in results:
+                boatsAtPosition[result.position] = boatsAtPosition.get(result.position, 0) + 1
+            # boats that tie share the average of the positions they cover
+            self.pointsCache = dict([(result.boat.sailNumber,
+                                      result.position + (boatsAtPosition[result.position] - 1) / 2.0)
+                                     for result in results])
+        return self.pointsCache
+
+
+#
+# A boat's place in the series: its points in each race, which of them are discarded,
+# and its total and net points.
+#
+class SeriesStanding:
+
+    def __init__(self, sailNumber, racePoints, discards):
+        self.sailNumber = sailNumber
+        self.racePoints = racePoints
+        # discard the worst scores; of equal scores, the earliest races
+        worstFirst = sorted(range(len(racePoints)), key=lambda race: (-racePoints[race], race))
+        self.discardedRaces = set(worstFirst[:discards])
+        self.countedPointsBestFirst = [racePoints[race] for race in reversed(worstFirst[discards:])]
+        self.totalPoints = sum(racePoints)
+        self.netPoints = sum(self.countedPointsBestFirst)
+        self.position = None
+
+        #
+        # Ties on net points are broken by the best counted scores, then the scores in the
+        # last race, working back (RRS A8.1 and A8.2)
+        #
+        self.tieBreakKey = (self.netPoints, self.countedPointsBestFirst, racePoints[::-1])
+
+
+class Series:
+
+    def __init__(self, name, discardRule=DISCARD_RULE):
+        self.name = name
+        self.discardRule = discardRule
+        self.races = []
+        self.standingsCache = None
+
+    def addRace(self, race):
+        self.races.append(race)
+        self.standingsCache = None
+
+    #
+    # One of a race's finishes has changed. Only that race is rescored.
+    #
+    def raceChanged(self, race):
+        race.changed()
+        self.standingsCache = None
+
+    def sailNumbers(self):
+        sailNumbers = set()
+        for race in self.races:
+            sailNumbers.update(race.sailNumbers())
+        return sorted(sailNumbers)
+
+    #
+    # The series standings, best first
+    #
+    def standings(self):
+        if self.standingsCache is None:
+            sailNumbers = self.sailNumbers()
+            nonFinisherPoints = len(sailNumbers) + 1
+            racePoints = [race.points() for race in self.races]
+            discards = discardsFor(len(self.races), self.discardRule)
+
+            standings = [SeriesStanding(sailNumber,
+                                        [points.get(sailNumber, nonFinisherPoints) for points in racePoints],
+                                        discards)
+                         for sailNumber in sailNumbers]
+            standings.sort(key=lambda standing: standing.tieBreakKey)
+            for (rank, standing) in enumerate(standings):
+                if rank > 0 and standing.tieBreakKey == standings[rank - 1].tieBreakKey:
+                    standing.position = standings[rank - 1].position
+                else:
+                    standing.position = rank + 1
+            self.standingsCache = standings
+        return self.standingsCache
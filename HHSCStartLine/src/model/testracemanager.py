@@ -0,0 +1,368 @@
+'''
+Created on 17 Oct 2026
+'''
+import unittest
+import datetime
+import pickle
+
+from model.race import RaceManager, Finish, Clock, FixedClock, START_SECONDS, GUN, WARNING, LIGHTS, STATUS, COUNTDOWN, NO_LIGHTS
+
+class RaceManagerStartTimeIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.raceManager = RaceManager()
+        for i in range(3):
+            self.raceManager.createFleet()
+
+    #
+    # move the start times of all the fleets, as if the clock had moved on
+    #
+    def moveClockOn(self, seconds):
+        for fleet in self.raceManager.fleets:
+            self.raceManager.updateFleetStartTime(fleet,
+                fleet.startTime - datetime.timedelta(seconds=seconds))
+
+    def testNoSequence(self):
+        self.assertEqual(self.raceManager.nextFleetToStart(), None)
+        self.assertEqual(self.raceManager.lastFleetStarted(), None)
+
+    def testSequenceStarted(self):
+        self.raceManager.startRaceSequenceWithoutWarning()
+
+        self.assertEqual(self.raceManager.nextFleetToStart(), self.raceManager.fleets[0])
+        self.assertEqual(self.raceManager.lastFleetStarted(), None)
+
+    def testMiddleFleetStarted(self):
+        self.raceManager.startRaceSequenceWithoutWarning()
+        self.moveClockOn(START_SECONDS * 2 + 1)
+
+        self.assertEqual(self.raceManager.lastFleetStarted(), self.raceManager.fleets[1])
+        self.assertEqual(self.raceManager.nextFleetToStart(), self.raceManager.fleets[2])
+
+    def testGeneralRecallMovesFleetToBackOfIndex(self):
+        self.raceManager.startRaceSequenceWithoutWarning()
+        self.moveClockOn(START_SECONDS + 1)
+        fleetToRecall = self.raceManager.fleets[0]
+
+        self.raceManager.generalRecall()
+
+        self.assertEqual(self.raceManager.fleetsByStartTime, self.raceManager.fleets)
+        self.assertEqual(self.raceManager.fleetsByStartTime[-1], fleetToRecall)
+        self.assertEqual(self.raceManager.lastFleetStarted(), None)
+        self.assertEqual(self.raceManager.nextFleetToStart(), self.raceManager.fleets[0])
+
+    def testAbandonStartSequenceEmptiesIndex(self):
+        self.raceManager.startRaceSequenceWithoutWarning()
+        self.raceManager.abandonStartSequence()
+
+        self.assertEqual(self.raceManager.fleetsByStartTime, [])
+        self.assertEqual(self.raceManager.nextFleetToStart(), None)
+
+    def testRemoveFleetRemovesFromIndex(self):
+        self.raceManager.startRaceSequenceWithoutWarning()
+        fleetToRemove = self.raceManager.fleets[0]
+
+        self.raceManager.removeFleet(fleetToRemove)
+
+        self.assertFalse(fleetToRemove in self.raceManager.fleetsByStartTime)
+        self.assertEqual(self.raceManager.nextFleetToStart(), self.raceManager.fleets[0])
+
+    def testUnpickledRaceManagerWithoutIndex(self):
+        self.raceManager.startRaceSequenceWithoutWarning()
+        state = self.raceManager.__getstate__()
+        # a race manager pickled before we had the start time index
+        del state["fleetsByStartTime"]
+        del state["fleetStartTimes"]
+        unpickled = RaceManager()
+        unpickled.__setstate__(state)
+
+        self.assertEqual(unpickled.fleetsByStartTime, unpickled.fleets)
+        self.assertEqual(unpickled.nextFleetToStart(), unpickled.fleets[0])
+
+
+class ClockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FixedClock(datetime.datetime(2014, 7, 29, 11, 15))
+        RaceManager.clock = self.clock
+        self.raceManager = RaceManager()
+        for i in range(2):
+            self.raceManager.createFleet()
+
+    def tearDown(self):
+        RaceManager.clock = Clock()
+
+    def testFleetStatusFollowsClock(self):
+        self.raceManager.startRaceSequenceWithoutWarning()
+        fleet1 = self.raceManager.fleets[0]
+
+        self.assertEqual(fleet1.startTime, datetime.datetime(2014, 7, 29, 11, 20))
+        self.assertEqual(fleet1.status(), "Starting")
+        self.clock.advance(START_SECONDS + 1)
+        self.assertEqual(fleet1.status(), "Started")
+        self.assertEqual(fleet1.deltaSecondsToStartTime(), 1)
+
+    def testTickFreezesTime(self):
+        with self.clock.tick() as tickTime:
+            self.clock.advance(10)
+            self.assertEqual(self.clock.now(), tickTime)
+            # nested ticks use the outer tick's time
+            with self.clock.tick():
+                self.assertEqual(self.clock.now(), tickTime)
+            self.assertEqual(self.clock.now(), tickTime)
+        self.assertEqual(self.clock.now(), tickTime + datetime.timedelta(seconds=10))
+
+    def testCreateFinishUsesClock(self):
+        finish = self.raceManager.createFinish()
+
+        self.assertEqual(finish.finishTime, self.clock.now())
+
+
+class StartSequenceTimelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.start = datetime.datetime(2014, 7, 29, 11, 15)
+        self.clock = FixedClock(self.start)
+        RaceManager.clock = self.clock
+        self.raceManager = RaceManager()
+        for i in range(2):
+            self.raceManager.createFleet()
+
+    def tearDown(self):
+        RaceManager.clock = Clock()
+        RaceManager.testSpeedRatio = 1
+
+    def secondsFromStart(self, actions):
+        return [(action.time - self.start).total_seconds() for action in actions]
+
+    def testGunsWithoutWarning(self):
+        self.raceManager.startRaceSequenceWithoutWarning()
+        timeline = self.raceManager.timeline
+
+        self.assertEqual(self.secondsFromStart(timeline.actionsFrom(self.start, kinds=[GUN])),
+                         [60, 240, 300, 360, 540, 600])
+        self.assertEqual(len(timeline.actionsFrom(self.start, kinds=[WARNING])), 6 * 10)
+
+    def testGunsWithWarningAtTestSpeed(self):
+        RaceManager.testSpeedRatio = 5
+        self.raceManager.startRaceSequenceWithWarning()
+        timeline = self.raceManager.timeline
+
+        # warning gun, five minute gun, then each fleet's four minute, one minute and start guns
+        self.assertEqual(self.secondsFromStart(timeline.actionsFrom(self.start, kinds=[GUN])),
+                         [10, 70, 82, 118, 130, 142, 178, 190])
+        # the F flag comes down with a final warning beep rather than a gun
+        self.assertEqual(timeline.lastActionAtOrBefore(self.start + datetime.timedelta(seconds=58), WARNING).time,
+                         self.start + datetime.timedelta(seconds=58))
+
+    def testCountdowns(self):
+        RaceManager.testSpeedRatio = 5
+        self.raceManager.startRaceSequenceWithWarning()
+        timeline = self.raceManager.timeline
+        countdowns = timeline.actionsFrom(self.start, kinds=[COUNTDOWN])
+
+        self.assertEqual(self.secondsFromStart(countdowns), [0, 48, 60, 72, 108, 120, 132, 168, 180])
+        self.assertEqual([countdown.value for countdown in countdowns[:3]], [GUN, WARNING, GUN])
+        # each countdown is made up of its beeps and the gun or final beep at the end
+        partsOfFirst = [action for action in timeline.actionsFrom(self.start, kinds=[GUN, WARNING])
+                        if action.countdown is countdowns[0]]
+        self.assertEqual(self.secondsFromStart(partsOfFirst), range(0, 11))
+
+    def testLights(self):
+        self.raceManager.startRaceSequenceWithoutWarning()
+        timeline = self.raceManager.timeline
+
+        self.assertEqual(timeline.lightsAt(self.start), [1, 1, 1, 1, 1])
+        self.assertEqual(timeline.lightsAt(self.start + datetime.timedelta(seconds=61)), [1, 1, 1, 1, 0])
+        self.assertEqual(timeline.nextActionAfter(self.start, LIGHTS).time,
+                         self.start + datetime.timedelta(seconds=60))
+        # every time the lights change, they agree with the fleet start times
+        for action in timeline.actionsFrom(self.start, kinds=[LIGHTS]):
+            justAfter = action.time + datetime.timedelta(milliseconds=1)
+            self.assertEqual(action.value, self.raceManager.lightsAt(justAfter))
+        # once the last fleet has started, the lights are off for good
+        lastFleetStart = self.raceManager.fleets[-1].startTime
+        self.assertEqual(timeline.lightsAt(lastFleetStart), NO_LIGHTS)
+        self.assertEqual(timeline.nextActionAfter(lastFleetStart, LIGHTS), None)
+
+    def testLightsForSomeFleets(self):
+        self.raceManager.startRaceSequenceWithoutWarning()
+        secondFleet = self.raceManager.fleets[1]
+        timeline = self.raceManager.compileLightsTimeline([secondFleet])
+
+        # a start line for just the second fleet counts down to its start, not the first fleet's
+        self.assertNotEqual(timeline.lightsAt(self.start + datetime.timedelta(seconds=61)),
+                            self.raceManager.timeline.lightsAt(self.start + datetime.timedelta(seconds=61)))
+        for action in timeline.actionsFrom(self.start, kinds=[LIGHTS]):
+            justAfter = action.time + datetime.timedelta(milliseconds=1)
+            self.assertEqual(action.value, self.raceManager.lightsAt(justAfter, [secondFleet]))
+        # once the first fleet has started, both start lines show the same lights
+        afterFirstStart = self.start + datetime.timedelta(seconds=301)
+        self.assertEqual(timeline.lightsAt(afterFirstStart), self.raceManager.timeline.lightsAt(afterFirstStart))
+
+    def testStatusChanges(self):
+        self.raceManager.startRaceSequenceWithoutWarning()
+        timeline = self.raceManager.timeline
+
+        self.assertTrue(timeline.hasActionsBetween(self.start + datetime.timedelta(seconds=299),
+                                                   self.start + datetime.timedelta(seconds=300), STATUS))
+        self.assertFalse(timeline.hasActionsBetween(self.start + datetime.timedelta(seconds=301),
+                                                    self.start + datetime.timedelta(seconds=599), STATUS))
+
+    def testGeneralRecallRecompiles(self):
+        self.raceManager.startRaceSequenceWithoutWarning()
+        self.clock.advance(START_SECONDS + 1)
+
+        self.raceManager.generalRecall()
+        now = self.clock.now()
+
+        # the recalled fleet now starts after the second fleet
+        self.assertEqual(self.secondsFromStart(self.raceManager.timeline.actionsFrom(now, kinds=[GUN])),
+                         [360, 540, 600, 660, 840, 900])
+
+    def testAbandonEmptiesTimeline(self):
+        self.raceManager.startRaceSequenceWithoutWarning()
+        self.raceManager.abandonStartSequence()
+
+        self.assertEqual(self.raceManager.timeline.actionsFrom(self.start, kinds=[GUN, WARNING]), [])
+        self.assertEqual(self.raceManager.timeline.lightsAt(self.start), NO_LIGHTS)
+
+
+class ProvisionalResultsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.start = datetime.datetime(2014, 7, 29, 11, 15)
+        self.raceManager = RaceManager()
+        self.fleets = [self.raceManager.createFleet(), self.raceManager.createFleet()]
+        for fleet in self.fleets:
+            fleet.startTime = self.start
+
+    def finishAt(self, seconds, fleet=None):
+        return self.raceManager.createFinish(fleet=fleet, finishTime=self.start + datetime.timedelta(seconds=seconds))
+
+    def assignFleet(self, finish, fleet):
+        finish.fleet = fleet
+        self.raceManager.updateFinish(finish)
+
+    def testFinishesAreOrderedByFinishTime(self):
+        late = self.finishAt(3000, self.fleets[0])
+        early = self.finishAt(2000, self.fleets[0])
+        other = self.finishAt(2500, self.fleets[1])
+
+        self.assertEqual(self.raceManager.provisionalResults(self.fleets[0]), [early, late])
+        self.assertEqual(self.raceManager.provisionalPosition(late), 2)
+        self.assertEqual(self.raceManager.provisionalPosition(other), 1)
+
+    def testAssigningAFleetMovesTheFinish(self):
+        first = self.finishAt(2000)
+        second = self.finishAt(2100)
+        self.assertEqual(self.raceManager.provisionalPosition(first), None)
+
+        self.assignFleet(second, self.fleets[0])
+        self.assignFleet(first, self.fleets[0])
+        self.assertEqual(self.raceManager.provisionalPosition(second), 2)
+
+        # the race officer pressed the wrong fleet button
+        self.assignFleet(first, self.fleets[1])
+        self.assertEqual(self.raceManager.provisionalResults(self.fleets[0]), [second])
+        self.assertEqual(self.raceManager.provisionalPosition(second), 1)
+        self.assertEqual(self.raceManager.provisionalResults(self.fleets[1]), [first])
+
+    def testFinishesAtTheSameTimeAreInFinishOrder(self):
+        finishes = [self.finishAt(2000) for i in range(3)]
+        for finish in reversed(finishes):
+            self.assignFleet(finish, self.fleets[0])
+
+        self.assertEqual(self.raceManager.provisionalResults(self.fleets[0]), finishes)
+        self.assertEqual(self.raceManager.provisionalPosition(finishes[1]), 2)
+
+    def testUnpickledRaceManagerRebuildsResults(self):
+        finish = self.finishAt(2000, self.fleets[1])
+        unpickled = RaceManager()
+        unpickled.__setstate__(self.raceManager.__getstate__())
+
+        self.assertEqual(unpickled.provisionalPosition(finish), 1)
+
+
+class FinishStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.start = datetime.datetime(2014, 7, 29, 11, 15)
+        self.raceManager = RaceManager()
+        self.fleet = self.raceManager.createFleet()
+        self.fleet.startTime = self.start
+        self.finishes = [self.raceManager.createFinish(finishTime=self.start + datetime.timedelta(seconds=seconds))
+                         for seconds in [2000, 2100, 2200]]
+
+    def testFinishIsAViewOfItsRow(self):
+        self.assertTrue(self.raceManager.finishes[1] is self.finishes[1])
+        self.assertTrue(self.raceManager.finishWithId("3") is self.finishes[2])
+        self.assertEqual(self.raceManager.finishes.index(self.finishes[2]), 2)
+        self.assertEqual(list(self.raceManager.finishes), self.finishes)
+
+        self.finishes[1].fleet = self.fleet
+        self.assertEqual(self.raceManager.finishes[1].fleet, self.fleet)
+        self.assertEqual(self.finishes[1].elapsedFinishTimeDelta(), datetime.timedelta(seconds=2100))
+        self.assertFalse(self.finishes[0].hasFleet())
+
+    def testPicklingKeepsFinishes(self):
+        self.finishes[2].fleet = self.fleet
+        self.raceManager.updateFinish(self.finishes[2])
+
+        for protocol in [0, pickle.HIGHEST_PROTOCOL]:
+            unpickled = pickle.loads(pickle.dumps(self.raceManager, protocol))
+            self.assertEqual([(finish.finishId, finish.finishTime) for finish in unpickled.finishes],
+                             [(finish.finishId, finish.finishTime) for finish in self.finishes])
+            self.assertTrue(unpickled.finishes[2].fleet is unpickled.fleets[0])
+            self.assertEqual(unpickled.provisionalPosition(unpickled.finishes[2]), 1)
+
+    def testUnpickledRaceManagerWithFinishList(self):
+        state = self.raceManager.__getstate__()
+        # a race manager pickled before we had the finish store
+        state["finishes"] = [Finish(finishTime=self.start, fleet=self.fleet, finishId=1)]
+        state["finishesById"] = {"1": state["finishes"][0]}
+        unpickled = RaceManager()
+        unpickled.__setstate__(state)
+
+        self.assertEqual(len(unpickled.finishes), 1)
+        self.assertTrue(unpickled.finishWithId("1") is state["finishes"][0])
+        self.assertEqual(unpickled.provisionalPosition(unpickled.finishes[0]), 1)
+        self.assertFalse(hasattr(unpickled, "finishesById"))
+
+
+class UnassignedFinishesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.raceManager = RaceManager()
+        self.fleet = self.raceManager.createFleet()
+        self.finishes = [self.raceManager.createFinish() for i in range(5)]
+
+    def assignFleet(self, finish, fleet):
+        finish.fleet = fleet
+        self.raceManager.updateFinish(finish)
+
+    def testNextFinishWithoutFleet(self):
+        self.assignFleet(self.finishes[1], self.fleet)
+        self.assignFleet(self.finishes[2], self.fleet)
+
+        self.assertTrue(self.raceManager.firstFinishWithoutFleet() is self.finishes[0])
+        self.assertTrue(self.raceManager.nextFinishWithoutFleetAfter(self.finishes[0]) is self.finishes[3])
+        self.assertTrue(self.raceManager.nextFinishWithoutFleetAfter(self.finishes[1]) is self.finishes[3])
+        self.assertEqual(self.raceManager.nextFinishWithoutFleetAfter(self.finishes[4]), None)
+        self.assertEqual(self.raceManager.numberFinishesWithoutFleet(), 3)
+
+    def testTakingAFleetAwayMakesAFinishUnassigned(self):
+        for finish in self.finishes:
+            self.assignFleet(finish, self.fleet)
+        self.assertEqual(self.raceManager.firstFinishWithoutFleet(), None)
+
+        self.assignFleet(self.finishes[3], None)
+        self.assertTrue(self.raceManager.nextFinishWithoutFleetAfter(self.finishes[0]) is self.finishes[3])
+        self.assertEqual(self.raceManager.numberFinishesWithoutFleet(), 1)
+
+        unpickled = pickle.loads(pickle.dumps(self.raceManager, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(unpickled.firstFinishWithoutFleet().finishId, self.finishes[3].finishId)
+
+
+if __name__ == "__main__":
+    unittest.main()
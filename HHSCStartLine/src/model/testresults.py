@@ -0,0 +1,78 @@
+'''
+Created on 17 Oct 2026
+'''
+import unittest
+import datetime
+
+import model.results
+from model.race import RaceManager, Boat
+from model.results import rankPyResults
+
+
+class RankPyResultsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.start = datetime.datetime(2014, 7, 29, 11, 15)
+        self.raceManager = RaceManager()
+        self.fleet = self.raceManager.createFleet("Large handicap")
+        self.fleet.startTime = self.start
+
+    def finishedBoat(self, sailNumber, py, elapsedSeconds):
+        boat = Boat(sailNumber, "dinghy", py)
+        boat.finish = self.raceManager.createFinish(fleet=self.fleet,
+                                                    finishTime=self.start + datetime.timedelta(seconds=elapsedSeconds))
+        return boat
+
+    def rank(self, boats):
+        return rankPyResults(boats, useNumpy=False)
+
+    def testBoatsAreRankedOnCorrectedTime(self):
+        # a Topper (1365) has to finish within 3000 * 1.365 seconds to beat a Laser (1100) on 3000
+        boats = [self.finishedBoat("31618", 1365, 4200), self.finishedBoat("200001", 1100, 3300)]
+
+        results = self.rank(boats)
+
+        self.assertEqual([result.boat.sailNumber for result in results], ["200001", "31618"])
+        self.assertEqual([result.position for result in results], [1, 2])
+        self.assertEqual(results[0].elapsedSeconds, 3300)
+        self.assertEqual(results[0].correctedSeconds, 3000)
+        self.assertEqual(results[1].correctedSeconds, round(boats[0].calculatePyAdjustedSeconds()))
+
+    def testTiedBoatsShareAPosition(self):
+        boats = [self.finishedBoat("1", 1000, 3000), self.finishedBoat("2", 1100, 3300),
+                 self.finishedBoat("3", 1000, 2900), self.finishedBoat("4", 1000, 3100)]
+
+        results = self.rank(boats)
+
+        self.assertEqual([(result.boat.sailNumber, result.position) for result in results],
+                         [("3", 1), ("1", 2), ("2", 2), ("4", 4)])
+
+    def testBoatsWithoutAFinishComeLast(self):
+        unfinished = Boat("99", "dinghy", 1000)
+        boats = [unfinished, self.finishedBoat("1", 1000, 3000)]
+
+        results = self.rank(boats)
+
+        self.assertEqual([result.boat for result in results], [boats[1], unfinished])
+        self.assertFalse(results[1].hasFinished())
+
+    @unittest.skipUnless(model.results.numpy, "numpy is not installed")
+    def testNumpyAgreesWithLists(self):
+        boats = [self.finishedBoat(str(i), 900 + (i * 37) % 600, 2400 + (i * 53) % 1800) for i in range(200)]
+        # boats that tie on corrected time, and boats that didn't finish, have no fleet or have no PY
+        boats += [self.finishedBoat("tie1", 1000, 3000), self.finishedBoat("tie2", 1100, 3300),
+                  self.finishedBoat("tie3", 1000, 3000)]
+        noFleet = Boat("nofleet", "dinghy", 1000)
+        noFleet.finish = self.raceManager.createFinish(finishTime=self.start + datetime.timedelta(seconds=3000))
+        boats += [Boat("dnf", "dinghy", 1000), noFleet, self.finishedBoat("nopy", None, 3000)]
+
+        def describe(results):
+            return [(result.boat, result.position, result.elapsedSeconds, result.correctedSeconds) for result in results]
+
+        numpyResults = rankPyResults(boats, useNumpy=True)
+        self.assertEqual(describe(numpyResults), describe(self.rank(boats)))
+        self.assertEqual([result.hasFinished() for result in numpyResults[-3:]], [False, False, False])
+
+
+if __name__ == "__main__":
+    unittest.main()
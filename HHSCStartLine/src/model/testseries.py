@@ -0,0 +1,82 @@
+'''
+Created on 17 Oct 2026
+'''
+import unittest
+import datetime
+
+from model.race import RaceManager, Boat
+from model.series import Series, SeriesRace, discardsFor
+
+
+class SeriesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.start = datetime.datetime(2014, 7, 29, 11, 15)
+        self.raceManager = RaceManager()
+        self.fleet = self.raceManager.createFleet("Large handicap")
+        self.fleet.startTime = self.start
+        self.series = Series("Summer series")
+
+    #
+    # A race of boats with the same PY, finishing in the order of their elapsed seconds.
+    # A boat with None for its elapsed seconds didn't finish.
+    #
+    def addRace(self, elapsedSecondsBySailNumber):
+        boats = []
+        for (sailNumber, elapsedSeconds) in sorted(elapsedSecondsBySailNumber.items()):
+            boat = Boat(sailNumber, "dinghy", 1000)
+            if elapsedSeconds is not None:
+                boat.finish = self.raceManager.createFinish(fleet=self.fleet,
+                    finishTime=self.start + datetime.timedelta(seconds=elapsedSeconds))
+            boats.append(boat)
+        race = SeriesRace("Race %d" % (len(self.series.races) + 1), boats)
+        self.series.addRace(race)
+        return race
+
+    def standingsOf(self):
+        return [(standing.sailNumber, standing.position, standing.netPoints) for standing in self.series.standings()]
+
+    def testDiscards(self):
+        self.assertEqual([discardsFor(races) for races in [1, 3, 4, 7, 8, 30]], [0, 0, 1, 1, 2, 4])
+
+    def testLowPointScoringWithDiscard(self):
+        self.addRace({"A": 3000, "B": 3100, "C": 3200})
+        self.addRace({"A": 3300, "B": 3100, "C": 3200})
+        self.addRace({"A": 3000, "B": 3100, "C": None})
+        self.addRace({"A": 3000, "B": 3100})
+
+        # C didn't finish race 3 or sail race 4, so scores 4 in both, and discards one of them
+        self.assertEqual(self.standingsOf(), [("A", 1, 3), ("B", 2, 5), ("C", 3, 9)])
+        standingOfC = self.series.standings()[2]
+        self.assertEqual(standingOfC.racePoints, [3, 2, 4, 4])
+        self.assertEqual(standingOfC.discardedRaces, set([2]))
+
+    def testTiedBoatsShareAverageOfPositions(self):
+        race = self.addRace({"A": 3000, "B": 3000, "C": 3200})
+
+        self.assertEqual(race.points(), {"A": 1.5, "B": 1.5, "C": 3})
+
+    def testTieOnNetPointsIsBrokenByBestScores(self):
+        self.addRace({"A": 3000, "B": 3100, "C": 3200})
+        self.addRace({"A": 3200, "B": 3000, "C": 3100})
+        self.addRace({"A": 3100, "B": 3200, "C": 3000})
+
+        # every boat has 6 points and one of each score, so the last race decides
+        self.assertEqual(self.standingsOf(), [("C", 1, 6), ("A", 2, 6), ("B", 3, 6)])
+
+    def testCorrectingAFinishOnlyRescoresItsRace(self):
+        firstRace = self.addRace({"A": 3000, "B": 3100})
+        secondRace = self.addRace({"A": 3000, "B": 3100})
+        self.series.standings()
+        firstRacePoints = firstRace.points()
+
+        secondRace.boats[0].finish.finishTime = self.start + datetime.timedelta(seconds=3200)
+        self.series.raceChanged(secondRace)
+
+        # A and B have a win each, and B won the last race
+        self.assertEqual(self.standingsOf(), [("B", 1, 3), ("A", 2, 3)])
+        self.assertTrue(firstRace.points() is firstRacePoints)
+
+
+if __name__ == "__main__":
+    unittest.main()
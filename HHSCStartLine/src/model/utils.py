@@ -3,6 +3,9 @@ Created on 8 Feb 2014
 
 @author: MBradley
 '''
+import time
+import sys
+import threading
 #
 # Our event handling mechanism,
 # from http://codereview.stackexchange.com/questions/20938/the-observer-design-pattern-in-python-in-a-more-pythonic-way-plus-unit-testing
@@ -37,3 +40,49 @@ class Signal(object):
         if event in self._handlers:
             for handler in self._handlers[event]:
                 handler(*args)
+
+
+#
+# Seconds from a clock that never goes backwards, e.g. when the laptop's clock
+# is corrected during a start sequence. The seconds are only useful for measuring
+# intervals. We use time.monotonic where Python has it, CLOCK_MONOTONIC on Linux,
+# and otherwise the wall clock, never allowed to go backwards.
+#
+def _linuxMonotonicSeconds():
+    import ctypes
+    
+    class timespec(ctypes.Structure):
+        _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+    
+    CLOCK_MONOTONIC = 1
+    librt = ctypes.CDLL("librt.so.1", use_errno=True)
+    clock_gettime = librt.clock_gettime
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+    
+    def monotonicSeconds():
+        t = timespec()
+        clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t))
+        return t.tv_sec + t.tv_nsec * 1e-9
+    
+    return monotonicSeconds
+
+def _nonDecreasingSeconds():
+    lock = threading.Lock()
+    last = [time.time()]
+    
+    def monotonicSeconds():
+        with lock:
+            last[0] = max(last[0], time.time())
+            return last[0]
+    
+    return monotonicSeconds
+
+if hasattr(time, "monotonic"):
+    monotonicSeconds = time.monotonic
+else:
+    try:
+        if not sys.platform.startswith("linux"):
+            raise OSError("CLOCK_MONOTONIC only used on Linux")
+        monotonicSeconds = _linuxMonotonicSeconds()
+    except (OSError, AttributeError):
+        monotonicSeconds = _nonDecreasingSeconds()
@@ -0,0 +1,103 @@
+'''
+Created on 17 Oct 2026
+
+Benchmark of the recovery snapshot format. For races with 10, 1,000 and 50,000 finishes, compares the
+time to serialize and deserialize a snapshot, and its size, for:
+
+- the version 1 layout: the race manager as it was then, with a list and a dict of Finish objects
+  each with its own __dict__, pickled with the default protocol
+- the race manager as it is now, with its finish store, pickled with the highest protocol
+- the current layout, whose finishes are packed structs
+
+It also gives how many times faster than version 1 each format is to load.
+
+Run from the src directory:
+
+PYTHONPATH=. python persistence/benchmarkrecovery.py
+'''
+import pickle
+import timeit
+import datetime
+import random
+
+from model.race import RaceManager, Fleet
+from persistence.recovery import encodeSnapshot, decodeSnapshot
+
+FINISH_COUNTS = [10, 1000, 50000]
+REPEATS = 3
+
+
+def createRaceManager(numberFinishes):
+    raceManager = RaceManager()
+    fleets = [raceManager.createFleet() for i in range(6)]
+    raceManager.startRaceSequenceWithoutWarning()
+    finishTime = datetime.datetime.now()
+    for i in xrange(numberFinishes):
+        finishTime = finishTime + datetime.timedelta(milliseconds=random.randint(100, 5000))
+        raceManager.createFinish(fleet=random.choice(fleets + [None]), finishTime=finishTime)
+    return raceManager
+
+#
+# The race manager and its finishes as they were when we wrote version 1 snapshots
+#
+class LegacyRaceManager:
+    pass
+
+class LegacyFinish:
+
+    def __init__(self, finishTime=None, fleet=None, finishId=None):
+        self.fleet = fleet
+        self.finishTime = finishTime
+        self.finishId = str(finishId)
+
+def legacyRaceManager(raceManager):
+    legacy = LegacyRaceManager()
+    legacy.fleets = [Fleet(name=fleet.name, startTime=fleet.startTime, fleetId=fleet.fleetId) for fleet in raceManager.fleets]
+    legacy.fleetsById = dict([(fleet.fleetId, fleet) for fleet in legacy.fleets])
+    legacy.finishes = [LegacyFinish(finishTime=finish.finishTime,
+                                    fleet=finish.fleet and legacy.fleetsById[finish.fleet.fleetId],
+                                    finishId=finish.finishId)
+                       for finish in raceManager.finishes]
+    legacy.finishesById = dict([(finish.finishId, finish) for finish in legacy.finishes])
+    legacy.nextFleetId = raceManager.nextFleetId
+    legacy.nextFinishId = raceManager.nextFinishId
+    return legacy
+
+#
+# Return the best time, in milliseconds, of REPEATS calls of aFunction
+#
+def bestMillis(aFunction):
+    return 1000 * min(timeit.repeat(aFunction, number=1, repeat=REPEATS))
+
+
+#
+# Print the timings and size of a format, with how many times faster than version 1 it is to load
+#
+def printFormat(numberFinishes, formatName, serializeMillis, deserializeMillis, size, version1DeserializeMillis):
+    print "%-10d %-10s %14.2f %14.2f %12d %14.1f" % (numberFinishes, formatName, serializeMillis,
+        deserializeMillis, size, version1DeserializeMillis / deserializeMillis)
+
+
+def benchmark():
+    print "%-10s %-10s %14s %14s %12s %14s" % ("finishes", "format", "serialize ms", "deserialize ms", "bytes",
+                                              "load speedup")
+    for numberFinishes in FINISH_COUNTS:
+        raceManager = createRaceManager(numberFinishes)
+
+        legacy = legacyRaceManager(raceManager)
+        version1 = pickle.dumps(legacy)
+        version1DeserializeMillis = bestMillis(lambda: pickle.loads(version1))
+        printFormat(numberFinishes, "version 1", bestMillis(lambda: pickle.dumps(legacy)),
+                    version1DeserializeMillis, len(version1), version1DeserializeMillis)
+
+        pickled = pickle.dumps(raceManager, pickle.HIGHEST_PROTOCOL)
+        printFormat(numberFinishes, "pickled", bestMillis(lambda: pickle.dumps(raceManager, pickle.HIGHEST_PROTOCOL)),
+                    bestMillis(lambda: pickle.loads(pickled)), len(pickled), version1DeserializeMillis)
+
+        current = encodeSnapshot(0, raceManager)
+        printFormat(numberFinishes, "current", bestMillis(lambda: encodeSnapshot(0, raceManager)),
+                    bestMillis(lambda: decodeSnapshot(current)), len(current), version1DeserializeMillis)
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -5,51 +5,576 @@ Created on 29 Jul 2014
 '''
 
 #
-# This module contains classes for persisting the StartLine racemanager to disk. It gets notified when the race manager changes and writes a pickled
-# race manager (without its signal object) to the pickle file. 
+# This module contains classes for persisting the StartLine racemanager to disk. It gets notified when the race manager changes and
+# appends a compact record describing the change to a journal file.
 #
 
 #
-# The race recovery manager uses the pickle module to dump the race manager to a string whenever the race changes. The manager writes to
-# file in its own thread to minimise the risk of IO issues on the user interface TK event queue.
+# The recovery files are a snapshot file and a journal file. The snapshot file holds a pickled race manager (without its signal
+# object) and the sequence number of the last journal record included in it. The journal file holds one pickled record per race
+# manager event since the snapshot. Writing a record costs the same however many fleets and finishes we have, so a "Gun and finish"
+# press on a big open meeting is no slower than on a quiet Wednesday evening.
+#
+# The race recovery manager writes to file in its own thread to minimise the risk of IO issues on the user interface TK event queue.
+# The Tk thread never pickles anything after startup: it only builds a record tuple and puts it on the save queue.
+# The writer thread keeps its own shadow copy of the race manager, built by replaying the records as it writes them. Every
+# COMPACT_AFTER_RECORDS records it writes a fresh snapshot of the shadow copy and empties the journal, so recovery never has to
+# replay more than a few hundred records. Because the shadow copy is only touched by the writer thread, it is always a consistent
+# copy to snapshot from, whatever the Tk thread is doing to the live race manager.
+#
+# A burst of events (a general recall fires several, and a mass finish fires one per click) is coalesced: the writer thread
+# waits up to COALESCE_SECONDS after the first event of a burst, then writes everything that has arrived with a single write,
+# and at most one snapshot. The recovery point lag is the time from an event happening to it being in the journal file; we
+# track the worst we have seen.
+#
+# To recover, we load the snapshot and replay the journal records with a sequence number greater than the snapshot's.
+#
+
+#
+# The files have to survive the laptop dying at any moment, including half way through a write:
+#
+# - every snapshot and every journal record is framed with its length and a CRC32 checksum, so we can tell a
+#   good one from a torn or corrupt one.
+# - a snapshot is written to a temporary file, fsynced, and then renamed over the snapshot file. The snapshot
+#   it replaces, and the journal that goes with it, are kept as the previous generation (.prev). If the current
+#   snapshot is unreadable, we recover from the previous generation and replay both journals.
+# - journal records are fsynced once per burst (group commit) rather than once per record, which keeps the
+#   number of fsyncs bounded on the slow SD cards in the start box laptops.
+#
+
+#
+# A snapshot is a versioned document, pickled with the highest (binary) pickle protocol. We don't pickle the
+# Fleet and Finish objects themselves: the document holds a plain description of the race manager, and the
+# finishes are packed into a single string of fixed size structs, which is much smaller and much quicker to
+# pickle than thousands of objects with their __dict__s. See benchmarkrecovery.py for the figures.
+#
+# When the layout changes, increment SNAPSHOT_SCHEMA_VERSION and add a function to SNAPSHOT_MIGRATIONS that
+# converts a document of the previous version. Version 1 is the pickled RaceManager object that we wrote before
+# we had schema versions.
 #
 
 import os
 import pickle
 import logging
 import Queue
+import time
+import struct
+import sys
+import zlib
+from array import array
+
+from model.race import RaceManager, Fleet, Finish, NO_FLEET
+
+COMPACT_AFTER_RECORDS = 500
+COALESCE_SECONDS = 0.25
+
+SNAPSHOT_MAGIC = "HHSCSNAP"
+# each frame is its payload length and CRC32, followed by the payload
+FRAME_HEADER = struct.Struct("<II")
+
+SNAPSHOT_SCHEMA_VERSION = 2
+# each packed finish is its finish id, its finish time in microseconds since EPOCH, and the index of
+# its fleet in the document's fleets list (-1 for no fleet)
+PACKED_FINISH = struct.Struct("<qqi")
+# a packed finish is five 32 bit words, the first of which is the low word of its finish id and the
+# last of which is its fleet index
+PACKED_FINISH_WORDS = PACKED_FINISH.size / 4
+# the finish times of packed finishes, which we unpack a chunk at a time, as struct compiles a format
+# afresh for each new length
+PACKED_FINISHES_PER_CHUNK = 1024
+PACKED_FINISH_TIME = "8xq4x"
+PACKED_FINISH_TIMES_CHUNK = struct.Struct("<" + PACKED_FINISH_TIME * PACKED_FINISHES_PER_CHUNK)
+
+class RecoveryException(Exception):
+    def __init__(self, message):
+        self.message = message
+    def __str__(self):
+        return self.message
+
+#
+# For each race manager event we journal, a function that turns the event arguments into the
+# record arguments. Records only hold ids, names and datetimes, so they are cheap to build on the
+# Tk thread and safe to hand to the writer thread.
+#
+RECORD_BUILDERS = {
+    "fleetAdded": lambda fleet: (fleet.fleetId, fleet.name, fleet.startTime),
+    "fleetRemoved": lambda fleet: (fleet.fleetId,),
+    "fleetChanged": lambda fleet: (fleet.fleetId, fleet.startTime),
+    "finishAdded": lambda finish: (finish.finishId, finish.finishTime, fleetIdOf(finish)),
+    "finishChanged": lambda finish: (finish.finishId, fleetIdOf(finish)),
+    "sequenceStartedWithWarning": lambda: (),
+    "sequenceStartedWithoutWarning": lambda: (),
+    "startSequenceAbandoned": lambda: (),
+    "generalRecall": lambda fleet: (fleet.fleetId,)
+    }
+
+
+def fleetIdOf(finish):
+    if finish.hasFleet():
+        return finish.fleet.fleetId
+    else:
+        return None
+
+
+def checksum(payload):
+    return zlib.crc32(payload) & 0xffffffff
+
+def frame(payload):
+    return FRAME_HEADER.pack(len(payload), checksum(payload)) + payload
+
+#
+# Read the next frame from a file. Returns None at the end of the file, or if the frame is
+# incomplete or its checksum doesn't match.
+#
+def readFrame(aFile):
+    header = aFile.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        return None
+    (length, expectedChecksum) = FRAME_HEADER.unpack(header)
+    payload = aFile.read(length)
+    if len(payload) < length or checksum(payload) != expectedChecksum:
+        return None
+    return payload
+
+#
+# Describe a race manager as a snapshot document of the current schema version. Finishes can refer
+# to a fleet that has since been removed from the race manager, so the document's fleets list holds
+# the race manager's fleets followed by any such removed fleets.
+#
+def raceManagerToDocument(sequence, raceManager):
+    fleets = list(raceManager.fleets)
+    fleetIndexes = dict([(fleet.fleetId, i) for (i, fleet) in enumerate(fleets)])
+    packedFinishes = []
+    # we pack the rows of the race manager's finish store, rather than making a Finish for each of them
+    for (finishId, finishMicroseconds, fleet) in raceManager.finishes.rows():
+        if fleet is not None:
+            if fleet.fleetId not in fleetIndexes:
+                fleetIndexes[fleet.fleetId] = len(fleets)
+                fleets.append(fleet)
+            fleetIndex = fleetIndexes[fleet.fleetId]
+        else:
+            fleetIndex = NO_FLEET
+        packedFinishes.append(PACKED_FINISH.pack(finishId, int(finishMicroseconds), fleetIndex))
+
+    return {
+        "schemaVersion": SNAPSHOT_SCHEMA_VERSION,
+        "sequence": sequence,
+        "nextFleetId": raceManager.nextFleetId,
+        "nextFinishId": raceManager.nextFinishId,
+        "fleets": [(fleet.fleetId, fleet.name, fleet.startTime) for fleet in fleets],
+        "numberRaceManagerFleets": len(raceManager.fleets),
+        "finishes": "".join(packedFinishes)
+        }
+
+def documentToRaceManager(document):
+    raceManager = RaceManager()
+    fleets = [Fleet(name=name, startTime=startTime, fleetId=fleetId)
+              for (fleetId, name, startTime) in document["fleets"]]
+    for fleet in fleets[:document["numberRaceManagerFleets"]]:
+        raceManager.addFleet(fleet)
+
+    (finishIds, finishMicroseconds, fleetIndexes) = unpackFinishes(document["finishes"])
+    raceManager.loadFinishes(finishIds, finishMicroseconds, fleetIndexes, fleets)
+
+    raceManager.nextFleetId = document["nextFleetId"]
+    raceManager.nextFinishId = document["nextFinishId"]
+    return raceManager
+
+#
+# Unpack a document's packed finishes into columns of finish ids, finish times in microseconds and
+# fleet indexes, without unpacking each finish in turn. Finish ids fit in a 32 bit word, as the
+# finish store holds them in one.
+#
+def unpackFinishes(packedFinishes):
+    words = array("i")
+    words.fromstring(packedFinishes)
+    if sys.byteorder == "big":
+        words.byteswap()
+
+    finishMicroseconds = []
+    offset = 0
+    while offset + PACKED_FINISH_TIMES_CHUNK.size <= len(packedFinishes):
+        finishMicroseconds.extend(PACKED_FINISH_TIMES_CHUNK.unpack_from(packedFinishes, offset))
+        offset = offset + PACKED_FINISH_TIMES_CHUNK.size
+    numberRemaining = (len(packedFinishes) - offset) / PACKED_FINISH.size
+    finishMicroseconds.extend(struct.unpack_from("<" + PACKED_FINISH_TIME * numberRemaining, packedFinishes, offset))
+
+    return (words[0::PACKED_FINISH_WORDS], array("d", finishMicroseconds),
+            words[PACKED_FINISH_WORDS - 1::PACKED_FINISH_WORDS])
+
+def migrateSnapshotVersion1(document):
+    return raceManagerToDocument(document["sequence"], document["raceManager"])
+
+# functions that convert a snapshot document of the key's version to the next version
+SNAPSHOT_MIGRATIONS = {
+    1: migrateSnapshotVersion1
+    }
+
+def encodeSnapshot(sequence, raceManager):
+    return pickle.dumps(raceManagerToDocument(sequence, raceManager), pickle.HIGHEST_PROTOCOL)
+
+def decodeSnapshot(payload):
+    return loadSnapshotDocument(pickle.loads(payload))
+
+#
+# Load a snapshot document, migrating it to the current schema version if it is older. Returns
+# the sequence number of the last journal record in the snapshot, and the race manager.
+#
+def loadSnapshotDocument(document):
+    if isinstance(document, tuple):
+        # written before we had schema versions
+        (sequence, raceManager) = document
+        document = {"schemaVersion": 1, "sequence": sequence, "raceManager": raceManager}
+
+    while document["schemaVersion"] < SNAPSHOT_SCHEMA_VERSION:
+        logging.info("Migrating recovery snapshot from schema version %d" % document["schemaVersion"])
+        document = SNAPSHOT_MIGRATIONS[document["schemaVersion"]](document)
+    if document["schemaVersion"] > SNAPSHOT_SCHEMA_VERSION:
+        raise RecoveryException("Recovery snapshot schema version %d is newer than this program" % document["schemaVersion"])
+
+    return (document["sequence"], documentToRaceManager(document))
+
+#
+# Make sure a file's contents are on disk, not just in the operating system's buffers
+#
+def syncFile(aFile):
+    aFile.flush()
+    os.fsync(aFile.fileno())
+
+#
+# Rename a file, replacing the destination. On Windows, rename fails if the destination exists.
+#
+def replaceFile(sourceFilename, destinationFilename):
+    if os.name == 'nt' and os.path.exists(destinationFilename):
+        os.remove(destinationFilename)
+    os.rename(sourceFilename, destinationFilename)
+
+#
+# Make a rename durable by syncing the directory. Not possible (or needed) on Windows.
+#
+def syncDirectory(filename):
+    if os.name != 'nt':
+        directory = os.open(os.path.dirname(os.path.abspath(filename)), os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+
+#
+# A journal replayer applies journal records to a race manager. It remembers fleets that have been
+# removed, because a general recall removes a fleet and adds the same fleet back at the end of the
+# fleets list, and any finishes for that fleet must still refer to the same fleet object.
+#
+class JournalReplayer:
+    def __init__(self, raceManager):
+        self.raceManager = raceManager
+        self.removedFleetsById = {}
+
+    def fleetWithId(self, fleetId):
+        if fleetId is None:
+            return None
+        fleet = self.raceManager.fleetWithId(fleetId)
+        if fleet is None:
+            fleet = self.removedFleetsById.get(fleetId)
+        return fleet
+
+    def apply(self, record):
+        event = record[1]
+        arguments = record[2:]
+        handler = getattr(self, "replay_" + event, None)
+        if handler:
+            handler(*arguments)
+
+    def replay_fleetAdded(self, fleetId, name, startTime):
+        fleet = self.removedFleetsById.pop(fleetId, None)
+        if fleet is None:
+            fleet = Fleet(name=name, startTime=startTime, fleetId=fleetId)
+        fleet.startTime = startTime
+        self.raceManager.addFleet(fleet)
+        self.raceManager.nextFleetId = max(self.raceManager.nextFleetId, int(fleetId) + 1)
+
+    def replay_fleetRemoved(self, fleetId):
+        fleet = self.raceManager.fleetWithId(fleetId)
+        if fleet:
+            self.raceManager.removeFleet(fleet)
+            self.removedFleetsById[fleetId] = fleet
+
+    def replay_fleetChanged(self, fleetId, startTime):
+        fleet = self.fleetWithId(fleetId)
+        if fleet:
+            self.raceManager.updateFleetStartTime(fleet, startTime)
+
+    def replay_finishAdded(self, finishId, finishTime, fleetId):
+        finish = Finish(finishTime=finishTime, fleet=self.fleetWithId(fleetId), finishId=finishId)
+        self.raceManager.addFinish(finish)
+        self.raceManager.nextFinishId = max(self.raceManager.nextFinishId, int(finishId) + 1)
+
+    def replay_finishChanged(self, finishId, fleetId):
+        finish = self.raceManager.finishWithId(finishId)
+        if finish:
+            finish.fleet = self.fleetWithId(fleetId)
+            self.raceManager.updateFinish(finish)
+
+    def replay_startSequenceAbandoned(self):
+        self.raceManager.abandonStartSequence()
+
 
 class RaceRecoveryManager:
-    def __init__(self,pickleFilename,raceManager):
+    def __init__(self,pickleFilename,raceManager=None):
         self.pickleFilename = pickleFilename
+        self.journalFilename = pickleFilename + ".journal"
+        self.previousPickleFilename = pickleFilename + ".prev"
+        self.previousJournalFilename = self.journalFilename + ".prev"
+        self.temporaryFilename = pickleFilename + ".tmp"
         self.raceManager = raceManager
-        self.saveQueue = Queue.Queue() 
-        
+        self.saveQueue = Queue.Queue()
+        # the sequence number of the last record we have journalled. Only used on the Tk thread.
+        self.sequence = 0
+        # the shadow race manager and its replayer are only used on the writer thread
+        self.shadowRaceManager = None
+        self.shadowReplayer = None
+        self.journalFile = None
+        self.recordsSinceSnapshot = 0
+        # records written to the shadow race manager but not yet to the journal file, and the
+        # time the oldest of them was queued
+        self.pendingRecords = []
+        self.oldestPendingTime = None
+        self.lastRecoveryPointLag = 0.0
+        self.worstRecoveryPointLag = 0.0
+
+        if raceManager:
+            self.journalRaceManager(raceManager)
+
     def hasRecoveryFile(self):
-        return os.path.exists(self.pickleFilename)
-    
-    
-    def readPickledRaceManager(self):
-        pickleFile = open(self.pickleFilename,"r")
-        pickledRaceManager = pickle.load(pickleFile)
-        pickleFile.close()
-        
-        return pickledRaceManager
-    
-    def writeRecoveryFile(self,fileContents):
-        #
-        #
-        recoveryFile = open(self.pickleFilename,"w") 
-        recoveryFile.write(fileContents)
-        recoveryFile.close()
-        
-    def raceManagerChanged(self,aRaceManager):
-        self.writePickleRaceManager(aRaceManager)
-        
-    def handleRaceManagerChanged(self,*args):
-        
-        self.saveQueue.put(pickle.dumps(self.raceManager))
-        
+        return os.path.exists(self.pickleFilename) or os.path.exists(self.previousPickleFilename)
+
+    #
+    # Read a snapshot file. Returns the sequence number of the last journal record in the snapshot,
+    # and the race manager, or None if the file is missing or corrupt. A snapshot written before we
+    # had checksums is one or two plain pickles of the version 1 layout.
+    #
+    def readSnapshot(self,filename):
+        if not os.path.exists(filename):
+            return None
+        snapshotFile = open(filename,"rb")
+        try:
+            try:
+                if snapshotFile.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC:
+                    payload = readFrame(snapshotFile)
+                    if payload is None:
+                        logging.error("Recovery snapshot %s is corrupt" % filename)
+                        return None
+                    return decodeSnapshot(payload)
+
+                snapshotFile.seek(0)
+                header = pickle.load(snapshotFile)
+                if isinstance(header, RaceManager):
+                    document = {"schemaVersion": 1, "sequence": 0, "raceManager": header}
+                else:
+                    document = {"schemaVersion": 1, "sequence": header, "raceManager": pickle.load(snapshotFile)}
+                return loadSnapshotDocument(document)
+            except Exception:
+                logging.exception("Cannot read recovery snapshot %s" % filename)
+                return None
+        finally:
+            snapshotFile.close()
+
+    #
+    # Read the journal records from a journal file, in the order they were written. A crash mid-write
+    # can leave a partial record at the end of the journal; readFrame spots it and we stop there.
+    #
+    def readJournal(self,filename=None):
+        if filename is None:
+            filename = self.journalFilename
+        records = []
+        if not os.path.exists(filename):
+            return records
+        journalFile = open(filename,"rb")
+        try:
+            payload = readFrame(journalFile)
+            while payload is not None:
+                records.append(pickle.loads(payload))
+                payload = readFrame(journalFile)
+        finally:
+            journalFile.close()
+        return records
+
+    #
+    # Recover the race manager from the newest snapshot we can read, and the journal records after it.
+    # The records are in the previous and current journals; we replay them in sequence until we find
+    # a gap.
+    #
+    def recoverRaceManager(self):
+        snapshot = self.readSnapshot(self.pickleFilename)
+        if snapshot is None:
+            logging.warning("Falling back to previous recovery snapshot")
+            snapshot = self.readSnapshot(self.previousPickleFilename)
+        if snapshot is None:
+            raise RecoveryException("No readable recovery snapshot")
+
+        (snapshotSequence, recoveredRaceManager) = snapshot
+        recordsBySequence = {}
+        for filename in [self.previousJournalFilename, self.journalFilename]:
+            for record in self.readJournal(filename):
+                recordsBySequence[record[0]] = record
+
+        replayer = JournalReplayer(recoveredRaceManager)
+        sequence = snapshotSequence + 1
+        while sequence in recordsBySequence:
+            replayer.apply(recordsBySequence[sequence])
+            sequence = sequence + 1
+        logging.info("Recovered race from snapshot and %d journal records" % (sequence - snapshotSequence - 1))
+        return recoveredRaceManager
+
+    #
+    # The sequence number of the last record in the journals on disk, or 0 if there are none
+    #
+    def lastJournalledSequence(self):
+        sequences = [record[0] for filename in [self.previousJournalFilename, self.journalFilename]
+                     for record in self.readJournal(filename)]
+        return max(sequences + [0])
+
+    #
+    # Start journalling a race manager. We take a copy of the race manager for the writer thread,
+    # and ask the writer thread to write it as a new snapshot.
+    #
+    def journalRaceManager(self,aRaceManager):
+        self.raceManager = aRaceManager
+        # our sequence numbers carry on from any journal records on disk, so they are never replayed onto our snapshot
+        self.sequence = max(self.sequence, self.lastJournalledSequence())
+        self.saveQueue.put(RecoveryWriteSnapshot(pickle.loads(pickle.dumps(aRaceManager)), self.sequence))
+        for event in RECORD_BUILDERS:
+            self.raceManager.changed.connect(event, self.createEventHandler(event))
+
+    def createEventHandler(self,event):
+        return lambda *args: self.handleRaceManagerChanged(event, *args)
+
+    #
+    # Called on the Tk thread for every race manager event. We build a small record and queue it
+    # for the writer thread.
+    #
+    def handleRaceManagerChanged(self,event,*args):
+        self.sequence = self.sequence + 1
+        record = (self.sequence, event) + RECORD_BUILDERS[event](*args)
+        self.saveQueue.put(RecoveryWriteRecord(record,time.time()))
+
+    #
+    # Apply a record to the shadow race manager and hold it until the end of the burst
+    #
+    def writeRecord(self,record,queuedTime):
+        self.shadowReplayer.apply(record)
+        self.pendingRecords.append(record)
+        if self.oldestPendingTime is None:
+            self.oldestPendingTime = queuedTime
+
+    #
+    # Write the pending records to the journal with a single write. If this takes us past
+    # COMPACT_AFTER_RECORDS, write a snapshot instead.
+    #
+    def flushJournal(self):
+        if not self.pendingRecords:
+            return
+
+        self.journalFile.write("".join(
+            [frame(pickle.dumps(record, pickle.HIGHEST_PROTOCOL)) for record in self.pendingRecords]))
+        # one fsync for the whole burst
+        syncFile(self.journalFile)
+
+        self.recordsSinceSnapshot = self.recordsSinceSnapshot + len(self.pendingRecords)
+        if self.recordsSinceSnapshot >= COMPACT_AFTER_RECORDS:
+            self.writeSnapshot(self.pendingRecords[-1][0])
+
+        self.lastRecoveryPointLag = time.time() - self.oldestPendingTime
+        self.worstRecoveryPointLag = max(self.worstRecoveryPointLag, self.lastRecoveryPointLag)
+        logging.debug("Journalled %d records, recovery point lag %.3f seconds" %
+                      (len(self.pendingRecords), self.lastRecoveryPointLag))
+        self.pendingRecords = []
+        self.oldestPendingTime = None
+
+    #
+    # The worst case time, in seconds, between a race manager event and it being written to file
+    #
+    def recoveryPointLag(self):
+        return self.worstRecoveryPointLag
+
+    #
+    # Write a snapshot of the shadow race manager and start a new, empty journal. The current
+    # snapshot and journal become the previous generation. Whenever we crash in here, the files on
+    # disk hold a good snapshot and every journal record after it: records that are already in the
+    # newer snapshot are skipped on recovery because of their sequence numbers.
+    #
+    # When we start journalling a new race manager, we replace the files from the previous session.
+    # The new snapshot replaces the old one, and the rename is synced, before we delete the old
+    # journals and previous snapshot, so until it is safely in place we still have the previous
+    # session, and its previous generation, to recover from. A crash after it
+    # is in place leaves old journals behind, but our sequence numbers carry on from theirs (see
+    # journalRaceManager), so their records are skipped on recovery.
+    #
+    def writeSnapshot(self,sequence,replacingPreviousSession=False):
+        logging.debug("Writing recovery snapshot at journal record %d" % sequence)
+        temporaryFile = open(self.temporaryFilename,"wb")
+        temporaryFile.write(SNAPSHOT_MAGIC)
+        temporaryFile.write(frame(encodeSnapshot(sequence, self.shadowRaceManager)))
+        syncFile(temporaryFile)
+        temporaryFile.close()
+
+        if self.journalFile:
+            self.journalFile.close()
+            self.journalFile = None
+        if replacingPreviousSession:
+            replaceFile(self.temporaryFilename, self.pickleFilename)
+            # the previous generation is our fallback until the rename is on disk
+            syncDirectory(self.pickleFilename)
+            for filename in [self.journalFilename, self.previousJournalFilename, self.previousPickleFilename]:
+                if os.path.exists(filename):
+                    os.remove(filename)
+        else:
+            if os.path.exists(self.pickleFilename):
+                replaceFile(self.pickleFilename, self.previousPickleFilename)
+            replaceFile(self.temporaryFilename, self.pickleFilename)
+            if os.path.exists(self.journalFilename):
+                replaceFile(self.journalFilename, self.previousJournalFilename)
+        self.journalFile = open(self.journalFilename,"wb")
+        syncDirectory(self.pickleFilename)
+        self.recordsSinceSnapshot = 0
+
+    #
+    # Take the commands for the next burst from the save queue. We block until the first
+    # command arrives, then take whatever else arrives in the next COALESCE_SECONDS.
+    #
+    def nextBurst(self):
+        commands = [self.saveQueue.get(block=True)]
+        deadline = time.time() + COALESCE_SECONDS
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                commands.append(self.saveQueue.get(timeout=remaining))
+            except Queue.Empty:
+                break
+        return commands
+
+    def executeBurst(self,commands):
+        for command in commands:
+            command.executeOn(self)
+            if isinstance(command, RecoveryStop):
+                # the recovery files are gone, so there's nothing to flush to
+                return
+        self.flushJournal()
+
+    def removeRecoveryFiles(self):
+        self.pendingRecords = []
+        self.oldestPendingTime = None
+        if self.journalFile:
+            self.journalFile.close()
+            self.journalFile = None
+        for filename in [self.pickleFilename, self.journalFilename, self.previousPickleFilename,
+                         self.previousJournalFilename, self.temporaryFilename]:
+            if os.path.exists(filename):
+                os.remove(filename)
+
     #
     # This method gets called in its own thread
     #
@@ -57,22 +582,45 @@ class RaceRecoveryManager:
 
         self.isRunning = True
         while self.isRunning:
-            try:
-                logging.debug("Waiting on save queue")
-                pickledRaceManager = self.saveQueue.get(block=True)
-                self.writeRecoveryFile(pickledRaceManager)
-                
-            except Queue.Empty:
-                # we do nothing if the queue is empty. This should never happen, because we are
-                # blocking for ever.
-                pass
-    
+            logging.debug("Waiting on save queue")
+            self.executeBurst(self.nextBurst())
+        logging.info("Worst recovery point lag was %.3f seconds" % self.worstRecoveryPointLag)
+
     #
-    # when we are asked to stop, we delete the recovery file
+    # when we are asked to stop, we delete the recovery files. We do this on the writer thread,
+    # after any records still in the queue, so that a late write cannot recreate a file.
     #
     def stop(self):
-        
-        self.isRunning = False
-        
-        if self.hasRecoveryFile():
-            os.remove(self.pickleFilename)
\ No newline at end of file
+        self.saveQueue.put(RecoveryStop())
+
+
+#
+# We use the command pattern to pass work from the Tk thread to the writer thread
+#
+class RecoveryCommand:
+    def executeOn(self,aRecoveryManager):
+        pass
+
+class RecoveryWriteRecord(RecoveryCommand):
+    def __init__(self,record,queuedTime):
+        self.record = record
+        self.queuedTime = queuedTime
+
+    def executeOn(self,aRecoveryManager):
+        aRecoveryManager.writeRecord(self.record,self.queuedTime)
+
+class RecoveryWriteSnapshot(RecoveryCommand):
+    def __init__(self,raceManager,sequence):
+        self.raceManager = raceManager
+        self.sequence = sequence
+
+    def executeOn(self,aRecoveryManager):
+        aRecoveryManager.flushJournal()
+        aRecoveryManager.shadowRaceManager = self.raceManager
+        aRecoveryManager.shadowReplayer = JournalReplayer(self.raceManager)
+        aRecoveryManager.writeSnapshot(self.sequence,replacingPreviousSession=True)
+
+class RecoveryStop(RecoveryCommand):
+    def executeOn(self,aRecoveryManager):
+        aRecoveryManager.isRunning = False
+        aRecoveryManager.removeRecoveryFiles()
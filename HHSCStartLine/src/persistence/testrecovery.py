@@ -0,0 +1,254 @@
+'''
+Created on 17 Oct 2026
+'''
+import unittest
+import tempfile
+import shutil
+import os
+import datetime
+import pickle
+
+import model.race
+import persistence.recovery
+from persistence.recovery import RaceRecoveryManager, COMPACT_AFTER_RECORDS, encodeSnapshot, decodeSnapshot, \
+    PACKED_FINISHES_PER_CHUNK
+
+
+class SimulatedCrash(Exception):
+    pass
+
+def crash(*args):
+    raise SimulatedCrash()
+
+class RaceRecoveryManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.recoveryFilename = os.path.join(self.directory, "currentRace.dmp")
+        self.raceManager = model.race.RaceManager()
+        self.recoveryManager = RaceRecoveryManager(self.recoveryFilename, self.raceManager)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    #
+    # Execute the commands on the save queue as a single burst, as the writer thread would
+    #
+    def writeQueuedCommands(self):
+        commands = []
+        while not self.recoveryManager.saveQueue.empty():
+            commands.append(self.recoveryManager.saveQueue.get())
+        self.recoveryManager.executeBurst(commands)
+
+    def recover(self):
+        self.writeQueuedCommands()
+        return RaceRecoveryManager(self.recoveryFilename).recoverRaceManager()
+
+    def testRecoverFleetsAndFinishes(self):
+        fleet1 = self.raceManager.createFleet("Large handicap")
+        self.raceManager.createFleet("Toppers")
+        self.raceManager.startRaceSequenceWithoutWarning()
+        finish = self.raceManager.createFinish()
+        finish.fleet = fleet1
+        self.raceManager.updateFinish(finish)
+        self.raceManager.createFinish()
+
+        recovered = self.recover()
+
+        self.assertEqual([fleet.name for fleet in recovered.fleets], ["Large handicap", "Toppers"])
+        self.assertEqual(recovered.fleets[0].startTime, fleet1.startTime)
+        self.assertEqual(len(recovered.finishes), 2)
+        self.assertEqual(recovered.finishes[0].fleet, recovered.fleets[0])
+        self.assertEqual(recovered.finishes[0].finishTime, finish.finishTime)
+        self.assertFalse(recovered.finishes[1].hasFleet())
+        self.assertEqual(recovered.nextFleetId, self.raceManager.nextFleetId)
+        self.assertEqual(recovered.nextFinishId, self.raceManager.nextFinishId)
+
+    def testRecoverGeneralRecall(self):
+        for i in range(3):
+            self.raceManager.createFleet()
+        self.raceManager.startRaceSequenceWithoutWarning()
+        # move the clock on so that the first fleet has just started
+        for fleet in self.raceManager.fleets:
+            self.raceManager.updateFleetStartTime(fleet,
+                fleet.startTime - datetime.timedelta(seconds=model.race.START_SECONDS + 1))
+        self.raceManager.generalRecall()
+
+        recovered = self.recover()
+
+        self.assertEqual([fleet.fleetId for fleet in recovered.fleets],
+                         [fleet.fleetId for fleet in self.raceManager.fleets])
+        self.assertEqual([fleet.startTime for fleet in recovered.fleets],
+                         [fleet.startTime for fleet in self.raceManager.fleets])
+
+    def testRecoverAfterCompaction(self):
+        fleet1 = self.raceManager.createFleet()
+        self.raceManager.startRaceSequenceWithoutWarning()
+        for i in range(COMPACT_AFTER_RECORDS + 10):
+            self.raceManager.createFinish(fleet=fleet1)
+
+        recovered = self.recover()
+
+        self.assertEqual(len(recovered.finishes), COMPACT_AFTER_RECORDS + 10)
+        self.assertEqual(recovered.finishes[-1].finishId, self.raceManager.finishes[-1].finishId)
+
+    def testBurstIsWrittenOnce(self):
+        self.writeQueuedCommands()
+        fleet1 = self.raceManager.createFleet()
+        for i in range(10):
+            self.raceManager.createFinish(fleet=fleet1)
+        self.assertEqual(self.recoveryManager.saveQueue.qsize(), 11)
+
+        self.writeQueuedCommands()
+
+        self.assertEqual(self.recoveryManager.pendingRecords, [])
+        self.assertEqual(len(self.recoveryManager.readJournal()), 11)
+        self.assertTrue(self.recoveryManager.recoveryPointLag() >= 0)
+
+    def testRecoverIgnoresTornJournalRecord(self):
+        fleet1 = self.raceManager.createFleet()
+        self.raceManager.createFinish(fleet=fleet1)
+        self.writeQueuedCommands()
+        self.raceManager.createFinish(fleet=fleet1)
+        self.writeQueuedCommands()
+        # lose the last few bytes of the last record, as if we crashed mid-write
+        journalSize = os.path.getsize(self.recoveryManager.journalFilename)
+        journalFile = open(self.recoveryManager.journalFilename, "r+b")
+        journalFile.truncate(journalSize - 3)
+        journalFile.close()
+
+        recovered = self.recover()
+
+        self.assertEqual(len(recovered.fleets), 1)
+        self.assertEqual(len(recovered.finishes), 1)
+
+    def testRecoverFromPreviousGenerationWhenSnapshotCorrupt(self):
+        fleet1 = self.raceManager.createFleet()
+        self.raceManager.startRaceSequenceWithoutWarning()
+        for i in range(COMPACT_AFTER_RECORDS + 10):
+            self.raceManager.createFinish(fleet=fleet1)
+        self.writeQueuedCommands()
+        # corrupt a byte in the middle of the current snapshot
+        snapshotFile = open(self.recoveryFilename, "r+b")
+        snapshotFile.seek(os.path.getsize(self.recoveryFilename) / 2)
+        snapshotFile.write("X")
+        snapshotFile.close()
+
+        recovered = self.recover()
+
+        self.assertEqual(len(recovered.finishes), COMPACT_AFTER_RECORDS + 10)
+
+    def testNewSessionDoesNotReplayPreviousSession(self):
+        fleet1 = self.raceManager.createFleet()
+        for i in range(20):
+            self.raceManager.createFinish(fleet=fleet1)
+        self.writeQueuedCommands()
+
+        # start again with a new race, without recovering
+        self.raceManager = model.race.RaceManager()
+        self.recoveryManager = RaceRecoveryManager(self.recoveryFilename, self.raceManager)
+        self.raceManager.createFleet("New race")
+        recovered = self.recover()
+
+        self.assertEqual([fleet.name for fleet in recovered.fleets], ["New race"])
+        self.assertEqual(len(recovered.finishes), 0)
+
+    #
+    # Start a new session, without recovering, crashing in the writer thread when it calls
+    # the named function of module
+    #
+    def startNewSessionCrashingIn(self, module, functionName, numberFinishes=20):
+        fleet1 = self.raceManager.createFleet("Old race")
+        for i in range(numberFinishes):
+            self.raceManager.createFinish(fleet=fleet1)
+        self.writeQueuedCommands()
+
+        self.raceManager = model.race.RaceManager()
+        self.recoveryManager = RaceRecoveryManager(self.recoveryFilename, self.raceManager)
+        self.raceManager.createFleet("New race")
+        function = getattr(module, functionName)
+        setattr(module, functionName, crash)
+        try:
+            self.assertRaises(SimulatedCrash, self.writeQueuedCommands)
+        finally:
+            setattr(module, functionName, function)
+        return RaceRecoveryManager(self.recoveryFilename).recoverRaceManager()
+
+    def testCrashBeforeNewSnapshotIsInPlaceKeepsPreviousSession(self):
+        recovered = self.startNewSessionCrashingIn(persistence.recovery, "replaceFile")
+
+        self.assertEqual([fleet.name for fleet in recovered.fleets], ["Old race"])
+        self.assertEqual(len(recovered.finishes), 20)
+
+    def testCrashAfterNewSnapshotIsInPlaceDoesNotReplayPreviousSession(self):
+        # crash once the new snapshot is in place, before the old journals are deleted
+        recovered = self.startNewSessionCrashingIn(os, "remove")
+
+        self.assertEqual([fleet.name for fleet in recovered.fleets], [])
+        self.assertEqual(len(recovered.finishes), 0)
+
+    def testPreviousGenerationIsKeptUntilNewSnapshotIsSynced(self):
+        # the previous session compacts its journal, so it has a previous generation
+        self.startNewSessionCrashingIn(persistence.recovery, "syncDirectory", COMPACT_AFTER_RECORDS + 10)
+
+        self.assertTrue(os.path.exists(self.recoveryManager.previousPickleFilename))
+
+    def testEncodeAndDecodeSnapshot(self):
+        fleet1 = self.raceManager.createFleet("Large handicap")
+        self.raceManager.startRaceSequenceWithWarning()
+        self.raceManager.createFinish(fleet=fleet1)
+        self.raceManager.createFinish()
+
+        (sequence, decoded) = decodeSnapshot(encodeSnapshot(42, self.raceManager))
+
+        self.assertEqual(sequence, 42)
+        self.assertEqual(decoded.fleets[0].startTime, fleet1.startTime)
+        self.assertEqual([finish.finishTime for finish in decoded.finishes],
+                         [finish.finishTime for finish in self.raceManager.finishes])
+        self.assertEqual(decoded.finishes[0].fleet, decoded.fleets[0])
+        self.assertEqual(decoded.finishWithId("2").finishId, "2")
+        self.assertEqual(decoded.nextFinishId, 3)
+
+    def testEncodeAndDecodeSnapshotOfManyFinishes(self):
+        fleet1 = self.raceManager.createFleet("Large handicap")
+        self.raceManager.startRaceSequenceWithWarning()
+        finishTime = datetime.datetime(2026, 10, 17, 14, 0, 0)
+        # a whole chunk of packed finishes, and some left over
+        for i in range(PACKED_FINISHES_PER_CHUNK + 3):
+            self.raceManager.createFinish(fleet=[fleet1, None][i % 2],
+                                          finishTime=finishTime + datetime.timedelta(seconds=i))
+
+        (sequence, decoded) = decodeSnapshot(encodeSnapshot(42, self.raceManager))
+
+        self.assertEqual([(finish.finishId, finish.finishTime, finish.fleet and finish.fleet.fleetId) for finish in decoded.finishes],
+                         [(finish.finishId, finish.finishTime, finish.fleet and finish.fleet.fleetId) for finish in self.raceManager.finishes])
+        self.assertEqual([finish.finishId for finish in decoded.provisionalResults(decoded.fleets[0])],
+                         [finish.finishId for finish in self.raceManager.provisionalResults(fleet1)])
+        self.assertEqual(decoded.numberFinishesWithoutFleet(), self.raceManager.numberFinishesWithoutFleet())
+        self.assertEqual(decoded.finishWithId(str(PACKED_FINISHES_PER_CHUNK + 2)).finishTime,
+                         finishTime + datetime.timedelta(seconds=PACKED_FINISHES_PER_CHUNK + 1))
+
+    def testRecoverVersion1Snapshot(self):
+        fleet1 = self.raceManager.createFleet("Large handicap")
+        self.raceManager.createFinish(fleet=fleet1)
+        # a snapshot written before we had schema versions is a plain pickle of the race manager
+        snapshotFile = open(self.recoveryFilename, "wb")
+        pickle.dump(self.raceManager, snapshotFile)
+        snapshotFile.close()
+
+        recovered = RaceRecoveryManager(self.recoveryFilename).recoverRaceManager()
+
+        self.assertEqual(recovered.fleets[0].name, "Large handicap")
+        self.assertEqual(recovered.finishes[0].fleet, recovered.fleets[0])
+
+    def testStopRemovesRecoveryFiles(self):
+        self.raceManager.createFleet()
+        self.recoveryManager.stop()
+        self.writeQueuedCommands()
+
+        self.assertFalse(self.recoveryManager.hasRecoveryFile())
+        self.assertFalse(os.path.exists(self.recoveryManager.journalFilename))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,142 +10,486 @@ You will need to download PyAudio, see http://people.csail.mit.edu/hubert/pyaudi
 
 @author: MBradley
 '''
-import pyaudio
 import wave
 import Queue
 import time
 import logging
+import audioop
 
 from StringIO import StringIO
+from model.utils import monotonicSeconds
+from model.race import WARNING_BEEPS
 
 CHUNK=1024
 
+#
+# When more clips are playing than we can mix, we drop the lowest priority
+# clip. Guns have a higher priority than beeps.
+#
+MAX_VOICES = 4
+PRIORITY_WARNING = 1
+PRIORITY_GUN = 2
+CLIP_PRIORITIES = {"gun": PRIORITY_GUN}
+
+#
+# A clip that starts more than this late has missed its deadline. We drop a beep
+# that has missed its deadline, because a late beep is misleading; a gun that has
+# missed its deadline is still fired, but counted as late.
+#
+MAX_LATENESS_SECONDS = 0.1
+
+#
+# The countdown tracks that the audio manager renders from the warning and gun clips
+# when it starts. Each is WARNING_BEEPS warning beeps a second apart, followed by the
+# final clip. The key is the name of the track, the value the name of its final clip.
+#
+GUN_COUNTDOWN = "gunCountdown"
+WARNING_COUNTDOWN = "warningCountdown"
+COUNTDOWN_TRACKS = {GUN_COUNTDOWN: "gun", WARNING_COUNTDOWN: "warning"}
+BEEP_SPACING_SECONDS = 1
+
+#
+# Tracks we have rendered, keyed by the clips they were rendered from, the number
+# and spacing of the beeps and the output format.
+#
+renderedTracks = {}
+
+#
+# An audio clip is decoded from its WAV file to raw PCM frames once, when it is
+# loaded, so playing it is just a matter of writing the frames to a stream.
+#
 class AudioClip:
-    def __init__(self, wavFilename):
+    
+    # a clip that starts late plays from the beginning
+    skipsWhenLate = False
+    
+    def __init__(self, wavFilename, priority=PRIORITY_WARNING):
         self.wavFilename = wavFilename
+        self.priority = priority
         self.readFileToMemory()
         self.wavDuration = self.calculateDuration()
 
     def readFileToMemory(self):
         # see http://stackoverflow.com/questions/8195544/how-to-play-wav-data-right-from-memory
         fileOnDisk = open(self.wavFilename,'rb')
-        self.fileInMemory = StringIO(fileOnDisk.read())
+        fileInMemory = StringIO(fileOnDisk.read())
         fileOnDisk.close()
 
+        wav = wave.open(fileInMemory)
+        self.sampleWidth = wav.getsampwidth()
+        self.channels = wav.getnchannels()
+        self.rate = wav.getframerate()
+        self.numberFrames = wav.getnframes()
+        self.frames = wav.readframes(self.numberFrames)
+        wav.close()
+
 
     def calculateDuration(self):
-        self.openWav()
-        numberFrames = self.wav.getnframes()
-        rate = self.wav.getframerate()
-        duration = int(1000 * (numberFrames / float(rate)))
+        duration = int(1000 * (self.numberFrames / float(self.rate)))
         return duration
 
-    def openWav(self):
-        self.fileInMemory.seek(0)
-        self.wav = wave.open(self.fileInMemory)
-        pass
-                
+    #
+    # Clips with the same sample format can be played on the same stream
+    #
+    def sampleFormat(self):
+        return (self.sampleWidth, self.channels, self.rate)
+
+    #
+    # Convert our frames to another sample format, so that we can be mixed with
+    # clips in that format
+    #
+    def convertTo(self, sampleFormat):
+        (sampleWidth, channels, rate) = sampleFormat
+        frames = self.frames
+        if self.sampleWidth == 1:
+            # 8 bit WAV samples are unsigned, audioop expects signed
+            frames = audioop.bias(frames, 1, -128)
+        if self.sampleWidth != sampleWidth:
+            frames = audioop.lin2lin(frames, self.sampleWidth, sampleWidth)
+        if self.channels == 2 and channels == 1:
+            frames = audioop.tomono(frames, sampleWidth, 0.5, 0.5)
+        elif self.channels == 1 and channels == 2:
+            frames = audioop.tostereo(frames, sampleWidth, 1, 1)
+        if self.rate != rate:
+            (frames, state) = audioop.ratecv(frames, sampleWidth, channels, self.rate, rate, None)
+        self.frames = frames
+        (self.sampleWidth, self.channels, self.rate) = sampleFormat
+        self.numberFrames = len(frames) / (sampleWidth * channels)
+
+    def playOn(self,audioManager,startFrame=0):
+        audioManager.startVoice(self,startFrame)
 
+#
+# A track is a clip rendered from other clips rather than read from a WAV file. It is a
+# whole countdown, so if it starts late we skip the part we have missed, keeping the
+# beeps and the gun on time.
+#
+class AudioTrack(AudioClip):
     
-    def playOn(self,audioManager):
-        self.openWav()
-        audioManager.playWav(self.wav)
-        
-        
+    skipsWhenLate = True
+    
+    def __init__(self, frames, sampleFormat, priority=PRIORITY_WARNING):
+        self.wavFilename = None
+        self.priority = priority
+        self.frames = frames
+        (self.sampleWidth, self.channels, self.rate) = sampleFormat
+        self.numberFrames = len(frames) / (self.sampleWidth * self.channels)
+        self.wavDuration = self.calculateDuration()
+
+#
+# Render a countdown track: numberBeeps of the beep clip, spacingSeconds apart, then the
+# final clip. Both clips must already be in the same sample format.
+#
+def renderCountdownTrack(beepClip, finalClip, numberBeeps, spacingSeconds, priority):
+    (sampleWidth, channels, rate) = beepClip.sampleFormat()
+    frameSize = sampleWidth * channels
+    beepOffsets = [int(beep * spacingSeconds * rate) * frameSize for beep in range(numberBeeps)]
+    finalOffset = int(numberBeeps * spacingSeconds * rate) * frameSize
+    
+    trackLength = max([offset + len(beepClip.frames) for offset in beepOffsets] + [finalOffset + len(finalClip.frames)])
+    frames = '\0' * trackLength
+    for (offset, clipFrames) in [(offset, beepClip.frames) for offset in beepOffsets] + [(finalOffset, finalClip.frames)]:
+        end = offset + len(clipFrames)
+        frames = frames[:offset] + audioop.add(frames[offset:end], clipFrames, sampleWidth) + frames[end:]
+    return AudioTrack(frames, beepClip.sampleFormat(), priority)
+
+
+#
+# A voice is a clip that the audio manager is part way through playing
+#
+class AudioVoice:
+    def __init__(self, clip, startFrame=0):
+        self.clip = clip
+        self.position = startFrame * clip.sampleWidth * clip.channels
+
+    #
+    # The next numberBytes of the clip, padded with silence once we reach its end
+    #
+    def readBytes(self, numberBytes):
+        frames = self.clip.frames[self.position:self.position + numberBytes]
+        self.position = self.position + len(frames)
+        return frames + '\0' * (numberBytes - len(frames))
+
+    def isFinished(self):
+        return self.position >= len(self.clip.frames)
+
+
+
+#
+# An audio sink is where the audio manager writes the frames of the clips it plays.
+# The sink keeps one output stream open for each sample format for the whole session,
+# so that playing a clip doesn't have to wait for the sound device to open.
+#
+class AudioSink:
+
+    def write(self, sampleFormat, frames):
+        pass
+
+    #
+    # How long, in seconds, between writing frames and hearing them
+    #
+    def outputLatency(self, sampleFormat):
+        return 0.0
+
+    def close(self):
+        pass
+
+
+#
+# Plays the frames through the sound card, using PyAudio
+#
+class PyAudioSink(AudioSink):
+
+    def __init__(self):
+        # we only need PyAudio if we are playing through the sound card
+        import pyaudio
+        # create our instance of PyAudio
+        self.portAudio = pyaudio.PyAudio()
+        self.streams = {}
+
+    def streamFor(self, sampleFormat):
+        if sampleFormat not in self.streams:
+            (sampleWidth, channels, rate) = sampleFormat
+            logging.info("Opening audio stream for %d byte samples, %d channels at %d Hz" % sampleFormat)
+            self.streams[sampleFormat] = self.portAudio.open(format=self.portAudio.get_format_from_width(sampleWidth),
+                channels=channels,
+                rate=rate,
+                frames_per_buffer=CHUNK,
+                output=True)
+        return self.streams[sampleFormat]
+
+    def write(self, sampleFormat, frames):
+        self.streamFor(sampleFormat).write(frames)
+
+    def outputLatency(self, sampleFormat):
+        return self.streamFor(sampleFormat).get_output_latency()
+
+    def close(self):
+        for stream in self.streams.values():
+            stream.stop_stream()
+            stream.close()
+        self.streams = {}
+        self.portAudio.terminate()
+
+#
+# Throws the frames away. Use this to run without a sound card.
+#
+class NullAudioSink(AudioSink):
+
+    def __init__(self):
+        self.framesWritten = 0
+
+    def write(self, sampleFormat, frames):
+        (sampleWidth, channels, rate) = sampleFormat
+        self.framesWritten = self.framesWritten + len(frames) / (sampleWidth * channels)
+
+#
+# Writes the frames to WAV files, one for each sample format, named from
+# filenamePrefix and the format, e.g. prefix-2-2-44100.wav. Use this to hear
+# what would have been played.
+#
+class WavFileAudioSink(AudioSink):
+
+    def __init__(self, filenamePrefix):
+        self.filenamePrefix = filenamePrefix
+        self.wavFiles = {}
+
+    def filenameFor(self, sampleFormat):
+        return "%s-%d-%d-%d.wav" % ((self.filenamePrefix,) + sampleFormat)
+
+    def write(self, sampleFormat, frames):
+        if sampleFormat not in self.wavFiles:
+            (sampleWidth, channels, rate) = sampleFormat
+            wavFile = wave.open(self.filenameFor(sampleFormat), "wb")
+            wavFile.setsampwidth(sampleWidth)
+            wavFile.setnchannels(channels)
+            wavFile.setframerate(rate)
+            self.wavFiles[sampleFormat] = wavFile
+        self.wavFiles[sampleFormat].writeframes(frames)
 
+    def close(self):
+        for wavFile in self.wavFiles.values():
+            wavFile.close()
+        self.wavFiles = {}
 
 
+#
+# The audio manager mixes the clips it is asked to play, so a gun doesn't have to wait
+# for a beep or another gun to finish. It writes the mix to the sink a chunk at a time,
+# and picks up newly queued clips between chunks, so the time to start a clip is the
+# same however many clips are queued or playing.
+#
+# All the clips are converted to one output format when they are loaded: 16 bit,
+# at the sample rate of the first clip, in stereo if any clip is stereo.
+#
 class AudioManager:
-    
+
     #
     # Parameter is a list of tuples of symbolic name of wav and filename, e.g
     # [('horn','c:\music\horn.wav),('beep','c:\music\beep.wav')]
     #
-    def __init__(self, wavFiles):
-        # create our instance of PyAudio
-        self.portAudio = pyaudio.PyAudio()
-        # create a dictionary of audio clips           
+    # By default, we play through the sound card. Pass another AudioSink to play
+    # somewhere else.
+    #
+    def __init__(self, wavFiles, audioSink=None):
+        if audioSink is None:
+            audioSink = PyAudioSink()
+        self.audioSink = audioSink
+        # create a dictionary of audio clips
         self.audioClips = {}
-        
+
         for (clipname,wavFilename) in wavFiles:
-            
-            self.audioClips[clipname] = AudioClip(wavFilename)
-            
+
+            self.audioClips[clipname] = AudioClip(wavFilename, CLIP_PRIORITIES.get(clipname, PRIORITY_WARNING))
+
+        self.outputFormat = self.chooseOutputFormat(wavFiles)
+        for clip in self.audioClips.values():
+            clip.convertTo(self.outputFormat)
+        self.renderCountdownTracks()
 
         self.commandQueue = Queue.Queue()
         self.isPlaying = False
+        self.voices = []
         
-        
-    
+        # how many clips started on time, started late or were dropped
+        self.onTimeClipCount = 0
+        self.lateClipCount = 0
+        self.droppedClipCount = 0
+
+        # trigger to sound latency, in seconds: from a clip being queued to it being heard
+        self.playCount = 0
+        self.totalLatency = 0.0
+        self.lastLatency = 0.0
+        self.worstLatency = 0.0
+
+
+
+
+
+    #
+    # Render each countdown track from our clips, so that a whole countdown can be played,
+    # sample accurately, as one clip. We can only render the tracks whose clips we have.
+    #
+    def renderCountdownTracks(self):
+        beepClip = self.audioClips.get("warning")
+        for (trackName, finalClipName) in COUNTDOWN_TRACKS.items():
+            finalClip = self.audioClips.get(finalClipName)
+            if beepClip and finalClip:
+                trackKey = (beepClip.wavFilename, finalClip.wavFilename, WARNING_BEEPS, BEEP_SPACING_SECONDS, self.outputFormat)
+                if trackKey not in renderedTracks:
+                    logging.info("Rendering %s track" % trackName)
+                    renderedTracks[trackKey] = renderCountdownTrack(beepClip, finalClip, WARNING_BEEPS,
+                                                                    BEEP_SPACING_SECONDS, finalClip.priority)
+                self.audioClips[trackName] = renderedTracks[trackKey]
     
+    def hasClip(self, clipName):
+        return clipName in self.audioClips
 
+    def chooseOutputFormat(self, wavFiles):
+        if not wavFiles:
+            return (2, 1, 44100)
+        firstClip = self.audioClips[wavFiles[0][0]]
+        channels = max([clip.channels for clip in self.audioClips.values()])
+        return (2, channels, firstClip.rate)
 
-    def playClip(self,clipName):
+    #
+    # Play a clip, which should start at targetSeconds on the monotonic clock. 
+    #
+    def playClip(self,clipName,targetSeconds=None,maxLateness=MAX_LATENESS_SECONDS):
+        clip = self.audioClips[clipName]
+        startFrame = 0
+        if targetSeconds is not None:
+            lateness = monotonicSeconds() - targetSeconds
+            if lateness > maxLateness and clip.skipsWhenLate:
+                logging.warn("Playing %s from %d milliseconds in" % (clipName, lateness * 1000))
+                self.lateClipCount = self.lateClipCount + 1
+                startFrame = int(lateness * clip.rate)
+            elif lateness > maxLateness:
+                if clip.priority < PRIORITY_GUN:
+                    logging.warn("Dropping %s, %d milliseconds late" % (clipName, lateness * 1000))
+                    self.droppedClipCount = self.droppedClipCount + 1
+                    return
+                logging.warn("Playing %s %d milliseconds late" % (clipName, lateness * 1000))
+                self.lateClipCount = self.lateClipCount + 1
+            else:
+                self.onTimeClipCount = self.onTimeClipCount + 1
+            # if we skipped part of the clip, the part we play was due later
+            soundSeconds = monotonicSeconds() + self.audioSink.outputLatency(self.outputFormat)
+            self.recordLatency(soundSeconds - targetSeconds - startFrame / float(clip.rate))
         self.isPlaying = True
         logging.debug("Playing wav")
-        self.audioClips[clipName].playOn(self)
+        clip.playOn(self,startFrame)
+
+    #
+    # Start mixing in a clip. A beep that is still playing when the same beep is
+    # played again is stale, so the new beep replaces it. If we then have too many
+    # voices, we drop the lowest priority, oldest voice.
+    #
+    def startVoice(self,clip,startFrame=0):
+        if clip.priority < PRIORITY_GUN:
+            staleVoices = [voice for voice in self.voices if voice.clip is clip]
+            for voice in staleVoices:
+                self.dropVoice(voice)
+        self.voices.append(AudioVoice(clip,startFrame))
+        while len(self.voices) > MAX_VOICES:
+            lowestPriority = min([voice.clip.priority for voice in self.voices])
+            self.dropVoice([voice for voice in self.voices if voice.clip.priority == lowestPriority][0])
+
+    def dropVoice(self,voice):
+        self.voices.remove(voice)
+        self.droppedClipCount = self.droppedClipCount + 1
+
+    #
+    # Mix the next chunk of all of our voices, and forget any voices that have finished
+    #
+    def mixChunk(self):
+        (sampleWidth, channels, rate) = self.outputFormat
+        chunkBytes = CHUNK * sampleWidth * channels
+        mixed = None
+        for voice in list(self.voices):
+            frames = voice.readBytes(chunkBytes)
+            if mixed is None:
+                mixed = frames
+            else:
+                mixed = audioop.add(mixed, frames, sampleWidth)
+            if voice.isFinished():
+                self.voices.remove(voice)
+        self.isPlaying = len(self.voices) > 0
+        return mixed
+
+    def recordLatency(self, latency):
+        self.playCount = self.playCount + 1
+        self.totalLatency = self.totalLatency + latency
+        self.lastLatency = latency
+        self.worstLatency = max(self.worstLatency, latency)
+
+    def averageLatency(self):
+        if self.playCount:
+            return self.totalLatency / self.playCount
+        else:
+            return 0.0
 
-        
-    def playWav(self,wav):
-        stream = self.portAudio.open(format=self.portAudio.get_format_from_width(wav.getsampwidth()),
-                channels=wav.getnchannels(),
-                rate=wav.getframerate(),
-                output=True)
-        data = wav.readframes(CHUNK)
-        while data != '':
-            stream.write(data)
-            data = wav.readframes(CHUNK)
-        stream.stop_stream() 
-        stream.close()
-            
     #
     # The audio manager is designed to run synchronously in its own thread, using a Queue.Queue
-    # to queue requests to play audio files using a command pattern.    #
+    # to queue requests to play audio files using a command pattern. While we have voices to
+    # mix, we only pick up the commands that are already queued; otherwise we block for the
+    # next command. When we are stopped, we finish playing our voices.
+    #
     def run(self):
         self.isRunning = True
-        while self.isRunning:
-            try:
+        while self.isRunning or self.voices:
+            if self.isRunning:
+                self.executeQueuedCommands(block=not self.voices)
+            if self.voices:
+                self.audioSink.write(self.outputFormat, self.mixChunk())
+        self.audioSink.close()
+
+    def executeQueuedCommands(self,block):
+        try:
+            if block:
                 logging.debug("Waiting on audio manager command queue")
-                command = self.commandQueue.get(block=True)
+            command = self.commandQueue.get(block=block)
+            while True:
                 command.executeOn(self)
-                
-            except Queue.Empty:
-                # we do nothing if the queue is empty. This should never happen, because we are
-                # blocking for ever.
-                pass
-        self.portAudio.terminate()
-            
+                command = self.commandQueue.get(block=False)
+        except Queue.Empty:
+            # nothing more is queued
+            pass
+
     #
-    # This method is called from within the Tkinter event thread.
+    # This method is called from within the Tkinter event thread, or the gun scheduler's
+    # thread. The clip should start at targetSeconds on the monotonic clock, by default now,
+    # and has missed its deadline if it starts more than maxLateness seconds after that.
     #
-    def queueClip(self,clipName):
-        self.commandQueue.put(AudioManagerPlayClip(clipName))
-        
-    
+    def queueClip(self,clipName,targetSeconds=None,maxLateness=MAX_LATENESS_SECONDS):
+        if targetSeconds is None:
+            targetSeconds = monotonicSeconds()
+        self.commandQueue.put(AudioManagerPlayClip(clipName, targetSeconds, maxLateness))
+
+
     def stop(self):
         self.commandQueue.put(AudioManagerStop())
-    
+
     #
     # if you want to know how many queued, check for the queue length
     #
     def queueLength(self):
         return self.commandQueue.qsize()
-        
+
 
 class AudioManagerCommand:
     def executeOn(self, anAudioManager):
         pass
-    
+
 class AudioManagerPlayClip(AudioManagerCommand):
-    def __init__(self,clipName):
+    def __init__(self,clipName,targetSeconds=None,maxLateness=MAX_LATENESS_SECONDS):
         self.clipName = clipName
-        
+        self.targetSeconds = targetSeconds
+        self.maxLateness = maxLateness
+
     def executeOn(self, anAudioManager):
-        anAudioManager.playClip(self.clipName)
-        
+        anAudioManager.playClip(self.clipName, self.targetSeconds, self.maxLateness)
+
 class AudioManagerStop(AudioManagerCommand):
     def executeOn(self, anAudioManager):
         anAudioManager.isRunning = False
-        
-        
-
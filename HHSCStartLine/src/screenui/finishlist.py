@@ -0,0 +1,160 @@
+'''
+Created on 17 Oct 2026
+
+The finish list shows the finishes in a Treeview, but only the finishes that fit in
+the view are ever inserted into it. A long pursuit race, or a series run over several
+days, can have thousands of finishes, and a Treeview with thousands of items makes
+every insert, and rebuilding the view after recovery, slow.
+'''
+
+#
+# scroll this many rows for each click of the mouse wheel
+#
+WHEEL_ROWS = 3
+
+
+#
+# VirtualFinishList shows a window of the finishes in the Treeview: the rowCount finishes
+# from firstRow. The finishes are the race manager's finish store, or any sequence that
+# can give the position of a finish with index(), which we share rather than copy. Each finish in the window is a Treeview item with
+# the finish id as its item id, so selecting and updating a finish works as it would if
+# every finish were in the Treeview.
+#
+# We drive the scrollbar ourselves. Moving the window deletes the finishes that leave it
+# and inserts the finishes that enter it, so adding a finish while the list is showing
+# the latest finishes is one insert and one delete, however many finishes there are.
+#
+# renderRow renders a finish as the (text, values) of its Treeview item.
+#
+class VirtualFinishList:
+
+    def __init__(self, treeView, scrollbar, renderRow, rowHeight):
+        self.treeView = treeView
+        self.scrollbar = scrollbar
+        self.renderRow = renderRow
+        self.rowHeight = rowHeight
+
+        self.finishes = []
+        self.firstRow = 0
+        self.rowCount = int(treeView.cget("height"))
+        # the finishes in the Treeview, in order
+        self.shownFinishes = []
+        self.selectedFinish = None
+
+        self.scrollbar.configure(command=self.yview)
+        self.treeView.bind("<Configure>", self.handleConfigure)
+        self.treeView.bind("<MouseWheel>", self.handleMouseWheel)
+        self.treeView.bind("<Button-4>", lambda event: self.scrollRows(-WHEEL_ROWS))
+        self.treeView.bind("<Button-5>", lambda event: self.scrollRows(WHEEL_ROWS))
+
+    #
+    # Show different finishes, for example after recovery, from the latest
+    #
+    def setFinishes(self, finishes):
+        self.finishes = finishes
+        self.showRows(self.lastFirstRow())
+
+    #
+    # A finish has been added to the end of the finishes. If we were showing the latest
+    # finishes, we move on to show it
+    #
+    def finishAppended(self, finish):
+        isShowingLatest = self.firstRow >= max(0, len(self.finishes) - 1 - self.rowCount)
+        if isShowingLatest:
+            self.showRows(self.lastFirstRow())
+        else:
+            self.updateScrollbar()
+
+    #
+    # A finish has changed. If it is in the Treeview, render it again
+    #
+    def refreshFinish(self, finish):
+        if self.isShown(finish):
+            (text, values) = self.renderRow(finish)
+            self.treeView.item(finish.finishId, text=text, values=values)
+
+    def isShown(self, finish):
+        try:
+            position = self.finishes.index(finish)
+        except ValueError:
+            return False
+        return self.firstRow <= position < self.firstRow + self.rowCount
+
+    #
+    # Select a finish, scrolling to it if it isn't shown
+    #
+    def selectFinish(self, finish):
+        self.selectedFinish = finish
+        if not self.isShown(finish):
+            self.showRows(min(self.finishes.index(finish), self.lastFirstRow()))
+        self.treeView.selection_set(finish.finishId)
+
+    def lastFirstRow(self):
+        return max(0, len(self.finishes) - self.rowCount)
+
+    def scrollRows(self, rows):
+        self.showRows(self.firstRow + rows)
+
+    #
+    # Show the window of finishes from firstRow, only deleting and inserting the finishes
+    # that leave and enter it.
+    #
+    def showRows(self, firstRow):
+        self.firstRow = max(0, min(firstRow, self.lastFirstRow()))
+        windowFinishes = self.finishes[self.firstRow:self.firstRow + self.rowCount]
+
+        windowIds = set([finish.finishId for finish in windowFinishes])
+        for finish in self.shownFinishes:
+            if finish.finishId not in windowIds:
+                self.treeView.delete(finish.finishId)
+
+        # the finishes that stay are still in order, so we can insert each new finish at its place in the window
+        shownIds = set([finish.finishId for finish in self.shownFinishes])
+        for (index, finish) in enumerate(windowFinishes):
+            if finish.finishId not in shownIds:
+                (text, values) = self.renderRow(finish)
+                self.treeView.insert(parent="", index=index, iid=finish.finishId, text=text, values=values)
+        self.shownFinishes = windowFinishes
+
+        # a selected finish that scrolls back into view is selected again
+        if self.selectedFinish and self.selectedFinish.finishId in windowIds and self.selectedFinish.finishId not in shownIds:
+            self.treeView.selection_set(self.selectedFinish.finishId)
+        self.updateScrollbar()
+
+    def updateScrollbar(self):
+        if self.finishes:
+            self.scrollbar.set(float(self.firstRow) / len(self.finishes),
+                               float(min(self.firstRow + self.rowCount, len(self.finishes))) / len(self.finishes))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    #
+    # The scrollbar's command, called as yview("moveto", fraction) or yview("scroll", number, "units" or "pages")
+    #
+    def yview(self, *args):
+        if args[0] == "moveto":
+            self.showRows(int(round(float(args[1]) * len(self.finishes))))
+        elif args[0] == "scroll":
+            if args[2] == "pages":
+                self.scrollRows(int(args[1]) * self.rowCount)
+            else:
+                self.scrollRows(int(args[1]))
+
+    def handleMouseWheel(self, event):
+        if event.delta > 0:
+            self.scrollRows(-WHEEL_ROWS)
+        else:
+            self.scrollRows(WHEEL_ROWS)
+
+    #
+    # The Treeview has been resized. Show as many finishes as fit, below the headings
+    #
+    def handleConfigure(self, event):
+        rowCount = max(1, event.height / self.rowHeight - 1)
+        if rowCount != self.rowCount:
+            isShowingLatest = self.firstRow >= self.lastFirstRow()
+            self.rowCount = rowCount
+            if isShowingLatest:
+                self.showRows(self.lastFirstRow())
+            else:
+                self.showRows(self.firstRow)
@@ -16,6 +16,9 @@ from ttk import *
 
 from model.race import RaceManager
 
+# the height of a row in our treeviews, in pixels
+TREEVIEW_ROW_HEIGHT = 30
+
 class StartLineFrame(Frame):
     '''
     classdocs
@@ -38,16 +41,16 @@ class StartLineFrame(Frame):
         # Read the screen width and height and force the frame to use these dimensions
        
         screenWidth=self.winfo_screenwidth()
-	       screenHeight=self.winfo_screenheight()
-	       geom_string = "%dx%d+0+0" % (screenWidth,screenHeight)
-	       top.wm_geometry(geom_string)  
+        screenHeight=self.winfo_screenheight()
+        geom_string = "%dx%d+0+0" % (screenWidth,screenHeight)
+        top.wm_geometry(geom_string)  
         top.rowconfigure(0, weight=1)            
         top.columnconfigure(0, weight=1)
         
         style = Style()
         #style.theme_use('winnative')
         style.configure('.', font=('Helvetica',16))
-        style.configure('Treeview',rowheight=30)
+        style.configure('Treeview',rowheight=TREEVIEW_ROW_HEIGHT)
         style.configure('TButton')
         
         
@@ -136,9 +139,11 @@ class StartLineFrame(Frame):
         #
         
         self.finishTreeView = Treeview(self,columns=["fleet","elapsedTimeSeconds"],style="Treeview")
-        ysb = Scrollbar(self, orient='vertical', command=self.finishTreeView.yview)
+        # the finish list is virtual: its controller drives the vertical scrollbar
+        ysb = Scrollbar(self, orient='vertical')
         xsb = Scrollbar(self, orient='horizontal', command=self.finishTreeView.xview)
-        self.finishTreeView.configure(yscroll=ysb.set, xscroll=xsb.set)
+        self.finishTreeView.configure(xscroll=xsb.set)
+        self.finishScrollbar = ysb
         
         
         
@@ -282,7 +287,7 @@ class AddFleetDialog:
     def createWidgets(self):
         style = Style()
         style.configure('.', font=('Helvetica',16))
-        style.configure('Treeview',rowheight=30)
+        style.configure('Treeview',rowheight=TREEVIEW_ROW_HEIGHT)
         
         label = Label(self.frame, text='Choose from the list:')
         label.pack()
@@ -0,0 +1,52 @@
+'''
+Created on 17 Oct 2026
+
+The render cache sits between the controllers and Tk. It remembers the last value
+rendered into each treeview cell and each label's variable, and only calls Tk when
+a value has changed. On the netbooks we use at the club, Tk calls are most of the
+cost of refreshing the screen, and most cells (a pending fleet's status, the
+connection status) don't change from one refresh to the next.
+'''
+
+
+#
+# RenderCache keeps the last rendered value for each cell, keyed by (treeview, row id,
+# column), and for each Tk variable. Forget a row when it is deleted from its treeview,
+# or when it is inserted with values that didn't go through the cache.
+#
+# We count the Tk calls we make and the ones we save, so that we can see the effect.
+#
+class RenderCache:
+
+    def __init__(self):
+        self.renderedCells = {}
+        self.renderedVariables = {}
+        self.changedCount = 0
+        self.unchangedCount = 0
+
+    def isChanged(self, renderedValues, key, value):
+        if key in renderedValues and renderedValues[key] == value:
+            self.unchangedCount = self.unchangedCount + 1
+            return False
+        renderedValues[key] = value
+        self.changedCount = self.changedCount + 1
+        return True
+
+    #
+    # Render a row's values into the given columns, setting only the cells that have changed
+    #
+    def setCells(self, treeView, rowId, columns, values):
+        for (column, value) in zip(columns, values):
+            if self.isChanged(self.renderedCells, (treeView, rowId, column), value):
+                treeView.set(rowId, column, value)
+
+    def forgetRow(self, treeView, rowId):
+        for key in [key for key in self.renderedCells if key[0] is treeView and key[1] == rowId]:
+            del self.renderedCells[key]
+
+    #
+    # Set a Tk variable, such as a label's StringVar, if its value has changed
+    #
+    def setVariable(self, variable, value):
+        if self.isChanged(self.renderedVariables, variable, value):
+            variable.set(value)
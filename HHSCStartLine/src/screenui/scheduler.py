@@ -0,0 +1,156 @@
+'''
+Created on 17 Oct 2026
+
+The gun scheduler times guns and warning beeps on its own thread, so that they
+go off on time even when the Tk event loop is busy, for example redrawing the
+fleets view or waiting on a message box during a general recall.
+'''
+import threading
+import heapq
+import time
+import logging
+
+from model.utils import monotonicSeconds
+
+#
+# Waiting on a condition with a timeout is not precise (on Python 2 it polls,
+# sleeping up to 50 milliseconds at a time), so we only wait on the condition
+# until this close to a clip being due. We then sleep for the rest of the time.
+#
+FINE_SLEEP_SECONDS = 0.06
+
+
+#
+# GunScheduler plays audio clips through the AudioManager at times measured on
+# a monotonic clock. Schedule a clip with scheduleClip; this returns an id that
+# can be passed to cancel.
+#
+# The scheduler keeps track of how late it dispatches each clip, so we can
+# show the race officer how well the guns are keeping time.
+#
+class GunScheduler:
+
+    def __init__(self, audioManager):
+        self.audioManager = audioManager
+        self.condition = threading.Condition()
+        # a heap of (due seconds, schedule id, clip name)
+        self.schedule = []
+        self.cancelledIds = set()
+        # the clip we are sleeping until it is due, which can still be cancelled
+        self.dispatchingId = None
+        self.nextScheduleId = 1
+        self.isRunning = True
+
+        # dispatch lateness, in seconds
+        self.dispatchCount = 0
+        self.totalLateness = 0.0
+        self.lastLateness = 0.0
+        self.worstLateness = 0.0
+
+    #
+    # Schedule a clip to play in delayMillis milliseconds. This method is called from
+    # within the Tkinter event thread.
+    #
+    def scheduleClip(self, delayMillis, clipName):
+        with self.condition:
+            scheduleId = self.nextScheduleId
+            self.nextScheduleId = self.nextScheduleId + 1
+            dueSeconds = monotonicSeconds() + delayMillis / 1000.0
+            heapq.heappush(self.schedule, (dueSeconds, scheduleId, clipName))
+            self.condition.notify()
+        return scheduleId
+
+    #
+    # Cancel a scheduled clip. If the clip has already played, the cancel has no
+    # effect and does not fail.
+    #
+    def cancel(self, scheduleId):
+        with self.condition:
+            if scheduleId == self.dispatchingId or [entry for entry in self.schedule if entry[1] == scheduleId]:
+                self.cancelledIds.add(scheduleId)
+                self.condition.notify()
+
+    def cancelAll(self):
+        with self.condition:
+            self.schedule = []
+            self.cancelledIds = set()
+            if self.dispatchingId:
+                self.cancelledIds.add(self.dispatchingId)
+            self.condition.notify()
+
+    def scheduledCount(self):
+        with self.condition:
+            return len([entry for entry in self.schedule if entry[1] not in self.cancelledIds])
+
+    #
+    # Wait until the next clip is due and return its schedule entry, or None if
+    # we have been stopped. Call this holding the condition.
+    #
+    def waitForNextClip(self):
+        while self.isRunning:
+            # throw away any cancelled clips at the front of the schedule
+            while self.schedule and self.schedule[0][1] in self.cancelledIds:
+                self.cancelledIds.discard(heapq.heappop(self.schedule)[1])
+
+            if not self.schedule:
+                self.condition.wait()
+                continue
+
+            (dueSeconds, scheduleId, clipName) = self.schedule[0]
+            secondsToDue = dueSeconds - monotonicSeconds()
+            if secondsToDue > FINE_SLEEP_SECONDS:
+                self.condition.wait(secondsToDue - FINE_SLEEP_SECONDS)
+            else:
+                entry = heapq.heappop(self.schedule)
+                self.dispatchingId = entry[1]
+                return entry
+        return None
+
+    #
+    # Play a clip that is due, once its time has come. We don't hold the condition
+    # while sleeping, so the Tk thread can still schedule and cancel.
+    #
+    def dispatch(self, entry):
+        (dueSeconds, scheduleId, clipName) = entry
+        secondsToDue = dueSeconds - monotonicSeconds()
+        if secondsToDue > 0:
+            time.sleep(secondsToDue)
+
+        with self.condition:
+            self.dispatchingId = None
+            # we may have been cancelled while we slept
+            if scheduleId in self.cancelledIds:
+                self.cancelledIds.discard(scheduleId)
+                return
+
+        self.audioManager.queueClip(clipName, dueSeconds)
+        self.recordLateness(monotonicSeconds() - dueSeconds)
+
+    def recordLateness(self, lateness):
+        self.dispatchCount = self.dispatchCount + 1
+        self.totalLateness = self.totalLateness + lateness
+        self.lastLateness = lateness
+        self.worstLateness = max(self.worstLateness, lateness)
+        if lateness > FINE_SLEEP_SECONDS:
+            logging.warn("Clip dispatched %d milliseconds late" % (lateness * 1000))
+
+    def averageLateness(self):
+        if self.dispatchCount:
+            return self.totalLateness / self.dispatchCount
+        else:
+            return 0.0
+
+    #
+    # The gun scheduler is designed to run in its own thread.
+    #
+    def run(self):
+        while self.isRunning:
+            with self.condition:
+                entry = self.waitForNextClip()
+            if entry:
+                self.dispatch(entry)
+
+    def stop(self):
+        with self.condition:
+            self.isRunning = False
+            self.condition.notify()
@@ -0,0 +1,129 @@
+'''
+Created on 17 Oct 2026
+'''
+import unittest
+import tempfile
+import shutil
+import os
+import wave
+import audioop
+
+from screenui.audio import AudioManager, NullAudioSink, WavFileAudioSink, CHUNK, MAX_VOICES, GUN_COUNTDOWN, WARNING_COUNTDOWN
+from model.utils import monotonicSeconds
+
+MEDIA_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "media")
+
+AUDIO_CLIPS = [("gun", os.path.join(MEDIA_DIRECTORY, "1.5-Second-Horn-left.wav")),
+               ("warning", os.path.join(MEDIA_DIRECTORY, "beep-right.wav"))]
+
+class AudioManagerTest(unittest.TestCase):
+
+    def play(self, audioManager, clipNames):
+        for clipName in clipNames:
+            audioManager.queueClip(clipName)
+        audioManager.stop()
+        audioManager.run()
+
+    def testClipsAreDecodedOnLoad(self):
+        audioManager = AudioManager(AUDIO_CLIPS, NullAudioSink())
+        gun = audioManager.audioClips["gun"]
+
+        self.assertEqual(gun.sampleFormat(), (2, 2, 44100))
+        self.assertEqual(len(gun.frames), gun.numberFrames * 2 * 2)
+        self.assertEqual(gun.wavDuration, 1503)
+
+    def testPlayMeasuresLatency(self):
+        audioSink = NullAudioSink()
+        audioManager = AudioManager(AUDIO_CLIPS, audioSink)
+
+        self.play(audioManager, ["warning", "gun"])
+
+        # the clips are mixed, so we only write as many chunks as the longest clip needs
+        self.assertEqual(audioSink.framesWritten, CHUNK * (66286 / CHUNK + 1))
+        self.assertEqual(audioManager.playCount, 2)
+        self.assertTrue(0 <= audioManager.lastLatency <= audioManager.worstLatency)
+
+    def testWavFileSinkWritesOneFilePerFormat(self):
+        directory = tempfile.mkdtemp()
+        try:
+            audioSink = WavFileAudioSink(os.path.join(directory, "played"))
+            audioManager = AudioManager(AUDIO_CLIPS, audioSink)
+
+            self.play(audioManager, ["gun", "warning"])
+
+            self.assertEqual(os.listdir(directory), ["played-2-2-44100.wav"])
+            playedWav = wave.open(os.path.join(directory, "played-2-2-44100.wav"))
+            self.assertEqual(playedWav.getnframes(), CHUNK * (66286 / CHUNK + 1))
+            playedWav.close()
+        finally:
+            shutil.rmtree(directory)
+
+    def testStaleBeepIsReplaced(self):
+        audioManager = AudioManager(AUDIO_CLIPS, NullAudioSink())
+
+        audioManager.playClip("warning")
+        audioManager.mixChunk()
+        audioManager.playClip("warning")
+
+        self.assertEqual(len(audioManager.voices), 1)
+        self.assertEqual(audioManager.voices[0].position, 0)
+        self.assertEqual(audioManager.droppedClipCount, 1)
+
+    def testGunsAreNotDroppedForBeeps(self):
+        audioManager = AudioManager(AUDIO_CLIPS, NullAudioSink())
+
+        audioManager.playClip("warning")
+        for i in range(MAX_VOICES):
+            audioManager.playClip("gun")
+
+        self.assertEqual([voice.clip for voice in audioManager.voices],
+                         [audioManager.audioClips["gun"]] * MAX_VOICES)
+
+    def testMixedChunkIsSumOfClips(self):
+        audioManager = AudioManager(AUDIO_CLIPS, NullAudioSink())
+        gunChunk = audioManager.audioClips["gun"].frames[:CHUNK * 4]
+        warningChunk = audioManager.audioClips["warning"].frames[:CHUNK * 4]
+
+        audioManager.playClip("gun")
+        audioManager.playClip("warning")
+
+        self.assertEqual(audioManager.mixChunk(), audioop.add(gunChunk, warningChunk, 2))
+
+    def testLateBeepIsDroppedAndLateGunIsPlayed(self):
+        audioManager = AudioManager(AUDIO_CLIPS, NullAudioSink())
+        aSecondAgo = monotonicSeconds() - 1
+
+        audioManager.playClip("warning", aSecondAgo)
+        audioManager.playClip("gun", aSecondAgo)
+        audioManager.playClip("warning", monotonicSeconds())
+
+        self.assertEqual(audioManager.droppedClipCount, 1)
+        self.assertEqual(audioManager.lateClipCount, 1)
+        self.assertEqual(audioManager.onTimeClipCount, 1)
+        self.assertEqual(len(audioManager.voices), 2)
+
+    def testCountdownTracksAreRenderedOnce(self):
+        audioManager = AudioManager(AUDIO_CLIPS, NullAudioSink())
+        gunCountdown = audioManager.audioClips[GUN_COUNTDOWN]
+        gun = audioManager.audioClips["gun"]
+        warning = audioManager.audioClips["warning"]
+
+        # ten beeps a second apart, then the gun
+        self.assertEqual(gunCountdown.numberFrames, 10 * 44100 + gun.numberFrames)
+        self.assertEqual(gunCountdown.frames[:len(warning.frames)], warning.frames)
+        self.assertEqual(gunCountdown.frames[-len(gun.frames):], gun.frames)
+        self.assertEqual(audioManager.audioClips[WARNING_COUNTDOWN].numberFrames, 11 * 44100 - 44100 + warning.numberFrames)
+        self.assertTrue(AudioManager(AUDIO_CLIPS, NullAudioSink()).audioClips[GUN_COUNTDOWN] is gunCountdown)
+
+    def testLateTrackSkipsAhead(self):
+        audioManager = AudioManager(AUDIO_CLIPS, NullAudioSink())
+
+        audioManager.playClip(GUN_COUNTDOWN, monotonicSeconds() - 2)
+
+        self.assertEqual(audioManager.lateClipCount, 1)
+        self.assertTrue(audioManager.voices[0].position >= 2 * 44100 * 4)
+        self.assertTrue(audioManager.lastLatency < 0.1)
+
+
+if __name__ == "__main__":
+    unittest.main()
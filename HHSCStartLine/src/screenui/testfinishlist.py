@@ -0,0 +1,111 @@
+'''
+Created on 17 Oct 2026
+'''
+import unittest
+
+from screenui.finishlist import VirtualFinishList
+
+
+#
+# Keeps the items of a Treeview in a list, and counts the inserts and deletes
+#
+class ListTreeView:
+
+    def __init__(self, height):
+        self.height = height
+        self.itemIds = []
+        self.selectedIds = ()
+        self.insertCount = 0
+        self.deleteCount = 0
+
+    def cget(self, option):
+        return self.height
+
+    def bind(self, sequence, function):
+        pass
+
+    def insert(self, parent, index, iid, text, values):
+        self.itemIds.insert(index, iid)
+        self.insertCount = self.insertCount + 1
+
+    def delete(self, iid):
+        self.itemIds.remove(iid)
+        self.deleteCount = self.deleteCount + 1
+
+    def item(self, iid, text, values):
+        pass
+
+    def selection_set(self, iid):
+        self.selectedIds = (iid,)
+
+
+class RecordingScrollbar:
+
+    def configure(self, command):
+        self.command = command
+
+    def set(self, first, last):
+        self.first = first
+        self.last = last
+
+
+class FakeFinish:
+
+    def __init__(self, finishId):
+        self.finishId = finishId
+
+
+class VirtualFinishListTest(unittest.TestCase):
+
+    def setUp(self):
+        self.treeView = ListTreeView(5)
+        self.scrollbar = RecordingScrollbar()
+        self.finishList = VirtualFinishList(self.treeView, self.scrollbar, lambda finish: (finish.finishId, ()), 30)
+        self.finishes = [FakeFinish(str(i)) for i in range(1000)]
+
+    def appendFinish(self, finish):
+        self.finishes.append(finish)
+        self.finishList.finishAppended(finish)
+
+    def testRecoveryOnlyInsertsVisibleFinishes(self):
+        self.finishList.setFinishes(self.finishes)
+
+        self.assertEqual(self.treeView.itemIds, ["995", "996", "997", "998", "999"])
+        self.assertEqual(self.treeView.insertCount, 5)
+        self.assertEqual((self.scrollbar.first, self.scrollbar.last), (0.995, 1.0))
+
+    def testAppendIsOneInsertAndOneDelete(self):
+        self.finishList.setFinishes(self.finishes)
+        self.appendFinish(FakeFinish("1000"))
+
+        self.assertEqual(self.treeView.itemIds, ["996", "997", "998", "999", "1000"])
+        self.assertEqual((self.treeView.insertCount, self.treeView.deleteCount), (6, 1))
+
+    def testScrollingMovesTheWindow(self):
+        self.finishList.setFinishes(self.finishes)
+
+        self.scrollbar.command("scroll", -2, "units")
+        self.assertEqual(self.treeView.itemIds, ["993", "994", "995", "996", "997"])
+        self.scrollbar.command("moveto", 0.0)
+        self.assertEqual(self.treeView.itemIds, ["0", "1", "2", "3", "4"])
+
+        # while we are looking at earlier finishes, a new finish doesn't move the window
+        self.appendFinish(FakeFinish("1000"))
+        self.assertEqual(self.treeView.itemIds, ["0", "1", "2", "3", "4"])
+
+    def testSelectingAFinishScrollsToIt(self):
+        self.finishList.setFinishes(self.finishes)
+
+        self.finishList.selectFinish(self.finishes[500])
+        self.assertEqual(self.treeView.itemIds[0], "500")
+        self.assertEqual(self.treeView.selectedIds, ("500",))
+
+        # the selected finish is selected again when it scrolls back into view
+        self.scrollbar.command("moveto", 1.0)
+        self.treeView.selectedIds = ()
+        self.scrollbar.command("moveto", 0.5)
+        self.assertEqual(self.treeView.selectedIds, ("500",))
+
+
+if __name__ == "__main__":
+    unittest.main()
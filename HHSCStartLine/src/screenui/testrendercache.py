@@ -0,0 +1,66 @@
+'''
+Created on 17 Oct 2026
+'''
+import unittest
+
+from screenui.rendercache import RenderCache
+
+
+#
+# Records the calls that the render cache makes, in place of a Tk treeview and variable
+#
+class RecordingTreeView:
+
+    def __init__(self):
+        self.calls = []
+
+    def set(self, rowId, column, value):
+        self.calls.append((rowId, column, value))
+
+
+class RecordingVariable:
+
+    def __init__(self):
+        self.values = []
+
+    def set(self, value):
+        self.values.append(value)
+
+
+class RenderCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.renderCache = RenderCache()
+        self.treeView = RecordingTreeView()
+        self.columns = ["startTime", "startTimeSeconds", "status"]
+
+    def testOnlyChangedCellsAreSet(self):
+        self.renderCache.setCells(self.treeView, "1", self.columns, ["00:05:00", 300, "Starting"])
+        self.renderCache.setCells(self.treeView, "1", self.columns, ["00:04:59", 299, "Starting"])
+        self.renderCache.setCells(self.treeView, "1", self.columns, ["00:04:59", 299, "Starting"])
+
+        self.assertEqual(self.treeView.calls,
+                         [("1", "startTime", "00:05:00"), ("1", "startTimeSeconds", 300), ("1", "status", "Starting"),
+                          ("1", "startTime", "00:04:59"), ("1", "startTimeSeconds", 299)])
+        self.assertEqual(self.renderCache.unchangedCount, 4)
+
+    def testForgottenRowIsSetAgain(self):
+        self.renderCache.setCells(self.treeView, "1", self.columns, ["-", "-", "Pending"])
+        self.renderCache.setCells(self.treeView, "2", self.columns, ["-", "-", "Pending"])
+        self.renderCache.forgetRow(self.treeView, "1")
+        self.renderCache.setCells(self.treeView, "1", self.columns, ["-", "-", "Pending"])
+        self.renderCache.setCells(self.treeView, "2", self.columns, ["-", "-", "Pending"])
+
+        self.assertEqual(len(self.treeView.calls), 9)
+
+    def testVariableIsOnlySetWhenChanged(self):
+        variable = RecordingVariable()
+
+        for value in ["CONNECTED", "CONNECTED", "Warning: DISCONNECTED", "Warning: DISCONNECTED"]:
+            self.renderCache.setVariable(variable, value)
+
+        self.assertEqual(variable.values, ["CONNECTED", "Warning: DISCONNECTED"])
+
+
+if __name__ == "__main__":
+    unittest.main()
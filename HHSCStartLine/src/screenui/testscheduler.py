@@ -0,0 +1,71 @@
+'''
+Created on 17 Oct 2026
+'''
+import unittest
+import threading
+
+from screenui.scheduler import GunScheduler
+from model.utils import monotonicSeconds
+
+#
+# Records the clips queued by the gun scheduler, and when
+#
+class RecordingAudioManager:
+
+    def __init__(self):
+        self.playedClips = []
+        self.played = threading.Event()
+
+    def queueClip(self, clipName, targetSeconds=None):
+        self.playedClips.append((clipName, monotonicSeconds()))
+        self.played.set()
+
+
+class GunSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.audioManager = RecordingAudioManager()
+        self.gunScheduler = GunScheduler(self.audioManager)
+        self.schedulerThread = threading.Thread(target=self.gunScheduler.run)
+        self.schedulerThread.daemon = True
+        self.schedulerThread.start()
+
+    def tearDown(self):
+        self.gunScheduler.stop()
+        self.schedulerThread.join(1)
+
+    def testClipsPlayInTimeOrder(self):
+        startSeconds = monotonicSeconds()
+        self.gunScheduler.scheduleClip(200, "gun")
+        self.gunScheduler.scheduleClip(100, "warning")
+        while len(self.audioManager.playedClips) < 2:
+            self.audioManager.played.wait(1)
+            self.audioManager.played.clear()
+
+        self.assertEqual([clipName for (clipName, playedSeconds) in self.audioManager.playedClips],
+                         ["warning", "gun"])
+        self.assertTrue(self.audioManager.playedClips[1][1] - startSeconds >= 0.2)
+        self.assertEqual(self.gunScheduler.dispatchCount, 2)
+        self.assertTrue(self.gunScheduler.worstLateness < 0.05)
+
+    def testCancelledClipDoesNotPlay(self):
+        scheduleId = self.gunScheduler.scheduleClip(50, "gun")
+        self.gunScheduler.scheduleClip(150, "warning")
+        self.gunScheduler.cancel(scheduleId)
+        self.audioManager.played.wait(1)
+
+        self.assertEqual([clipName for (clipName, playedSeconds) in self.audioManager.playedClips],
+                         ["warning"])
+        self.assertEqual(self.gunScheduler.scheduledCount(), 0)
+
+    def testCancelAll(self):
+        self.gunScheduler.scheduleClip(20, "gun")
+        self.gunScheduler.scheduleClip(40, "gun")
+        self.gunScheduler.cancelAll()
+
+        self.assertFalse(self.audioManager.played.wait(0.2))
+        self.assertEqual(self.audioManager.playedClips, [])
+
+
+if __name__ == "__main__":
+    unittest.main()